@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 import logging
+from functools import lru_cache
 from datetime import datetime, timedelta
 
 from services.analytics_service import AnalyticsService
@@ -11,18 +12,44 @@ from models.analytics import (
     SearchTrend, 
     FeedbackDistribution,
     SearchStrategyDistribution,
-    TopQueries
+    TopQueries,
+    DashboardData
 )
+from utils.http_cache import cached_json_response, dump_json, CACHE_ANALYTICS
+from config import settings
 
 router = APIRouter()
 logger = logging.getLogger("retrieval")
 
-# 获取服务实例
-def get_analytics_service():
+# 获取服务实例（进程内单例，避免每个请求重复创建服务和数据库/缓存连接）
+@lru_cache(maxsize=1)
+def get_analytics_service() -> AnalyticsService:
     return AnalyticsService()
 
+@router.get("/dashboard", response_model=DashboardData)
+async def get_dashboard(
+    request: Request,
+    time_range: str = Query("week", description="时间范围: day, week, month, year"),
+    knowledge_base_id: Optional[str] = Query(None, description="知识库ID，不提供则查询所有知识库"),
+    top_queries_limit: int = Query(10, ge=1, le=1000, description="热门查询返回数量"),
+    user_behavior_limit: int = Query(100, ge=1, le=1000, description="用户行为记录返回数量"),
+    analytics_service: AnalyticsService = Depends(get_analytics_service)
+):
+    """获取分析仪表盘数据
+    
+    一次返回性能指标、搜索趋势、策略分布、反馈分布、热门查询和用户行为记录，
+    替代仪表盘并发调用多个接口
+    """
+    try:
+        result = await analytics_service.get_dashboard(time_range, knowledge_base_id, top_queries_limit, user_behavior_limit)
+        return cached_json_response(request, dump_json(result), CACHE_ANALYTICS)
+    except Exception as e:
+        logger.error("Get dashboard error: %s", e, exc_info=settings.DEBUG)
+        raise HTTPException(status_code=500, detail=f"获取仪表盘数据失败: {str(e)}")
+
 @router.get("/performance", response_model=PerformanceMetrics)
 async def get_performance_metrics(
+    request: Request,
     time_range: str = Query("week", description="时间范围: day, week, month, year"),
     knowledge_base_id: Optional[str] = Query(None, description="知识库ID，不提供则查询所有知识库"),
     analytics_service: AnalyticsService = Depends(get_analytics_service)
@@ -32,13 +59,15 @@ async def get_performance_metrics(
     返回指定时间范围内的检索性能指标，包括搜索量、平均响应时间、缓存命中率等
     """
     try:
-        return await analytics_service.get_performance_metrics(time_range, knowledge_base_id)
+        result = await analytics_service.get_performance_metrics(time_range, knowledge_base_id)
+        return cached_json_response(request, dump_json(result), CACHE_ANALYTICS)
     except Exception as e:
-        logger.error(f"Get performance metrics error: {str(e)}", exc_info=True)
+        logger.error("Get performance metrics error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取性能指标失败: {str(e)}")
 
 @router.get("/search-trends", response_model=SearchTrend)
 async def get_search_trends(
+    request: Request,
     time_range: str = Query("week", description="时间范围: day, week, month, year"),
     knowledge_base_id: Optional[str] = Query(None, description="知识库ID，不提供则查询所有知识库"),
     analytics_service: AnalyticsService = Depends(get_analytics_service)
@@ -48,13 +77,15 @@ async def get_search_trends(
     返回指定时间范围内的搜索量和响应时间趋势数据
     """
     try:
-        return await analytics_service.get_search_trends(time_range, knowledge_base_id)
+        result = await analytics_service.get_search_trends(time_range, knowledge_base_id)
+        return cached_json_response(request, dump_json(result), CACHE_ANALYTICS)
     except Exception as e:
-        logger.error(f"Get search trends error: {str(e)}", exc_info=True)
+        logger.error("Get search trends error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取搜索趋势失败: {str(e)}")
 
 @router.get("/search-strategies", response_model=SearchStrategyDistribution)
 async def get_search_strategy_distribution(
+    request: Request,
     time_range: str = Query("week", description="时间范围: day, week, month, year"),
     knowledge_base_id: Optional[str] = Query(None, description="知识库ID，不提供则查询所有知识库"),
     analytics_service: AnalyticsService = Depends(get_analytics_service)
@@ -64,13 +95,15 @@ async def get_search_strategy_distribution(
     返回指定时间范围内各检索策略的使用比例
     """
     try:
-        return await analytics_service.get_search_strategy_distribution(time_range, knowledge_base_id)
+        result = await analytics_service.get_search_strategy_distribution(time_range, knowledge_base_id)
+        return cached_json_response(request, dump_json(result), CACHE_ANALYTICS)
     except Exception as e:
-        logger.error(f"Get search strategy distribution error: {str(e)}", exc_info=True)
+        logger.error("Get search strategy distribution error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取检索策略分布失败: {str(e)}")
 
 @router.get("/feedback", response_model=FeedbackDistribution)
 async def get_feedback_distribution(
+    request: Request,
     time_range: str = Query("week", description="时间范围: day, week, month, year"),
     knowledge_base_id: Optional[str] = Query(None, description="知识库ID，不提供则查询所有知识库"),
     analytics_service: AnalyticsService = Depends(get_analytics_service)
@@ -80,41 +113,46 @@ async def get_feedback_distribution(
     返回指定时间范围内用户反馈的分布情况
     """
     try:
-        return await analytics_service.get_feedback_distribution(time_range, knowledge_base_id)
+        result = await analytics_service.get_feedback_distribution(time_range, knowledge_base_id)
+        return cached_json_response(request, dump_json(result), CACHE_ANALYTICS)
     except Exception as e:
-        logger.error(f"Get feedback distribution error: {str(e)}", exc_info=True)
+        logger.error("Get feedback distribution error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取用户反馈分布失败: {str(e)}")
 
 @router.get("/top-queries", response_model=TopQueries)
 async def get_top_queries(
+    request: Request,
     time_range: str = Query("week", description="时间范围: day, week, month, year"),
-    limit: int = Query(10, description="返回结果数量"),
+    limit: int = Query(10, ge=1, le=1000, description="返回结果数量"),
     knowledge_base_id: Optional[str] = Query(None, description="知识库ID，不提供则查询所有知识库"),
     analytics_service: AnalyticsService = Depends(get_analytics_service)
 ):
     """获取热门查询
     
-    返回指定时间范围内的热门查询及其次数
+    返回指定时间范围内的热门查询及其次数，limit通过SQL LIMIT下推，一次查询返回全部行
     """
     try:
-        return await analytics_service.get_top_queries(time_range, limit, knowledge_base_id)
+        result = await analytics_service.get_top_queries(time_range, limit, knowledge_base_id)
+        return cached_json_response(request, dump_json(result), CACHE_ANALYTICS)
     except Exception as e:
-        logger.error(f"Get top queries error: {str(e)}", exc_info=True)
+        logger.error("Get top queries error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取热门查询失败: {str(e)}")
 
 @router.get("/user-behavior", response_model=List[UserBehaviorRecord])
 async def get_user_behavior(
+    request: Request,
     time_range: str = Query("day", description="时间范围: day, week, month"),
-    limit: int = Query(100, description="返回结果数量"),
+    limit: int = Query(100, ge=1, le=1000, description="返回结果数量"),
     knowledge_base_id: Optional[str] = Query(None, description="知识库ID，不提供则查询所有知识库"),
     analytics_service: AnalyticsService = Depends(get_analytics_service)
 ):
     """获取用户行为记录
     
-    返回指定时间范围内的用户搜索和反馈行为记录
+    返回指定时间范围内的用户搜索和反馈行为记录，limit通过SQL LIMIT下推，一次查询返回全部行
     """
     try:
-        return await analytics_service.get_user_behavior(time_range, limit, knowledge_base_id)
+        result = await analytics_service.get_user_behavior(time_range, limit, knowledge_base_id)
+        return cached_json_response(request, dump_json(result), CACHE_ANALYTICS)
     except Exception as e:
-        logger.error(f"Get user behavior error: {str(e)}", exc_info=True)
+        logger.error("Get user behavior error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取用户行为记录失败: {str(e)}")
\ No newline at end of file
@@ -1,23 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request, BackgroundTasks
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 import logging
+from types import MappingProxyType
+from functools import lru_cache
 from datetime import datetime
+import orjson
 
 from services.feedback_service import FeedbackService
+from api.analytics import get_analytics_service
+from api.search import get_cache_service
 from models.feedback import FeedbackRequest, FeedbackResponse, DetailedFeedbackRequest
+from utils.http_cache import cached_json_response, make_etag, CACHE_CONSTANT
 from utils.metrics import record_feedback_metrics
+from config import settings
 
 router = APIRouter()
 logger = logging.getLogger("retrieval")
 
-# 获取服务实例
-def get_feedback_service():
-    return FeedbackService()
+# 可用的反馈类型（常量，模块加载时预先序列化，以只读视图暴露，避免被意外修改）
+FEEDBACK_TYPES = MappingProxyType({
+    "relevant": "相关且有帮助",
+    "partially": "部分相关",
+    "irrelevant": "不相关",
+    "outdated": "信息过时",
+    "incomplete": "信息不完整",
+    "other": "其他问题"
+})
+_FEEDBACK_TYPES_JSON = orjson.dumps(dict(FEEDBACK_TYPES))
+_FEEDBACK_TYPES_ETAG = make_etag(_FEEDBACK_TYPES_JSON)
+
+# 获取服务实例（进程内单例，避免每个请求重复创建服务和数据库/缓存连接）
+@lru_cache(maxsize=1)
+def get_feedback_service() -> FeedbackService:
+    return FeedbackService(analytics_service=get_analytics_service(), cache_service=get_cache_service())
 
 @router.post("/", response_model=FeedbackResponse)
 async def submit_feedback(
     request: FeedbackRequest,
+    background_tasks: BackgroundTasks,
     feedback_service: FeedbackService = Depends(get_feedback_service)
 ):
     """提交搜索结果反馈
@@ -28,11 +49,13 @@ async def submit_feedback(
         result = await feedback_service.save_feedback(
             result_id=request.result_id,
             feedback_type=request.feedback_type,
-            user_id=request.user_id
+            user_id=request.user_id,
+            search_id=request.search_id
         )
         
-        # 记录反馈指标
-        record_feedback_metrics(
+        # 记录反馈指标（响应发送后在后台执行）
+        background_tasks.add_task(
+            record_feedback_metrics,
             result_id=request.result_id,
             feedback_type=request.feedback_type,
             user_id=request.user_id
@@ -45,12 +68,13 @@ async def submit_feedback(
         )
         
     except Exception as e:
-        logger.error(f"Feedback error: {str(e)}", exc_info=True)
+        logger.error("Feedback error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"保存反馈失败: {str(e)}")
 
 @router.post("/detailed", response_model=FeedbackResponse)
 async def submit_detailed_feedback(
     request: DetailedFeedbackRequest,
+    background_tasks: BackgroundTasks,
     feedback_service: FeedbackService = Depends(get_feedback_service)
 ):
     """提交详细反馈
@@ -63,16 +87,17 @@ async def submit_detailed_feedback(
             rating=request.rating,
             feedback_type=request.feedback_type,
             comment=request.comment,
-            user_id=request.user_id
+            user_id=request.user_id,
+            search_id=request.search_id
         )
         
-        # 记录反馈指标
-        record_feedback_metrics(
+        # 记录反馈指标（响应发送后在后台执行）
+        background_tasks.add_task(
+            record_feedback_metrics,
             result_id=request.result_id,
             feedback_type=request.feedback_type,
             user_id=request.user_id,
-            rating=request.rating,
-            has_comment=bool(request.comment)
+            details={"rating": request.rating, "has_comment": bool(request.comment)}
         )
         
         return FeedbackResponse(
@@ -82,17 +107,10 @@ async def submit_detailed_feedback(
         )
         
     except Exception as e:
-        logger.error(f"Detailed feedback error: {str(e)}", exc_info=True)
+        logger.error("Detailed feedback error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"保存详细反馈失败: {str(e)}")
 
 @router.get("/types", response_model=Dict[str, str])
-async def get_feedback_types():
+async def get_feedback_types(request: Request):
     """获取可用的反馈类型"""
-    return {
-        "relevant": "相关且有帮助",
-        "partially": "部分相关",
-        "irrelevant": "不相关",
-        "outdated": "信息过时",
-        "incomplete": "信息不完整",
-        "other": "其他问题"
-    }
\ No newline at end of file
+    return cached_json_response(request, _FEEDBACK_TYPES_JSON, CACHE_CONSTANT, etag=_FEEDBACK_TYPES_ETAG)
\ No newline at end of file
@@ -1,17 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from typing import List, Optional, Dict, Any, AsyncIterator
 from pydantic import BaseModel, Field
 import logging
+from functools import lru_cache
 from datetime import datetime
 
 from services.knowledge_base_service import KnowledgeBaseService
-from models.knowledge_base import KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate, Document
+from models.knowledge_base import (
+    KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate, Document,
+    KnowledgeBaseListAdapter, DocumentListAdapter
+)
+from utils.http_cache import ORJSONModelResponse
+from config import settings
 
 router = APIRouter()
 logger = logging.getLogger("retrieval")
 
-# 获取服务实例
-def get_kb_service():
+# 上传文件的分块读取大小（1MB）
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+async def _iter_upload(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """分块读取上传文件，避免一次性将整个文件读入内存"""
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+# 获取服务实例（进程内单例，避免每个请求重复创建服务和数据库/缓存连接）
+@lru_cache(maxsize=1)
+def get_kb_service() -> KnowledgeBaseService:
     return KnowledgeBaseService()
 
 @router.get("/", response_model=List[KnowledgeBase])
@@ -20,9 +35,10 @@ async def get_knowledge_bases(
 ):
     """获取所有知识库"""
     try:
-        return await kb_service.get_all_knowledge_bases()
+        knowledge_bases = await kb_service.get_all_knowledge_bases()
+        return Response(content=KnowledgeBaseListAdapter.dump_json(knowledge_bases), media_type="application/json")
     except Exception as e:
-        logger.error(f"Get knowledge bases error: {str(e)}", exc_info=True)
+        logger.error("Get knowledge bases error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取知识库失败: {str(e)}")
 
 @router.get("/{kb_id}", response_model=KnowledgeBase)
@@ -35,11 +51,11 @@ async def get_knowledge_base(
         kb = await kb_service.get_knowledge_base(kb_id)
         if not kb:
             raise HTTPException(status_code=404, detail=f"知识库 {kb_id} 不存在")
-        return kb
+        return ORJSONModelResponse(kb)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Get knowledge base error: {str(e)}", exc_info=True)
+        logger.error("Get knowledge base error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取知识库失败: {str(e)}")
 
 @router.post("/", response_model=KnowledgeBase)
@@ -49,9 +65,9 @@ async def create_knowledge_base(
 ):
     """创建新知识库"""
     try:
-        return await kb_service.create_knowledge_base(kb_create)
+        return ORJSONModelResponse(await kb_service.create_knowledge_base(kb_create))
     except Exception as e:
-        logger.error(f"Create knowledge base error: {str(e)}", exc_info=True)
+        logger.error("Create knowledge base error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"创建知识库失败: {str(e)}")
 
 @router.put("/{kb_id}", response_model=KnowledgeBase)
@@ -65,11 +81,11 @@ async def update_knowledge_base(
         kb = await kb_service.update_knowledge_base(kb_id, kb_update)
         if not kb:
             raise HTTPException(status_code=404, detail=f"知识库 {kb_id} 不存在")
-        return kb
+        return ORJSONModelResponse(kb)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Update knowledge base error: {str(e)}", exc_info=True)
+        logger.error("Update knowledge base error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"更新知识库失败: {str(e)}")
 
 @router.delete("/{kb_id}", response_model=Dict[str, Any])
@@ -86,7 +102,7 @@ async def delete_knowledge_base(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Delete knowledge base error: {str(e)}", exc_info=True)
+        logger.error("Delete knowledge base error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"删除知识库失败: {str(e)}")
 
 @router.post("/{kb_id}/documents", response_model=Document)
@@ -102,11 +118,10 @@ async def upload_document(
         if not document_name:
             document_name = file.filename
             
-        content = await file.read()
-        document = await kb_service.add_document(kb_id, document_name, content, file.content_type)
-        return document
+        document = await kb_service.add_document(kb_id, document_name, _iter_upload(file), file.content_type)
+        return ORJSONModelResponse(document)
     except Exception as e:
-        logger.error(f"Upload document error: {str(e)}", exc_info=True)
+        logger.error("Upload document error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"上传文档失败: {str(e)}")
 
 @router.get("/{kb_id}/documents", response_model=List[Document])
@@ -116,9 +131,10 @@ async def get_documents(
 ):
     """获取知识库中的所有文档"""
     try:
-        return await kb_service.get_documents(kb_id)
+        documents = await kb_service.get_documents(kb_id)
+        return Response(content=DocumentListAdapter.dump_json(documents), media_type="application/json")
     except Exception as e:
-        logger.error(f"Get documents error: {str(e)}", exc_info=True)
+        logger.error("Get documents error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取文档失败: {str(e)}")
 
 @router.delete("/{kb_id}/documents/{document_id}", response_model=Dict[str, Any])
@@ -136,7 +152,7 @@ async def delete_document(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Delete document error: {str(e)}", exc_info=True)
+        logger.error("Delete document error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"删除文档失败: {str(e)}")
 
 @router.post("/{kb_id}/sync", response_model=Dict[str, Any])
@@ -154,5 +170,5 @@ async def sync_knowledge_base(
             "indexed_chunks": result.get("indexed_chunks", 0)
         }
     except Exception as e:
-        logger.error(f"Sync knowledge base error: {str(e)}", exc_info=True)
+        logger.error("Sync knowledge base error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"同步知识库失败: {str(e)}")
\ No newline at end of file
@@ -1,28 +1,71 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Response, Request, BackgroundTasks
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 import logging
-from datetime import datetime
+from types import MappingProxyType
+import hashlib
+from functools import lru_cache
+import time
+import orjson
+from cachetools import TTLCache
 
 from services.search_service import SearchService
 from services.cache_service import CacheService
-from models.search import SearchRequest, SearchResponse, SearchResult
+from api.analytics import get_analytics_service
+from models.search import SearchRequest, SearchResponse
+from utils.http_cache import cached_json_response, dump_json, make_etag, CACHE_CONSTANT
 from utils.metrics import record_search_metrics
+from utils.compression import compress_value, decompress_value
 from config import settings
 
 router = APIRouter()
 logger = logging.getLogger("retrieval")
 
-# 获取服务实例
-def get_search_service():
-    return SearchService()
+# 可用的检索策略（常量，模块加载时预先序列化，以只读视图暴露，避免被意外修改）
+SEARCH_STRATEGIES = MappingProxyType({
+    "auto": "智能选择",
+    "semantic": "语义检索",
+    "fulltext": "全文检索",
+    "hybrid": "混合检索"
+})
+_SEARCH_STRATEGIES_JSON = orjson.dumps(dict(SEARCH_STRATEGIES))
+_SEARCH_STRATEGIES_ETAG = make_etag(_SEARCH_STRATEGIES_JSON)
 
-def get_cache_service():
+def _build_cache_key(query: str, request: SearchRequest) -> str:
+    """根据查询和检索参数生成定长缓存键
+    
+    知识库ID排序后参与哈希，使仅顺序不同的请求命中同一缓存
+    """
+    key_material = orjson.dumps((
+        query,
+        request.strategy,
+        sorted(request.knowledge_base_ids),
+        request.semantic_weight,
+        request.fulltext_weight,
+        request.max_results,
+        request.min_score,
+        request.use_reranking,
+        request.use_clustering
+    ))
+    return "s:" + hashlib.blake2b(key_material, digest_size=16).hexdigest()
+
+# 进程内热点查询缓存（位于Redis之前），保存已序列化的响应体和结果数量
+_LOCAL_CACHE = TTLCache(maxsize=1024, ttl=max(1, min(60, settings.REDIS_CACHE_EXPIRE)))
+
+# 获取服务实例（进程内单例，避免每个请求重复创建服务和数据库/缓存连接）
+@lru_cache(maxsize=1)
+def get_search_service() -> SearchService:
+    return SearchService(analytics_service=get_analytics_service())
+
+@lru_cache(maxsize=1)
+def get_cache_service() -> CacheService:
     return CacheService()
 
-@router.post("/", response_model=SearchResponse)
+# 响应体由路由自行序列化，不再经过response_model二次校验；SearchResponse仅用于生成OpenAPI文档
+@router.post("/", response_model=None, responses={200: {"model": SearchResponse}})
 async def search(
     request: SearchRequest,
+    background_tasks: BackgroundTasks,
     search_service: SearchService = Depends(get_search_service),
     cache_service: CacheService = Depends(get_cache_service)
 ):
@@ -30,32 +73,48 @@ async def search(
     
     根据查询和参数执行知识库检索，支持多种检索策略和结果优化
     """
-    start_time = datetime.now()
+    start_time = time.perf_counter_ns()
     query = request.query.strip()
     
     if not query:
         raise HTTPException(status_code=400, detail="查询内容不能为空")
     
+    # 超长查询几乎不会重复，直接跳过缓存读写，减少Redis请求和无效键
+    should_cache = (
+        request.use_cache
+        and len(query) <= settings.SEARCH_CACHE_MAX_QUERY_LENGTH
+        and settings.REDIS_CACHE_EXPIRE > 0
+    )
+    
     # 尝试从缓存获取结果
-    if settings.REDIS_CACHE_EXPIRE > 0:
-        cache_key = f"search:{query}:{request.strategy}:{','.join(request.knowledge_base_ids)}"
-        cached_result = await cache_service.get(cache_key)
-        if cached_result:
-            logger.info(f"Cache hit for query: {query}")
-            # 记录指标
-            record_search_metrics(
+    if should_cache:
+        cache_key = _build_cache_key(query, request)
+        # 先查进程内缓存，未命中再查Redis
+        cached_entry = _LOCAL_CACHE.get(cache_key)
+        if cached_entry is None:
+            # Redis中保存的是已序列化的响应体和结果数量，命中时无需反序列化
+            cached_fields = await cache_service.get_hash(cache_key)
+            if cached_fields and b"body" in cached_fields:
+                cached_entry = (decompress_value(cached_fields[b"body"]), int(cached_fields.get(b"count", 0)))
+                _LOCAL_CACHE[cache_key] = cached_entry
+        if cached_entry is not None:
+            body, result_count = cached_entry
+            logger.info("Cache hit for query: %s", query)
+            # 记录指标（响应发送后在后台执行）
+            background_tasks.add_task(
+                record_search_metrics,
                 query=query,
                 strategy=request.strategy,
                 knowledge_base_ids=request.knowledge_base_ids,
-                result_count=len(cached_result.results),
-                response_time=(datetime.now() - start_time).total_seconds(),
+                result_count=result_count,
+                response_time=(time.perf_counter_ns() - start_time) / 1e9,
                 cache_hit=True
             )
-            return cached_result
+            return Response(content=body, media_type="application/json", headers={"X-Cache": "HIT"})
     
     # 执行检索
     try:
-        results = await search_service.search(
+        results, strategy_used, clusters = await search_service.search(
             query=query,
             knowledge_base_ids=request.knowledge_base_ids,
             strategy=request.strategy,
@@ -64,45 +123,45 @@ async def search(
             max_results=request.max_results,
             min_score=request.min_score,
             use_reranking=request.use_reranking,
-            use_clustering=request.use_clustering
+            use_clustering=request.use_clustering,
+            max_latency_ms=request.max_latency_ms
         )
         
-        # 构建响应
-        response = SearchResponse(
-            query=query,
-            results=results,
-            strategy_used=search_service.strategy_used,
-            total_found=len(results),
-            clusters=search_service.clusters if request.use_clustering else [],
-            response_time=(datetime.now() - start_time).total_seconds()
-        )
+        # 构建响应（字段与SearchResponse一致；结果是检索流水线内部的msgspec结构体，直接交给orjson序列化，
+        # 跳过Pydantic模型构建以及FastAPI的二次编码和校验）
+        response_time = (time.perf_counter_ns() - start_time) / 1e9
+        body = dump_json({
+            "query": query,
+            "results": results,
+            "strategy_used": strategy_used,
+            "total_found": len(results),
+            "clusters": clusters if request.use_clustering else [],
+            "response_time": response_time
+        })
         
         # 缓存结果
-        if settings.REDIS_CACHE_EXPIRE > 0:
-            await cache_service.set(cache_key, response, settings.REDIS_CACHE_EXPIRE)
+        if should_cache:
+            _LOCAL_CACHE[cache_key] = (body, len(results))
+            await cache_service.set_hash(cache_key, {"body": compress_value(body), "count": len(results)}, settings.REDIS_CACHE_EXPIRE)
         
-        # 记录指标
-        record_search_metrics(
+        # 记录指标（响应发送后在后台执行）
+        background_tasks.add_task(
+            record_search_metrics,
             query=query,
             strategy=request.strategy,
             knowledge_base_ids=request.knowledge_base_ids,
             result_count=len(results),
-            response_time=response.response_time,
+            response_time=response_time,
             cache_hit=False
         )
         
-        return response
+        return Response(content=body, media_type="application/json", headers={"X-Cache": "MISS"})
         
     except Exception as e:
-        logger.error(f"Search error: {str(e)}", exc_info=True)
+        logger.error("Search error: %s", e, exc_info=settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"检索失败: {str(e)}")
 
 @router.get("/strategies", response_model=Dict[str, str])
-async def get_search_strategies():
+async def get_search_strategies(request: Request):
     """获取可用的检索策略"""
-    return {
-        "auto": "智能选择",
-        "semantic": "语义检索",
-        "fulltext": "全文检索",
-        "hybrid": "混合检索"
-    }
\ No newline at end of file
+    return cached_json_response(request, _SEARCH_STRATEGIES_JSON, CACHE_CONSTANT, etag=_SEARCH_STRATEGIES_ETAG)
\ No newline at end of file
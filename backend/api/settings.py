@@ -1,85 +1,96 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 import logging
+from functools import lru_cache
 
 from services.settings_service import SettingsService
-from models.settings import RetrievalSettings, CacheSettings, CrossKbSettings
+from models.settings import RetrievalSettingsIn, CacheSettingsIn, CrossKbSettingsIn
+from utils.http_cache import ORJSONModelResponse
+from utils.http_cache import cached_json_response, dump_json, CACHE_REVALIDATE
+from config import settings as app_settings
 
 router = APIRouter()
 logger = logging.getLogger("retrieval")
 
-# 获取服务实例
-def get_settings_service():
+# 获取服务实例（进程内单例，避免每个请求重复创建服务和数据库/缓存连接）
+@lru_cache(maxsize=1)
+def get_settings_service() -> SettingsService:
     return SettingsService()
 
-@router.get("/retrieval", response_model=RetrievalSettings)
+@router.get("/retrieval", response_model=RetrievalSettingsIn)
 async def get_retrieval_settings(
+    request: Request,
     settings_service: SettingsService = Depends(get_settings_service)
 ):
     """获取检索设置"""
     try:
-        return await settings_service.get_retrieval_settings()
+        result = await settings_service.get_retrieval_settings()
+        return cached_json_response(request, dump_json(result), CACHE_REVALIDATE)
     except Exception as e:
-        logger.error(f"Get retrieval settings error: {str(e)}", exc_info=True)
+        logger.error("Get retrieval settings error: %s", e, exc_info=app_settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取检索设置失败: {str(e)}")
 
-@router.put("/retrieval", response_model=RetrievalSettings)
+@router.put("/retrieval", response_model=RetrievalSettingsIn)
 async def update_retrieval_settings(
-    settings: RetrievalSettings,
+    settings: RetrievalSettingsIn,
     settings_service: SettingsService = Depends(get_settings_service)
 ):
     """更新检索设置"""
     try:
-        return await settings_service.update_retrieval_settings(settings)
+        return ORJSONModelResponse(await settings_service.update_retrieval_settings(settings))
     except Exception as e:
-        logger.error(f"Update retrieval settings error: {str(e)}", exc_info=True)
+        logger.error("Update retrieval settings error: %s", e, exc_info=app_settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"更新检索设置失败: {str(e)}")
 
-@router.get("/cache", response_model=CacheSettings)
+@router.get("/cache", response_model=CacheSettingsIn)
 async def get_cache_settings(
+    request: Request,
     settings_service: SettingsService = Depends(get_settings_service)
 ):
     """获取缓存设置"""
     try:
-        return await settings_service.get_cache_settings()
+        result = await settings_service.get_cache_settings()
+        return cached_json_response(request, dump_json(result), CACHE_REVALIDATE)
     except Exception as e:
-        logger.error(f"Get cache settings error: {str(e)}", exc_info=True)
+        logger.error("Get cache settings error: %s", e, exc_info=app_settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取缓存设置失败: {str(e)}")
 
-@router.put("/cache", response_model=CacheSettings)
+@router.put("/cache", response_model=CacheSettingsIn)
 async def update_cache_settings(
-    settings: CacheSettings,
+    settings: CacheSettingsIn,
     settings_service: SettingsService = Depends(get_settings_service)
 ):
     """更新缓存设置"""
     try:
-        return await settings_service.update_cache_settings(settings)
+        return ORJSONModelResponse(await settings_service.update_cache_settings(settings))
     except Exception as e:
-        logger.error(f"Update cache settings error: {str(e)}", exc_info=True)
+        logger.error("Update cache settings error: %s", e, exc_info=app_settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"更新缓存设置失败: {str(e)}")
 
-@router.get("/cross-kb", response_model=CrossKbSettings)
+@router.get("/cross-kb", response_model=CrossKbSettingsIn)
 async def get_cross_kb_settings(
+    request: Request,
     settings_service: SettingsService = Depends(get_settings_service)
 ):
     """获取跨库检索设置"""
     try:
-        return await settings_service.get_cross_kb_settings()
+        result = await settings_service.get_cross_kb_settings()
+        return cached_json_response(request, dump_json(result), CACHE_REVALIDATE)
     except Exception as e:
-        logger.error(f"Get cross-kb settings error: {str(e)}", exc_info=True)
+        logger.error("Get cross-kb settings error: %s", e, exc_info=app_settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"获取跨库检索设置失败: {str(e)}")
 
-@router.put("/cross-kb", response_model=CrossKbSettings)
+@router.put("/cross-kb", response_model=CrossKbSettingsIn)
 async def update_cross_kb_settings(
-    settings: CrossKbSettings,
+    settings: CrossKbSettingsIn,
     settings_service: SettingsService = Depends(get_settings_service)
 ):
     """更新跨库检索设置"""
     try:
-        return await settings_service.update_cross_kb_settings(settings)
+        return ORJSONModelResponse(await settings_service.update_cross_kb_settings(settings))
     except Exception as e:
-        logger.error(f"Update cross-kb settings error: {str(e)}", exc_info=True)
+        logger.error("Update cross-kb settings error: %s", e, exc_info=app_settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"更新跨库检索设置失败: {str(e)}")
 
 @router.post("/reset", response_model=Dict[str, Any])
@@ -91,5 +102,5 @@ async def reset_settings(
         await settings_service.reset_settings()
         return {"success": True, "message": "所有设置已重置为默认值"}
     except Exception as e:
-        logger.error(f"Reset settings error: {str(e)}", exc_info=True)
+        logger.error("Reset settings error: %s", e, exc_info=app_settings.DEBUG)
         raise HTTPException(status_code=500, detail=f"重置设置失败: {str(e)}")
\ No newline at end of file
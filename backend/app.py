@@ -1,55 +1,156 @@
 from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 import uvicorn
+import asyncio
 import time
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 from datetime import datetime
 import logging
+import orjson
 
 # 导入自定义模块
 from api.router import api_router
-from utils.logger import setup_logger
+from api.analytics import get_analytics_service
+from api.feedback import get_feedback_service
+from api.knowledge_base import get_kb_service
+from api.search import get_search_service, get_cache_service
+from api.settings import get_settings_service
+from utils.logger import setup_logger, stop_logger
+from utils.http_cache import cached_json_response, make_etag, CACHE_REVALIDATE
 from config import settings
 
-# 设置日志
-setup_logger()
+# 设置日志（通过队列由后台线程写入控制台和日志文件）
+setup_logger(level=settings.LOG_LEVEL, log_file=settings.LOG_FILE)
 logger = logging.getLogger("retrieval")
 
+# uvicorn日志交由根日志记录器的队列处理，访问日志同样不阻塞事件循环
+for uvicorn_logger_name in ("uvicorn", "uvicorn.access"):
+    uvicorn_logger = logging.getLogger(uvicorn_logger_name)
+    uvicorn_logger.handlers.clear()
+    uvicorn_logger.propagate = True
+
 app = FastAPI(
     title="Dify Knowledge Retrieval API",
     description="Dify知识库检索增强与优化API",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=ORJSONResponse
 )
 
 # 添加CORS中间件
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # 在生产环境中应该设置为特定的前端域名
+    allow_origins=settings.CORS_ORIGINS,  # 显式列出前端域名，携带凭证时浏览器不接受"*"
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,  # 允许浏览器缓存预检结果一天
 )
 
+# 响应压缩中间件：优先使用Brotli（不支持的客户端回退到gzip），未安装brotli-asgi时使用gzip
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=1024, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=4)
+
 # 请求计时中间件
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
     response = await call_next(request)
-    process_time = time.time() - start_time
+    process_time = (time.perf_counter_ns() - start_time) / 1e9
     response.headers["X-Process-Time"] = str(process_time)
     # 记录请求信息到日志
     logger.info(
-        f"Request: {request.method} {request.url.path} | "
-        f"Client: {request.client.host} | "
-        f"Process Time: {process_time:.4f}s"
+        "Request: %s %s | Client: %s | Process Time: %.4fs",
+        request.method, request.url.path, request.client.host, process_time
     )
     return response
 
 # 包含API路由
 app.include_router(api_router, prefix="/api")
 
+# 服务单例工厂（与各路由的依赖项共享同一个实例）
+SERVICE_FACTORIES = {
+    "analytics_service": get_analytics_service,
+    "feedback_service": get_feedback_service,
+    "kb_service": get_kb_service,
+    "search_service": get_search_service,
+    "cache_service": get_cache_service,
+    "settings_service": get_settings_service,
+}
+
+@app.on_event("startup")
+async def init_services():
+    """启动时预先创建服务实例并挂载到app.state，避免首个请求承担建连开销"""
+    for name, factory in SERVICE_FACTORIES.items():
+        try:
+            setattr(app.state, name, factory())
+        except Exception as e:
+            # 创建失败时不缓存实例，后续请求会重新尝试创建
+            logger.error("Failed to initialize %s: %s", name, e, exc_info=settings.DEBUG)
+
+@app.on_event("startup")
+async def start_analytics_tasks():
+    """启动分析服务的后台任务：定时刷新搜索日志小时汇总表，定时批量写入缓冲的搜索日志"""
+    analytics_service = getattr(app.state, "analytics_service", None)
+    if analytics_service and analytics_service.pool:
+        await analytics_service.init_write_pool()
+        app.state.rollup_task = asyncio.create_task(analytics_service.run_rollup())
+        app.state.log_flush_task = asyncio.create_task(analytics_service.run_log_flush())
+
+@app.on_event("startup")
+async def open_feedback_pool():
+    """创建反馈服务的数据库连接池，启动批量写入反馈的后台任务"""
+    feedback_service = getattr(app.state, "feedback_service", None)
+    if feedback_service:
+        await feedback_service.init_pool()
+        if feedback_service.pool:
+            app.state.feedback_flush_task = asyncio.create_task(feedback_service.run_flush())
+
+# 预先序列化的OpenAPI文档（启动时生成一次）
+_openapi_json: Optional[bytes] = None
+_openapi_etag: Optional[str] = None
+
+@app.on_event("startup")
+async def build_openapi():
+    """启动时生成并序列化OpenAPI文档，避免首次访问文档时才构建全部模型的schema"""
+    global _openapi_json, _openapi_etag
+    _openapi_json = orjson.dumps(app.openapi())
+    _openapi_etag = make_etag(_openapi_json)
+
+# 以预先序列化的字节替换FastAPI默认的OpenAPI路由（默认路由每次请求都会重新序列化整个文档）
+app.router.routes = [route for route in app.router.routes if getattr(route, "path", None) != app.openapi_url]
+
+@app.get(app.openapi_url, include_in_schema=False)
+async def openapi_json(request: Request):
+    return cached_json_response(request, _openapi_json, CACHE_REVALIDATE, etag=_openapi_etag)
+
+@app.on_event("shutdown")
+async def close_services():
+    """关闭时停止后台任务并释放服务持有的连接"""
+    for task_name in ("rollup_task", "log_flush_task", "feedback_flush_task"):
+        task = getattr(app.state, task_name, None)
+        if task:
+            task.cancel()
+    # 写入缓冲区中剩余的搜索日志
+    analytics_service = getattr(app.state, "analytics_service", None)
+    if analytics_service and analytics_service.pool:
+        await analytics_service.flush_search_logs()
+        await analytics_service.close()
+    feedback_service = getattr(app.state, "feedback_service", None)
+    if feedback_service and feedback_service.pool:
+        await feedback_service.flush_feedbacks()
+        await feedback_service.close()
+    cache_service = getattr(app.state, "cache_service", None)
+    if cache_service:
+        await cache_service.close()
+    # 写出队列中剩余的日志
+    stop_logger()
+
 # 健康检查端点
 @app.get("/health")
 async def health_check():
@@ -58,11 +159,33 @@ async def health_check():
 # 错误处理
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Global exception: {exc}", exc_info=True)
+    # 未处理的异常较少见，始终记录完整堆栈
+    logger.error("Global exception: %s", exc, exc_info=exc)
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error", "message": str(exc)}
     )
 
 if __name__ == "__main__":
-    uvicorn.run("app:app", host=settings.HOST, port=settings.PORT, reload=True)
\ No newline at end of file
+    # Linux下优先使用uvloop事件循环和httptools解析器，未安装时（如Windows）回退到uvicorn默认实现
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "auto"
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "auto"
+    
+    # 热重载仅用于开发环境，且与多进程互斥
+    uvicorn.run(
+        "app:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        reload=settings.DEBUG,
+        workers=1 if settings.DEBUG else settings.WORKERS,
+        loop=loop,
+        http=http
+    )
\ No newline at end of file
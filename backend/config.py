@@ -1,6 +1,7 @@
 import os
 from typing import Dict, List, Optional, Union
-from pydantic import BaseSettings, Field
+from pydantic import Field, ValidationInfo, field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     # 应用设置
@@ -8,6 +9,8 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     DEBUG: bool = True
+    WORKERS: int = os.cpu_count() or 1  # 工作进程数，DEBUG（热重载）模式下固定为1
+    CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://127.0.0.1:3000"]  # 允许跨域访问的前端地址
     
     # 数据库设置
     POSTGRES_USER: str = "postgres"
@@ -15,7 +18,7 @@ class Settings(BaseSettings):
     POSTGRES_HOST: str = "localhost"
     POSTGRES_PORT: int = 5432
     POSTGRES_DB: str = "dify_retrieval"
-    DATABASE_URL: Optional[str] = None
+    DATABASE_URL: Optional[str] = Field(None, validate_default=True)
     
     # Milvus设置
     MILVUS_HOST: str = "localhost"
@@ -29,16 +32,23 @@ class Settings(BaseSettings):
     REDIS_DB: int = 0
     REDIS_PASSWORD: Optional[str] = None
     REDIS_CACHE_EXPIRE: int = 3600  # 缓存过期时间（秒）
+    SEARCH_CACHE_MAX_QUERY_LENGTH: int = 256  # 超过该长度的查询不缓存（字符数）
     
     # 检索设置
     DEFAULT_SEARCH_STRATEGY: str = "auto"  # auto, semantic, fulltext, hybrid
     MAX_RESULTS: int = 10
     MIN_SCORE: float = 0.7
-    SEMANTIC_WEIGHT: float = 0.7
-    FULLTEXT_WEIGHT: float = 0.3
+    SEMANTIC_WEIGHT: float = 0.9
+    FULLTEXT_WEIGHT: float = 0.1
     USE_RERANKING: bool = True
     USE_CLUSTERING: bool = True
     CLUSTER_THRESHOLD: float = 0.8
+    SEARCH_TIMEOUT_MS: int = 5000  # 单次检索的默认截止时间（毫秒），超时的知识库将被取消
+    
+    # 分析设置
+    ANALYTICS_ROLLUP_INTERVAL: int = 300  # 搜索日志小时汇总表的刷新间隔（秒）
+    ANALYTICS_TIMESCALEDB: bool = False  # 按时间范围聚合的查询改读TimescaleDB超表（需安装timescaledb扩展）
+    ANALYTICS_PARTITIONED: bool = False  # 按时间范围聚合的查询改读按月分区的搜索日志副本表（未使用TimescaleDB时）
     
     # 日志设置
     LOG_LEVEL: str = "INFO"
@@ -49,15 +59,19 @@ class Settings(BaseSettings):
     CHILD_BLOCK_SIZE: int = 200    # 子块大小（字符数）
     BLOCK_OVERLAP: int = 50        # 块重叠大小（字符数）
     
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        
-        # 构建数据库URL
-        if not self.DATABASE_URL:
-            self.DATABASE_URL = f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
-
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        frozen=True
+    )
+    
+    @field_validator("DATABASE_URL")
+    @classmethod
+    def assemble_database_url(cls, v: Optional[str], info: ValidationInfo) -> str:
+        """未显式配置时根据PostgreSQL设置构建数据库URL"""
+        if v:
+            return v
+        values = info.data
+        return f"postgresql://{values['POSTGRES_USER']}:{values['POSTGRES_PASSWORD']}@{values['POSTGRES_HOST']}:{values['POSTGRES_PORT']}/{values['POSTGRES_DB']}"
 
 settings = Settings()
\ No newline at end of file
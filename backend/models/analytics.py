@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -71,4 +71,18 @@ class UserBehaviorRecord(BaseModel):
     knowledge_base_ids: List[str] = Field(..., description="查询的知识库ID列表")
     result_count: int = Field(..., description="结果数量")
     feedback: Optional[str] = Field(None, description="反馈类型")
-    timestamp: datetime = Field(..., description="时间戳")
\ No newline at end of file
+    timestamp: datetime = Field(..., description="时间戳")
+
+class DashboardData(BaseModel):
+    """分析仪表盘聚合数据模型"""
+    performance: PerformanceMetrics = Field(..., description="性能指标")
+    search_trends: SearchTrend = Field(..., description="搜索趋势")
+    search_strategies: SearchStrategyDistribution = Field(..., description="检索策略分布")
+    feedback: FeedbackDistribution = Field(..., description="用户反馈分布")
+    top_queries: TopQueries = Field(..., description="热门查询")
+    user_behavior: List[UserBehaviorRecord] = Field(..., description="用户行为记录")
+    time_range: str = Field(..., description="时间范围")
+    knowledge_base_id: Optional[str] = Field(None, description="知识库ID")
+
+# 用户行为记录列表的校验/序列化器（模块加载时构建一次，缓存读写直接在JSON字节和模型列表间转换）
+UserBehaviorListAdapter = TypeAdapter(List[UserBehaviorRecord])
@@ -0,0 +1,30 @@
+from pydantic import BaseModel, ConfigDict
+from typing import Any, Type, TypeVar
+
+T = TypeVar("T", bound="TrustedModel")
+
+class TrustedModel(BaseModel):
+    """可由内部可信数据直接构建的模型基类"""
+
+    # 显式固定开销较低的配置：多余字段直接忽略，赋值时不做校验，导入时即构建校验器和序列化器
+    # 服务内部会就地更新分数、聚类、状态等字段，因此不设置frozen
+    model_config = ConfigDict(extra="ignore", validate_assignment=False, defer_build=False)
+
+    @classmethod
+    def unsafe_new(cls: Type[T], **data: Any) -> T:
+        """跳过校验直接构建实例
+
+        仅用于数据来自本服务数据库、向量库等可信来源的场景，用户输入必须走正常校验。
+        只有非空字段记为已设置，按exclude_unset导出时只需处理实际有值的字段
+        """
+        fields_set = {name for name, value in data.items() if value is not None}
+        return cls.model_construct(_fields_set=fields_set, **data)
+
+class LazyModel(BaseModel):
+    """按需构建的模型基类
+
+    用于创建、更新等请求体模型：这类模型与完整模型字段高度重复，只在对应接口被调用时才用到，
+    推迟到首次校验时再构建校验器，缩短导入和冷启动时间
+    """
+
+    model_config = ConfigDict(defer_build=True)
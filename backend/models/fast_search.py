@@ -0,0 +1,21 @@
+from typing import Any, Optional
+from datetime import datetime
+
+import msgspec
+
+class FastSearchResult(msgspec.Struct, kw_only=True):
+    """检索流水线内部使用的搜索结果
+
+    字段与SearchResult一致。检索、重排序、聚类过程中会创建和修改大量结果对象，
+    使用基于C实现slots的msgspec.Struct，创建开销和内存占用都远低于Pydantic模型；
+    对外接口的文档仍以Pydantic的SearchResult为准
+    """
+    id: str
+    title: str
+    content: str
+    source: str
+    document_id: str
+    score: float
+    timestamp: datetime
+    cluster: Optional[str] = None
+    metadata: Any = None
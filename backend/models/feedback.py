@@ -2,11 +2,16 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
+# 正面/负面反馈类型（反馈统计和分析统计共用）。"other"在反馈类型中表示"其他问题"，计为负面反馈
+POSITIVE_FEEDBACK_TYPES = ("like", "relevant", "partially")
+NEGATIVE_FEEDBACK_TYPES = ("dislike", "irrelevant", "outdated", "incomplete", "other")
+
 class FeedbackRequest(BaseModel):
     """反馈请求模型"""
     result_id: str = Field(..., description="搜索结果ID")
     feedback_type: str = Field(..., description="反馈类型: like, dislike")
     user_id: Optional[str] = Field(None, description="用户ID")
+    search_id: Optional[str] = Field(None, description="搜索ID（搜索日志ID），提供时记录到反馈分析日志")
 
 class DetailedFeedbackRequest(BaseModel):
     """详细反馈请求模型"""
@@ -15,6 +20,7 @@ class DetailedFeedbackRequest(BaseModel):
     feedback_type: str = Field(..., description="反馈类型: relevant, partially, irrelevant, outdated, incomplete, other")
     comment: Optional[str] = Field(None, description="评论")
     user_id: Optional[str] = Field(None, description="用户ID")
+    search_id: Optional[str] = Field(None, description="搜索ID（搜索日志ID），提供时记录到反馈分析日志")
 
 class FeedbackResponse(BaseModel):
     """反馈响应模型"""
@@ -1,34 +1,47 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import Field, TypeAdapter
+from typing import List, Optional, Literal, Union
 from datetime import datetime
+# Python 3.12以下Pydantic要求使用typing_extensions中的TypedDict
+from typing_extensions import Annotated, TypedDict
 
-class KnowledgeBaseCreate(BaseModel):
+from models.base import TrustedModel, LazyModel
+
+# 枚举型字段的取值
+KnowledgeBaseStatus = Literal["active", "inactive"]
+DocumentStatus = Literal["processing", "processed", "failed"]
+
+class ChunkMetadata(TypedDict, total=False):
+    """分块元数据（结构固定，按TypedDict校验，不再逐项校验任意字典）"""
+    index: int          # 在父块（或文档）中的序号
+    parent_index: int   # 子块所属父块的序号
+
+class KnowledgeBaseCreate(LazyModel):
     """知识库创建模型"""
     name: str = Field(..., description="知识库名称")
     description: Optional[str] = Field(None, description="知识库描述")
 
-class KnowledgeBaseUpdate(BaseModel):
+class KnowledgeBaseUpdate(LazyModel):
     """知识库更新模型"""
     name: Optional[str] = Field(None, description="知识库名称")
     description: Optional[str] = Field(None, description="知识库描述")
-    status: Optional[str] = Field(None, description="知识库状态: active, inactive")
+    status: Optional[KnowledgeBaseStatus] = Field(None, description="知识库状态: active, inactive")
 
-class KnowledgeBase(BaseModel):
+class KnowledgeBase(TrustedModel):
     """知识库模型"""
     id: str = Field(..., description="知识库ID")
     name: str = Field(..., description="知识库名称")
     description: Optional[str] = Field(None, description="知识库描述")
     document_count: int = Field(0, description="文档数量")
     last_updated: Optional[datetime] = Field(None, description="最后更新时间")
-    status: str = Field("active", description="知识库状态: active, inactive")
+    status: KnowledgeBaseStatus = Field("active", description="知识库状态: active, inactive")
     created_at: datetime = Field(..., description="创建时间")
 
-class DocumentCreate(BaseModel):
+class DocumentCreate(LazyModel):
     """文档创建模型"""
     name: str = Field(..., description="文档名称")
     content_type: str = Field(..., description="内容类型")
 
-class Document(BaseModel):
+class Document(TrustedModel):
     """文档模型"""
     id: str = Field(..., description="文档ID")
     knowledge_base_id: str = Field(..., description="所属知识库ID")
@@ -36,19 +49,33 @@ class Document(BaseModel):
     content_type: str = Field(..., description="内容类型")
     size: int = Field(..., description="文档大小(字节)")
     chunk_count: int = Field(0, description="分块数量")
-    status: str = Field("processed", description="文档状态: processing, processed, failed")
+    status: DocumentStatus = Field("processed", description="文档状态: processing, processed, failed")
     error: Optional[str] = Field(None, description="处理错误信息")
     created_at: datetime = Field(..., description="创建时间")
     updated_at: Optional[datetime] = Field(None, description="更新时间")
 
-class Chunk(BaseModel):
-    """文档分块模型"""
+class ChunkBase(TrustedModel):
+    """文档分块公共字段"""
     id: str = Field(..., description="分块ID")
     document_id: str = Field(..., description="所属文档ID")
     knowledge_base_id: str = Field(..., description="所属知识库ID")
     content: str = Field(..., description="分块内容")
-    chunk_type: str = Field("child", description="分块类型: parent, child")
-    parent_id: Optional[str] = Field(None, description="父块ID")
-    metadata: Optional[Dict[str, Any]] = Field(None, description="元数据")
-    vector: Optional[List[float]] = Field(None, description="向量表示")
-    created_at: datetime = Field(..., description="创建时间")
\ No newline at end of file
+    metadata: Optional[ChunkMetadata] = Field(None, description="元数据")
+    vector_ref: Optional[str] = Field(None, description="向量引用（向量库中的记录ID），向量本身不随模型保存")
+    created_at: datetime = Field(..., description="创建时间")
+
+class ParentChunk(ChunkBase):
+    """父块模型"""
+    chunk_type: Literal["parent"] = Field("parent", description="分块类型")
+
+class ChildChunk(ChunkBase):
+    """子块模型"""
+    chunk_type: Literal["child"] = Field("child", description="分块类型")
+    parent_id: str = Field(..., description="父块ID")
+
+# 文档分块：按chunk_type区分的标签联合，校验时直接按标签选择分支
+Chunk = Annotated[Union[ParentChunk, ChildChunk], Field(discriminator="chunk_type")]
+
+# 列表类型的序列化器（模块加载时构建一次，避免每次调用重复构建schema）
+KnowledgeBaseListAdapter = TypeAdapter(List[KnowledgeBase])
+DocumentListAdapter = TypeAdapter(List[Document])
@@ -1,8 +1,14 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Discriminator, Field, Tag, model_validator
+from typing import List, Optional, Any, ClassVar, Literal, Union
+from typing_extensions import Annotated
 from datetime import datetime
 
-class SearchResult(BaseModel):
+from models.base import TrustedModel
+
+# 检索策略取值
+SearchStrategy = Literal["auto", "semantic", "fulltext", "hybrid"]
+
+class SearchResult(TrustedModel):
     """搜索结果模型"""
     id: str = Field(..., description="结果ID")
     title: str = Field(..., description="结果标题")
@@ -12,26 +18,73 @@ class SearchResult(BaseModel):
     score: float = Field(..., description="相关性评分")
     timestamp: datetime = Field(..., description="索引时间")
     cluster: Optional[str] = Field(None, description="聚类分组")
-    metadata: Optional[Dict[str, Any]] = Field(None, description="元数据")
+    # 元数据原样透传自向量库，结构不固定，声明为Any以跳过逐项校验
+    metadata: Any = Field(None, description="元数据")
 
 class ClusterInfo(BaseModel):
     """聚类信息模型"""
     name: str = Field(..., description="聚类名称")
     count: int = Field(..., description="包含结果数量")
 
-class SearchRequest(BaseModel):
-    """搜索请求模型"""
+class SearchRequestBase(BaseModel):
+    """搜索请求公共字段"""
     query: str = Field(..., description="搜索查询")
     knowledge_base_ids: List[str] = Field(..., description="要搜索的知识库ID列表")
-    strategy: str = Field("auto", description="检索策略: auto, semantic, fulltext, hybrid")
-    semantic_weight: float = Field(0.7, description="语义检索权重 (0-1)")
-    fulltext_weight: float = Field(0.3, description="全文检索权重 (0-1)")
     max_results: int = Field(10, description="最大结果数")
     min_score: float = Field(0.7, description="最小相关性分数 (0-1)")
     use_reranking: bool = Field(True, description="是否使用结果重排序")
     use_clustering: bool = Field(True, description="是否使用结果聚类")
+    use_cache: bool = Field(True, description="是否使用结果缓存")
+    max_latency_ms: Optional[int] = Field(None, ge=1, description="检索截止时间(毫秒)，为空时使用服务端默认值")
+
+class SemanticSearchRequest(SearchRequestBase):
+    """语义检索请求"""
+    strategy: Literal["semantic"] = Field("semantic", description="检索策略")
+    # 单一策略不使用混合权重，固定为类属性，不参与校验
+    semantic_weight: ClassVar[float] = 1.0
+    fulltext_weight: ClassVar[float] = 0.0
+
+class FulltextSearchRequest(SearchRequestBase):
+    """全文检索请求"""
+    strategy: Literal["fulltext"] = Field("fulltext", description="检索策略")
+    semantic_weight: ClassVar[float] = 0.0
+    fulltext_weight: ClassVar[float] = 1.0
+
+class HybridSearchRequest(SearchRequestBase):
+    """混合检索请求（智能选择可能选中混合检索，同样需要权重）
+    
+    两个权重之和必须为1，混合打分时直接加权求和，无需再做归一化
+    """
+    strategy: Literal["hybrid", "auto"] = Field("auto", description="检索策略: auto, hybrid")
+    semantic_weight: float = Field(0.9, ge=0, le=1, description="语义检索权重 (0-1)")
+    fulltext_weight: float = Field(0.1, ge=0, le=1, description="全文检索权重 (0-1)")
+    
+    @model_validator(mode="after")
+    def check_weights(self) -> "HybridSearchRequest":
+        """校验权重之和为1"""
+        if abs(self.semantic_weight + self.fulltext_weight - 1.0) > 1e-6:
+            raise ValueError("semantic_weight与fulltext_weight之和必须为1")
+        return self
+
+def _search_request_tag(value: Any) -> str:
+    """根据strategy选择请求模型，未指定时按智能选择处理"""
+    if isinstance(value, dict):
+        strategy = value.get("strategy", "auto")
+    else:
+        strategy = getattr(value, "strategy", "auto")
+    return strategy if strategy in ("semantic", "fulltext") else "hybrid"
+
+# 搜索请求：按strategy区分的标签联合，单一策略的请求不再校验混合权重字段
+SearchRequest = Annotated[
+    Union[
+        Annotated[SemanticSearchRequest, Tag("semantic")],
+        Annotated[FulltextSearchRequest, Tag("fulltext")],
+        Annotated[HybridSearchRequest, Tag("hybrid")]
+    ],
+    Discriminator(_search_request_tag)
+]
 
-class SearchResponse(BaseModel):
+class SearchResponse(TrustedModel):
     """搜索响应模型"""
     query: str = Field(..., description="搜索查询")
     results: List[SearchResult] = Field(..., description="搜索结果列表")
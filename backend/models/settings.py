@@ -1,10 +1,48 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
+from dataclasses import dataclass
 from datetime import datetime
 
-class RetrievalSettings(BaseModel):
+from models.search import SearchStrategy
+
+# 跨库结果合并策略取值
+MergeStrategy = Literal["interleave", "weighted", "separate"]
+
+# 设置在运行时只读，使用不可变的slots数据类保存；
+# 对应的Pydantic模型（*In）只在解析设置文件和PUT请求体时做一次校验
+
+@dataclass(frozen=True, slots=True)
+class RetrievalSettings:
+    """检索设置"""
+    default_strategy: SearchStrategy = "auto"
+    semantic_model: str = "default"
+    max_results: int = 10
+    min_score: float = 0.7
+    reranking: bool = True
+    reranking_model: str = "default"
+    clustering: bool = True
+    cluster_threshold: float = 0.8
+    updated_at: Optional[datetime] = None
+
+@dataclass(frozen=True, slots=True)
+class CacheSettings:
+    """缓存设置"""
+    enabled: bool = True
+    max_size: int = 500
+    ttl: int = 24
+    updated_at: Optional[datetime] = None
+
+@dataclass(frozen=True, slots=True)
+class CrossKbSettings:
+    """跨库检索设置"""
+    enabled: bool = True
+    max_knowledge_bases: int = 5
+    merge_strategy: MergeStrategy = "interleave"
+    updated_at: Optional[datetime] = None
+
+class RetrievalSettingsIn(BaseModel):
     """检索设置模型"""
-    default_strategy: str = Field("auto", description="默认检索策略: auto, semantic, fulltext, hybrid")
+    default_strategy: SearchStrategy = Field("auto", description="默认检索策略: auto, semantic, fulltext, hybrid")
     semantic_model: str = Field("default", description="语义模型")
     max_results: int = Field(10, description="最大结果数")
     min_score: float = Field(0.7, description="最小相关性分数 (0-1)")
@@ -14,16 +52,25 @@ class RetrievalSettings(BaseModel):
     cluster_threshold: float = Field(0.8, description="聚类相似度阈值 (0-1)")
     updated_at: Optional[datetime] = Field(None, description="更新时间")
 
-class CacheSettings(BaseModel):
+    def to_settings(self) -> RetrievalSettings:
+        return RetrievalSettings(**self.model_dump())
+
+class CacheSettingsIn(BaseModel):
     """缓存设置模型"""
     enabled: bool = Field(True, description="启用缓存")
     max_size: int = Field(500, description="缓存容量上限(条)")
     ttl: int = Field(24, description="缓存生存时间(小时)")
     updated_at: Optional[datetime] = Field(None, description="更新时间")
 
-class CrossKbSettings(BaseModel):
+    def to_settings(self) -> CacheSettings:
+        return CacheSettings(**self.model_dump())
+
+class CrossKbSettingsIn(BaseModel):
     """跨库检索设置模型"""
     enabled: bool = Field(True, description="启用跨库检索")
     max_knowledge_bases: int = Field(5, description="最大同时检索知识库数")
-    merge_strategy: str = Field("interleave", description="结果合并策略: interleave, weighted, separate")
-    updated_at: Optional[datetime] = Field(None, description="更新时间")
\ No newline at end of file
+    merge_strategy: MergeStrategy = Field("interleave", description="结果合并策略: interleave, weighted, separate")
+    updated_at: Optional[datetime] = Field(None, description="更新时间")
+
+    def to_settings(self) -> CrossKbSettings:
+        return CrossKbSettings(**self.model_dump())
@@ -1,13 +1,31 @@
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Union, Callable, Awaitable, Tuple
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 import asyncio
+import time
 import uuid
 import json
+import inspect
+import hashlib
+from functools import lru_cache, partial, wraps
+from contextlib import contextmanager
 
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import numpy as np
+import orjson
+import pandas as pd
+from psycopg2.extensions import connection as PGConnection
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import redis.asyncio as redis
+from pydantic import TypeAdapter
+
+# 日志写入优先使用asyncpg连接池（二进制协议、自动缓存预处理语句，不占用工作线程），
+# 未安装时仍使用psycopg2在工作线程中写入
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
 
 from models.analytics import (
     PerformanceMetrics, 
@@ -16,24 +34,319 @@ from models.analytics import (
     FeedbackDistribution,
     SearchStrategyDistribution,
     TopQueries,
-    TimeSeriesPoint
+    TimeSeriesPoint,
+    DashboardData,
+    UserBehaviorListAdapter
 )
+from models.feedback import POSITIVE_FEEDBACK_TYPES, NEGATIVE_FEEDBACK_TYPES
 from config import settings
+from utils.compression import compress_value, decompress_value
 
 logger = logging.getLogger("retrieval")
 
+# 分析结果缓存时间（秒）：超过CACHE_TTL后结果过期但仍可返回，由后台任务重新计算；
+# 缓存值本身保留CACHE_STALE_TTL，长期无人访问的结果才会被清除
+CACHE_TTL = 300
+CACHE_STALE_TTL = 86400
+# 后台重新计算的锁时间（秒），同一结果在此期间最多只有一个worker重新计算
+CACHE_REFRESH_LOCK_TTL = 30
+
+# 内存存储（数据库不可用时）的日志列，搜索日志的列顺序同时也是缓冲区中每行的字段顺序
+SEARCH_LOG_COLUMNS = ["id", "user_id", "query", "strategy", "response_time", "knowledge_base_ids", "result_count", "cache_hit", "timestamp"]
+FEEDBACK_LOG_COLUMNS = ["id", "search_id", "user_id", "feedback_type", "rating", "comment", "timestamp"]
+
+# 按时间范围聚合的查询读取的搜索日志表：开启TimescaleDB或分区时读取写入时同步复制的副本表
+# （TimescaleDB超表或按月分区的分区表），搜索日志表本身仍用于按id关联反馈
+USE_SEARCH_LOG_EVENTS = settings.ANALYTICS_TIMESCALEDB or settings.ANALYTICS_PARTITIONED
+SEARCH_LOG_SOURCE = "search_log_events" if USE_SEARCH_LOG_EVENTS else "search_logs"
+
+# 趋势中的平均响应时间（毫秒）保留的小数位数：完整的双精度小数在JSON中占17位左右，
+# 精确到10微秒已足够展示，缓存和响应体中的每个数据点明显变短
+RESPONSE_TIME_DECIMALS = 2
+
+# 确保日志表索引时持有的会话级咨询锁ID
+ENSURE_INDEXES_LOCK_ID = 7263001
+# 刷新小时汇总表时持有的事务级咨询锁ID，多个worker中同一时间只有一个刷新
+ROLLUP_LOCK_ID = 7263003
+# 只汇总结束超过ROLLUP_GRACE的整点小时：跨整点提交的日志写入和各主机间的时钟偏差都在此范围内
+ROLLUP_GRACE = timedelta(minutes=1)
+
+# 搜索日志先写入缓冲区，满LOG_FLUSH_BATCH_SIZE条或每隔LOG_FLUSH_INTERVAL秒批量写入一次
+LOG_FLUSH_BATCH_SIZE = 500
+LOG_FLUSH_INTERVAL = 1.0
+# 写入失败的搜索日志放回缓冲区，下次写入时重试；缓冲区最多保留MAX_BUFFERED_SEARCH_LOGS条，超出时丢弃最早的日志
+MAX_BUFFERED_SEARCH_LOGS = 50000
+
+# 由execute_values展开为多行VALUES，一条语句写入一批搜索日志
+_INSERT_SEARCH_LOG = """
+INSERT INTO search_logs 
+(id, user_id, query, strategy, response_time, knowledge_base_ids, result_count, cache_hit, timestamp) 
+VALUES %s
+"""
+# 同一条语句同时写入搜索日志表和超表，两者不会不一致
+INSERT_SEARCH_LOG_SQL = (
+    f"WITH s AS ({_INSERT_SEARCH_LOG} RETURNING *) INSERT INTO search_log_events SELECT * FROM s"
+    if USE_SEARCH_LOG_EVENTS else _INSERT_SEARCH_LOG
+)
+
+# 写入反馈日志的语句（$n占位符）：asyncpg自动缓存其预处理语句，
+# 使用psycopg2写入时在每个连接上PREPARE一次后以EXECUTE执行；搜索日志通过COPY或多行VALUES批量写入
+INSERT_FEEDBACK_LOG_SQL = """
+INSERT INTO feedback_logs 
+(id, search_id, user_id, feedback_type, rating, comment, timestamp) 
+VALUES ($1, $2, $3, $4, $5, $6, $7)
+"""
+
+# 分析查询的SQL：文本固定不随参数拼接，知识库过滤由kb_ids参数控制。
+# psycopg2在客户端代入参数，kb_ids为NULL时过滤条件在规划阶段即被常量折叠消除，
+# 不为NULL时@>条件仍可使用GIN索引
+_KB_FILTER = "(%(kb_ids)s::jsonb IS NULL OR knowledge_base_ids @> %(kb_ids)s::jsonb)"
+
+# 反馈按知识库过滤时才关联搜索日志（FOREIGN KEY保证非空的search_id存在）
+_FEEDBACK_KB_FILTER = """f.search_id IS NOT NULL AND (%(kb_ids)s::jsonb IS NULL OR EXISTS (
+    SELECT 1 FROM search_logs s WHERE s.id = f.search_id AND s.knowledge_base_ids @> %(kb_ids)s::jsonb
+))"""
+
+# 小时汇总表的状态（单行）：rolled_until为已汇总的截止时间（不含）；dirty_since为汇总之后才写入的、
+# 属于已结束小时的日志（写入稍晚、写入失败后重试或由其他worker稍后写入）中最早的时间，下次刷新时从该小时起重新汇总
+ROLLUP_STATE_TABLE = "search_logs_rollup_state"
+# 汇总表可用的截止时间：有待重新汇总的小时时截止到该小时之前，尚未汇总时为-infinity（全部读取明细表）
+_ROLLUP_END = f"""COALESCE((
+    SELECT LEAST(rolled_until, date_trunc('hour', dirty_since)) FROM {ROLLUP_STATE_TABLE}
+), '-infinity')"""
+# 写入的日志中有属于已结束小时的，在写入日志的同一事务中记录其最早时间（与刷新汇总表互斥于状态行的行锁）
+_MARK_ROLLUP_DIRTY = f"UPDATE {ROLLUP_STATE_TABLE} SET dirty_since = LEAST(dirty_since, {{}})"
+MARK_ROLLUP_DIRTY_SQL = _MARK_ROLLUP_DIRTY.format("$1")
+MARK_ROLLUP_DIRTY_PG_SQL = _MARK_ROLLUP_DIRTY.format("%s")
+# 搜索日志行中时间戳字段的位置
+_SEARCH_LOG_TIMESTAMP = SEARCH_LOG_COLUMNS.index("timestamp")
+
+# 按策略统计搜索量、响应时间总和和缓存命中数：汇总表覆盖的整点小时读取汇总行，
+# 首尾不足一小时的部分及汇总表尚未覆盖的部分读取明细表
+SEARCH_STATS_SQL = f"""
+SELECT strategy, SUM(count)::bigint as count, SUM(sum_rt) as sum_rt, SUM(cache_hits)::bigint as cache_hits
+FROM (
+    SELECT strategy, count, sum_rt, cache_hits
+    FROM search_logs_hourly
+    WHERE kb_id = %(kb_key)s AND bucket >= %(rollup_start)s AND bucket < {_ROLLUP_END}
+    UNION ALL
+    SELECT strategy, COUNT(*), SUM(response_time), COUNT(*) FILTER (WHERE cache_hit)
+    FROM {SEARCH_LOG_SOURCE}
+    WHERE timestamp >= %(start_time)s
+      AND (timestamp < %(rollup_start)s OR timestamp >= {_ROLLUP_END})
+      AND {_KB_FILTER}
+    GROUP BY strategy
+) stats
+GROUP BY strategy
+"""
+
+# 一次查询同时统计搜索指标和反馈指标（两个CTE共享一次解析、规划和网络往返）
+PERFORMANCE_METRICS_SQL = f"""
+WITH search_stats AS (
+    SELECT COALESCE(SUM(count), 0)::bigint as total_searches, 
+           SUM(sum_rt) / NULLIF(SUM(count), 0) as avg_response_time,
+           COALESCE(SUM(cache_hits), 0)::bigint as cache_hits
+    FROM ({SEARCH_STATS_SQL}) by_strategy
+),
+feedback_stats AS (
+    SELECT 
+        COUNT(*) as total_feedbacks,
+        COUNT(*) FILTER (WHERE f.feedback_type IN %(positive_types)s) as positive_feedbacks
+    FROM feedback_logs f
+    WHERE f.timestamp >= %(start_time)s AND {_FEEDBACK_KB_FILTER}
+)
+SELECT * FROM search_stats, feedback_stats
+"""
+
+# 一次查询统计所有时间间隔：间隔边界作为数组传入并展开，LEFT JOIN保证没有数据的间隔也返回一行（计数为0）
+SEARCH_TRENDS_SQL = f"""
+SELECT b.idx, COUNT(s.id) as count, AVG(s.response_time) as avg_time
+FROM unnest(%(interval_starts)s::timestamp[], %(interval_ends)s::timestamp[]) WITH ORDINALITY AS b(interval_start, interval_end, idx)
+LEFT JOIN {SEARCH_LOG_SOURCE} s
+  ON s.timestamp >= b.interval_start AND s.timestamp < b.interval_end AND {_KB_FILTER}
+GROUP BY b.idx ORDER BY b.idx
+"""
+
+# 各行的百分比由窗口聚合在SQL中计算（先做浮点除法再乘100，结果与Python计算一致）
+_PERCENTAGE = "COALESCE(count::float8 / NULLIF(SUM(count) OVER (), 0)::float8 * 100, 0) as percentage"
+
+# 策略分布和热门查询与用户行为记录一样由数据库直接组装为完整的结果JSON（字段与对应模型一致），
+# 以文本返回并由cached_result原样缓存；没有日志时不返回行
+STRATEGY_DISTRIBUTION_SQL = f"""
+SELECT json_build_object(
+    'strategies', json_agg(json_build_object('strategy', strategy, 'count', count, 'percentage', percentage) ORDER BY count DESC),
+    'time_range', %(time_range)s::text,
+    'knowledge_base_id', %(knowledge_base_id)s::text
+)::text
+FROM (
+    SELECT strategy, count, {_PERCENTAGE}
+    FROM ({SEARCH_STATS_SQL}) by_strategy
+) t
+HAVING COUNT(*) > 0
+"""
+
+# 各反馈类型次数及百分比，总数和正面/负面反馈数由窗口聚合一并返回在每一行中
+FEEDBACK_DISTRIBUTION_SQL = f"""
+SELECT feedback_type, count, {_PERCENTAGE}, total, positive_count, negative_count
+FROM (
+    SELECT f.feedback_type, COUNT(*) as count,
+           SUM(COUNT(*)) OVER ()::bigint as total,
+           COALESCE(SUM(COUNT(*)) FILTER (WHERE f.feedback_type IN %(positive_types)s) OVER (), 0)::bigint as positive_count,
+           COALESCE(SUM(COUNT(*)) FILTER (WHERE f.feedback_type IN %(negative_types)s) OVER (), 0)::bigint as negative_count
+    FROM feedback_logs f
+    WHERE f.timestamp >= %(start_time)s AND {_FEEDBACK_KB_FILTER}
+    GROUP BY f.feedback_type
+) by_type
+ORDER BY count DESC
+"""
+
+TOP_QUERIES_SQL = f"""
+SELECT json_build_object(
+    'queries', json_agg(json_build_object('query', query, 'count', count) ORDER BY count DESC),
+    'time_range', %(time_range)s::text,
+    'knowledge_base_id', %(knowledge_base_id)s::text
+)::text
+FROM (
+    SELECT query, COUNT(*) as count
+    FROM {SEARCH_LOG_SOURCE}
+    WHERE timestamp >= %(start_time)s AND {_KB_FILTER}
+    GROUP BY query ORDER BY count DESC LIMIT %(limit)s
+) t
+HAVING COUNT(*) > 0
+"""
+
+# 用户行为记录由数据库直接组装为JSON数组（字段与UserBehaviorRecord一致，响应时间已转换为毫秒），
+# 以文本返回，避免psycopg2逐行构建Python对象；没有记录时为NULL
+USER_BEHAVIOR_SQL = f"""
+SELECT json_agg(t ORDER BY t.timestamp DESC)::text
+FROM (
+    SELECT s.id, s.user_id, s.query, s.strategy, s.response_time * 1000 as response_time, 
+           s.knowledge_base_ids, s.result_count, s.timestamp,
+           f.feedback_type as feedback
+    FROM search_logs s
+    LEFT JOIN feedback_logs f ON s.id = f.search_id
+    WHERE s.timestamp >= %(start_time)s AND {_KB_FILTER}
+    ORDER BY s.timestamp DESC LIMIT %(limit)s
+) t
+"""
+
+@dataclass
+class CacheBatch:
+    """一次仪表盘请求内共享的缓存读写批次
+
+    读取时使用预先批量获取（MGET）的值，写入先暂存，最后通过管道一次提交
+    """
+    values: Dict[str, Optional[bytes]]
+    pending: Dict[str, Union[str, bytes]] = field(default_factory=dict)
+
+def _load_cached_user_behavior(data: bytes) -> List[UserBehaviorRecord]:
+    """从缓存值构建用户行为记录列表
+    
+    缓存值由本服务写入，字段已经校验过，用model_construct跳过逐条校验，只将时间戳字符串转换为datetime
+    """
+    records = []
+    for record in orjson.loads(data):
+        record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+        records.append(UserBehaviorRecord.model_construct(**record))
+    return records
+
+def cached_result(name: str, model: Any, mock: str, load: Optional[Callable[[bytes], Any]] = None):
+    """分析结果getter的缓存装饰器
+    
+    统一处理缓存键构建、缓存读取（含后台刷新）、结果解析与写回，以及出错时返回模拟数据。
+    被装饰的方法只负责计算，没有数据时返回None，由装饰器返回mock方法生成的模拟数据（不缓存）；
+    返回JSON文本时（如由数据库直接组装），解析一次后原样写入缓存，不再重新序列化。
+    装饰后的方法额外接受cache参数（仪表盘请求共享的CacheBatch）
+    
+    Args:
+        name: 缓存键前缀
+        model: 结果的模型类或TypeAdapter，用于解析和序列化缓存值
+        mock: 生成模拟数据的方法名，参数与被装饰的方法相同
+        load: 从缓存值构建结果的函数，默认用model完整校验解析
+    """
+    adapter = model if isinstance(model, TypeAdapter) else TypeAdapter(model)
+    load_cached = load or adapter.validate_json
+    
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        label = fn.__name__.replace("_", " ").capitalize()
+        
+        @wraps(fn)
+        async def wrapper(self, *args, cache: Optional[CacheBatch] = None, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            del params["self"]
+            
+            try:
+                # 尝试从缓存获取
+                cache_key = self._cache_key(name, params["time_range"], params["knowledge_base_id"], params.get("limit"))
+                cached_data = await self._cache_get(cache_key, cache, refresh=partial(wrapper, self, *args, **kwargs))
+                if cached_data:
+                    try:
+                        return load_cached(cached_data)
+                    except Exception as e:
+                        logger.warning("Failed to parse cached %s: %s", name, e)
+                
+                result = await fn(self, *args, **kwargs)
+                if result is None:
+                    # 如果没有数据，返回模拟数据
+                    return getattr(self, mock)(**params)
+                
+                if isinstance(result, (str, bytes)):
+                    raw, result = result, adapter.validate_json(result)
+                else:
+                    raw = adapter.dump_json(result)
+                
+                # 缓存结果
+                await self._cache_set(cache_key, raw, cache)
+                
+                return result
+                
+            except Exception as e:
+                logger.error("%s error: %s", label, e, exc_info=settings.DEBUG)
+                # 如果出错，返回模拟数据
+                return getattr(self, mock)(**params)
+        
+        return wrapper
+    return decorator
+
+class PreparingConnection(PGConnection):
+    """记录已在本连接上PREPARE过的语句名的psycopg2连接（预处理语句属于会话，每个连接各自准备一次）"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: Set[str] = set()
+
 class AnalyticsService:
     def __init__(self):
-        # 连接到PostgreSQL数据库
+        # 日志写入使用的asyncpg连接池，由应用启动时调用init_write_pool创建，未创建时使用psycopg2写入
+        self._write_pool = None
+        
+        # 待批量写入的搜索日志，写入时加锁，保证flush_search_logs返回时此前的日志都已提交
+        self._search_log_buffer: List[tuple] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        
+        # 正在后台重新计算的缓存键及其任务（保留任务引用，避免任务被垃圾回收）
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        
+        # 搜索日志副本表是否为按月分区的分区表（需由后台任务提前创建后续月份的分区）
+        self._log_partitioned = False
+        
+        # 连接到PostgreSQL数据库：psycopg2连接不能被多个线程同时使用，工作线程中的查询各自从连接池借用连接并行执行；
+        # 最大连接数与asyncio.to_thread默认线程池的线程数上限一致
         try:
-            self.conn = psycopg2.connect(
+            self.pool = ThreadedConnectionPool(
+                minconn=4,
+                maxconn=32,
                 dbname=settings.POSTGRES_DB,
                 user=settings.POSTGRES_USER,
                 password=settings.POSTGRES_PASSWORD,
                 host=settings.POSTGRES_HOST,
-                port=settings.POSTGRES_PORT
+                port=settings.POSTGRES_PORT,
+                connection_factory=PreparingConnection
             )
-            logger.info(f"Connected to PostgreSQL at {settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}")
+            logger.info("Connected to PostgreSQL at %s:%s", settings.POSTGRES_HOST, settings.POSTGRES_PORT)
             
             # 确保必要的表存在
             self._ensure_tables()
@@ -44,750 +357,947 @@ class AnalyticsService:
                 port=settings.REDIS_PORT,
                 db=settings.REDIS_DB,
                 password=settings.REDIS_PASSWORD,
-                decode_responses=True
+                decode_responses=False  # 缓存值为JSON字节，读取后直接交给Pydantic解析，无需先解码为str
             )
-            logger.info(f"Connected to Redis at {settings.REDIS_HOST}:{settings.REDIS_PORT}")
+            logger.info("Connected to Redis at %s:%s", settings.REDIS_HOST, settings.REDIS_PORT)
             
         except Exception as e:
-            logger.error(f"Database connection error: {str(e)}", exc_info=True)
+            logger.error("Database connection error: %s", e, exc_info=settings.DEBUG)
             # 如果连接失败，使用内存存储作为备用
-            self.conn = None
+            self.pool = None
             self.redis = None
+            # 新日志先追加到列表，读取时再批量合并到按列存储的DataFrame，统计由pandas向量化完成
             self.search_logs = []
             self.feedback_logs = []
+            self._search_logs_df = pd.DataFrame(columns=SEARCH_LOG_COLUMNS)
+            self._feedback_logs_df = pd.DataFrame(columns=FEEDBACK_LOG_COLUMNS)
+            # 知识库ID -> 引用该知识库的搜索日志在DataFrame中的行位置（递增），合并新日志时同步追加
+            self._search_log_kb_positions: Dict[str, List[int]] = {}
+    
+    @contextmanager
+    def _connection(self):
+        """从连接池借用连接，用完后归还；连接已断开时归还时将其关闭，连接池之后重新建立连接"""
+        conn = self.pool.getconn()
+        try:
+            yield conn
+        finally:
+            self.pool.putconn(conn, close=bool(conn.closed))
     
     def _ensure_tables(self):
         """确保必要的数据库表存在"""
+        with self._connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    # 创建搜索日志表
+                    cur.execute("""
+                    CREATE TABLE IF NOT EXISTS search_logs (
+                        id VARCHAR(36) PRIMARY KEY,
+                        user_id VARCHAR(36),
+                        query TEXT NOT NULL,
+                        strategy VARCHAR(20) NOT NULL,
+                        response_time FLOAT NOT NULL,
+                        knowledge_base_ids JSONB NOT NULL,
+                        result_count INTEGER NOT NULL,
+                        cache_hit BOOLEAN NOT NULL DEFAULT FALSE,
+                        timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """)
+                
+                    # 创建反馈日志表
+                    cur.execute("""
+                    CREATE TABLE IF NOT EXISTS feedback_logs (
+                        id VARCHAR(36) PRIMARY KEY,
+                        search_id VARCHAR(36) REFERENCES search_logs(id),
+                        user_id VARCHAR(36),
+                        feedback_type VARCHAR(20) NOT NULL,
+                        rating FLOAT,
+                        comment TEXT,
+                        timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """)
+
+                    # 创建搜索日志小时汇总表：按小时、知识库、策略预聚合，kb_id为'*'的行是不区分知识库的总计
+                    cur.execute("""
+                    CREATE TABLE IF NOT EXISTS search_logs_hourly (
+                        bucket TIMESTAMP NOT NULL,
+                        kb_id TEXT NOT NULL,
+                        strategy VARCHAR(20) NOT NULL,
+                        count BIGINT NOT NULL,
+                        sum_rt DOUBLE PRECISION NOT NULL,
+                        cache_hits BIGINT NOT NULL,
+                        PRIMARY KEY (bucket, kb_id, strategy)
+                    )
+                    """)
+                    
+                    # 创建小时汇总表的状态表（只有一行），由各worker共享
+                    cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {ROLLUP_STATE_TABLE} (
+                        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                        rolled_until TIMESTAMP,
+                        dirty_since TIMESTAMP
+                    )
+                    """)
+                    cur.execute(f"INSERT INTO {ROLLUP_STATE_TABLE} DEFAULT VALUES ON CONFLICT DO NOTHING")
+
+                    conn.commit()
+                    logger.info("Database tables ensured")
+            
+                self._ensure_indexes(conn)
+            
+                if USE_SEARCH_LOG_EVENTS:
+                    self._ensure_search_log_events(conn)
+                
+            except Exception as e:
+                logger.error("Ensure tables error: %s", e, exc_info=settings.DEBUG)
+                conn.rollback()
+    
+    def _ensure_indexes(self, conn):
+        """确保日志表的索引存在
+        
+        分析查询均按时间范围和知识库（@>包含）过滤，用户行为按时间倒序取前N条，反馈按search_id关联搜索日志；
+        jsonb_path_ops只支持@>，但体积约为默认jsonb_ops的一半。
+        使用CONCURRENTLY创建，已有大量日志时建索引不阻塞日志写入；CONCURRENTLY不能在事务中执行，需临时开启自动提交。
+        CONCURRENTLY创建失败或中断时会留下同名的失效索引，IF NOT EXISTS会跳过它，因此先删除失效索引再重建
+        """
+        indexes = [
+            "idx_search_logs_kb_ids ON search_logs USING GIN (knowledge_base_ids jsonb_path_ops)",
+            "idx_search_logs_timestamp ON search_logs (timestamp DESC)",
+            "idx_feedback_logs_timestamp ON feedback_logs (timestamp DESC)",
+            "idx_feedback_logs_search_id ON feedback_logs (search_id)",
+        ]
+        conn.autocommit = True
         try:
-            with self.conn.cursor() as cur:
-                # 创建搜索日志表
+            with conn.cursor() as cur:
+                # 多个worker同时启动时只由取得锁的worker创建，其他worker正在创建的索引同样是失效状态，不能被当作失效索引删除。
+                # 不等待锁：等待中的语句持有快照，CONCURRENTLY建索引要等所有旧快照结束，会与等待者互相等待形成死锁
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (ENSURE_INDEXES_LOCK_ID,))
+                if not cur.fetchone()[0]:
+                    logger.info("Log indexes are being ensured by another worker, skipped")
+                    return
+                try:
+                    for index in indexes:
+                        name = index.split(" ", 1)[0]
+                        cur.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+                        row = cur.fetchone()
+                        if row and row[0]:
+                            logger.warning("Dropping invalid index %s", name)
+                            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                        cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}")
+                finally:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (ENSURE_INDEXES_LOCK_ID,))
+        finally:
+            conn.autocommit = False
+    
+    def _ensure_search_log_events(self, conn):
+        """创建分析查询使用的搜索日志副本表
+        
+        副本表与搜索日志表列相同但没有主键，不受主键和反馈外键对分区键的限制：
+        开启TimescaleDB且扩展可用时建为超表，按时间分块，超过7天的分块压缩为按列存储，
+        时间范围聚合只需读取用到的列；否则建为按月范围分区的分区表，查询只扫描时间范围内的分区
+        """
+        timescaledb = settings.ANALYTICS_TIMESCALEDB and self._create_timescaledb_extension(conn)
+        
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('search_log_events') IS NULL")
+            created = cur.fetchone()[0]
+            if timescaledb:
+                cur.execute("CREATE TABLE IF NOT EXISTS search_log_events (LIKE search_logs INCLUDING DEFAULTS)")
+            else:
                 cur.execute("""
-                CREATE TABLE IF NOT EXISTS search_logs (
-                    id VARCHAR(36) PRIMARY KEY,
-                    user_id VARCHAR(36),
-                    query TEXT NOT NULL,
-                    strategy VARCHAR(20) NOT NULL,
-                    response_time FLOAT NOT NULL,
-                    knowledge_base_ids JSONB NOT NULL,
-                    result_count INTEGER NOT NULL,
-                    cache_hit BOOLEAN NOT NULL DEFAULT FALSE,
-                    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-                )
+                CREATE TABLE IF NOT EXISTS search_log_events (LIKE search_logs INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)
                 """)
-                
-                # 创建反馈日志表
+                # 超出已创建月份的数据写入默认分区，避免整批写入失败
+                cur.execute("CREATE TABLE IF NOT EXISTS search_log_events_default PARTITION OF search_log_events DEFAULT")
+            
+            # 已存在的副本表以实际类型为准（可能由之前的配置创建）
+            cur.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'search_log_events'::regclass)")
+            self._log_partitioned = cur.fetchone()[0]
+            if self._log_partitioned:
+                # 为已有日志所在的月份及下个月创建分区（分区表上的索引会自动建到各分区）
+                cur.execute("SELECT MIN(timestamp) FROM search_logs")
+                first_log = cur.fetchone()[0]
+                now = datetime.now()
+                self._ensure_log_partitions(cur, min(first_log or now, now), now + timedelta(days=31))
+            
+            cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_search_log_events_kb_ids ON search_log_events USING GIN (knowledge_base_ids jsonb_path_ops)
+            """)
+            if not timescaledb:
+                # 超表创建时会自动建立时间索引
                 cur.execute("""
-                CREATE TABLE IF NOT EXISTS feedback_logs (
-                    id VARCHAR(36) PRIMARY KEY,
-                    search_id VARCHAR(36) REFERENCES search_logs(id),
-                    user_id VARCHAR(36),
-                    feedback_type VARCHAR(20) NOT NULL,
-                    rating FLOAT,
-                    comment TEXT,
-                    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-                )
+                CREATE INDEX IF NOT EXISTS idx_search_log_events_timestamp ON search_log_events (timestamp DESC)
                 """)
-                
-                self.conn.commit()
-                logger.info("Database tables ensured")
-                
-        except Exception as e:
-            logger.error(f"Ensure tables error: {str(e)}", exc_info=True)
-            self.conn.rollback()
+            if created:
+                # 首次创建时复制已有的搜索日志
+                cur.execute("INSERT INTO search_log_events SELECT * FROM search_logs")
+        conn.commit()
+        
+        if timescaledb and not self._log_partitioned:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT create_hypertable('search_log_events', 'timestamp', if_not_exists => TRUE, migrate_data => TRUE)")
+                    cur.execute("""
+                    SELECT compression_enabled FROM timescaledb_information.hypertables WHERE hypertable_name = 'search_log_events'
+                    """)
+                    if not cur.fetchone()[0]:
+                        cur.execute("""
+                        ALTER TABLE search_log_events SET (
+                            timescaledb.compress,
+                            timescaledb.compress_segmentby = 'strategy',
+                            timescaledb.compress_orderby = 'timestamp DESC'
+                        )
+                        """)
+                    cur.execute("SELECT add_compression_policy('search_log_events', INTERVAL '7 days', if_not_exists => TRUE)")
+                conn.commit()
+                logger.info("TimescaleDB hypertable search_log_events ensured")
+            except Exception as e:
+                conn.rollback()
+                logger.warning("Failed to set up TimescaleDB hypertable search_log_events: %s", e)
     
-    async def get_performance_metrics(self, time_range: str, knowledge_base_id: Optional[str] = None) -> PerformanceMetrics:
-        """获取检索性能指标"""
+    def _create_timescaledb_extension(self, conn) -> bool:
+        """创建TimescaleDB扩展，扩展不可用时返回False"""
         try:
-            # 尝试从缓存获取
-            cache_key = f"performance_metrics:{time_range}:{knowledge_base_id or 'all'}"
-            if self.redis:
-                cached_data = await self.redis.get(cache_key)
-                if cached_data:
-                    try:
-                        cached_metrics = json.loads(cached_data)
-                        return PerformanceMetrics(**cached_metrics)
-                    except Exception as e:
-                        logger.warning(f"Failed to parse cached metrics: {str(e)}")
-            
-            # 计算时间范围
-            start_time = self._get_start_time(time_range)
-            
-            if self.conn:
-                # 从数据库获取数据
-                with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    # 查询总搜索次数和平均响应时间
-                    query = """
-                    SELECT COUNT(*) as total_searches, 
-                           AVG(response_time) as avg_response_time,
-                           SUM(CASE WHEN cache_hit THEN 1 ELSE 0 END) as cache_hits
-                    FROM search_logs 
-                    WHERE timestamp >= %s
-                    """
-                    params = [start_time]
-                    
-                    if knowledge_base_id:
-                        query += " AND knowledge_base_ids @> %s"
-                        params.append(json.dumps([knowledge_base_id]))
-                    
+            with conn.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS timescaledb")
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            logger.warning("TimescaleDB unavailable, search_log_events will be partitioned by month: %s", e)
+            return False
+    
+    @staticmethod
+    def _ensure_log_partitions(cur, start: datetime, end: datetime):
+        """创建覆盖[start, end)的各月份分区（search_log_events_yYYYYmMM）"""
+        month = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        while month < end:
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS search_log_events_y{month:%Y}m{month:%m} "
+                "PARTITION OF search_log_events FOR VALUES FROM (%s) TO (%s)",
+                (month, next_month)
+            )
+            month = next_month
+    
+    def _create_upcoming_partitions(self):
+        """提前创建本月和下个月的分区（同步，在工作线程中调用）"""
+        now = datetime.now()
+        with self._connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    self._ensure_log_partitions(cur, now, now + timedelta(days=31))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def _run_query(self, query: str, params: Any, fetch: Optional[str] = None) -> Any:
+        """执行SQL（同步，在工作线程中调用）
+
+        fetch为"one"/"all"时返回结果行（元组，按列位置读取，不为每行构建字典），否则提交事务；出错时回滚，避免连接停留在失败事务中
+        """
+        with self._connection() as conn:
+            try:
+                with conn.cursor() as cur:
                     cur.execute(query, params)
-                    result = cur.fetchone()
-                    
-                    if not result or result['total_searches'] == 0:
-                        # 如果没有数据，返回模拟数据
-                        return self._get_mock_performance_metrics(time_range, knowledge_base_id)
-                    
-                    total_searches = result['total_searches']
-                    avg_response_time = result['avg_response_time'] or 0
-                    cache_hit_rate = (result['cache_hits'] / total_searches) * 100 if total_searches > 0 else 0
-                    
-                    # 查询正面反馈率
-                    query = """
-                    SELECT 
-                        COUNT(*) as total_feedbacks,
-                        SUM(CASE WHEN feedback_type IN ('like', 'relevant', 'partially') THEN 1 ELSE 0 END) as positive_feedbacks
-                    FROM feedback_logs f
-                    JOIN search_logs s ON f.search_id = s.id
-                    WHERE f.timestamp >= %s
-                    """
-                    params = [start_time]
-                    
-                    if knowledge_base_id:
-                        query += " AND s.knowledge_base_ids @> %s"
-                        params.append(json.dumps([knowledge_base_id]))
+                    if fetch == "one":
+                        return cur.fetchone()
+                    if fetch == "all":
+                        return cur.fetchall()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def _run_prepared(self, name: str, query: str, params: tuple):
+        """以预处理语句执行写入（同步，在工作线程中调用）
+        
+        连接首次执行该语句时先PREPARE（query使用$n占位符），之后只发送EXECUTE和参数，服务端不再重复解析和规划
+        """
+        with self._connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    if name not in conn.prepared:
+                        cur.execute(f"PREPARE {name} AS {query}")
+                        conn.prepared.add(name)
+                    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    # psycopg2是同步驱动，查询放到线程中执行，不阻塞事件循环
+    async def _fetchone(self, query: str, params: Any) -> Optional[tuple]:
+        return await asyncio.to_thread(self._run_query, query, params, "one")
+    
+    async def _fetchall(self, query: str, params: Any) -> List[tuple]:
+        return await asyncio.to_thread(self._run_query, query, params, "all")
+    
+    async def _execute(self, query: str, params: Any) -> None:
+        await asyncio.to_thread(self._run_query, query, params)
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _cache_key(name: str, time_range: str, knowledge_base_id: Optional[str], limit: Optional[int] = None) -> str:
+        """构建分析结果的缓存键
+        
+        时间范围、知识库ID（通常是UUID）和数量限制哈希为定长摘要，键长度不随参数增长；
+        同一组参数在各进程中得到相同的键
+        """
+        key_material = f"{time_range}|{knowledge_base_id or 'all'}|{limit}".encode()
+        return f"{name}:" + hashlib.blake2b(key_material, digest_size=16).hexdigest()
+    
+    @staticmethod
+    def _cache_redis_keys(key: str) -> List[str]:
+        """缓存在Redis中对应的值键和新鲜标记键"""
+        return [f"value:{key}", f"fresh:{key}"]
+    
+    async def _cache_get(self, key: str, cache: Optional[CacheBatch] = None, refresh: Optional[Callable[[CacheBatch], Awaitable[Any]]] = None) -> Optional[bytes]:
+        """读取缓存（stale-while-revalidate），批次中已预取的键不再访问Redis
+        
+        新鲜标记已过期但值仍在时直接返回旧值，同时在后台调用refresh重新计算，
+        避免缓存同时过期时所有请求一起查询数据库
+        """
+        redis_keys = self._cache_redis_keys(key)
+        if cache is not None:
+            value, fresh = (cache.values.get(redis_key) for redis_key in redis_keys)
+        elif self.redis:
+            value, fresh = await self.redis.mget(redis_keys)
+        else:
+            return None
+        
+        if value is None:
+            return None
+        if fresh is None and refresh is not None:
+            self._schedule_refresh(key, refresh)
+        return decompress_value(value)
+    
+    def _schedule_refresh(self, key: str, refresh: Callable[[CacheBatch], Awaitable[Any]]):
+        """在后台重新计算过期的缓存，同一进程内每个键只有一个任务"""
+        if key in self._refresh_tasks:
+            return
+        task = asyncio.create_task(self._refresh_cache(key, refresh))
+        self._refresh_tasks[key] = task
+        task.add_done_callback(lambda _: self._refresh_tasks.pop(key, None))
+    
+    async def _refresh_cache(self, key: str, refresh: Callable[[CacheBatch], Awaitable[Any]]):
+        """重新计算并写回缓存
+        
+        通过Redis锁（SET NX EX）保证多个worker中只有一个重新计算；锁不主动释放，
+        结果无法缓存（如没有数据）时，每个锁周期也最多重新计算一次
+        """
+        try:
+            if not await self.redis.set(f"lock:{key}", 1, nx=True, ex=CACHE_REFRESH_LOCK_TTL):
+                return
+            # 空批次使getter跳过缓存读取，计算结果暂存在批次中
+            batch = CacheBatch(values={})
+            await refresh(cache=batch)
+            await self._cache_set_many(batch.pending)
+        except Exception as e:
+            logger.warning("Failed to refresh cached %s: %s", key, e)
+    
+    async def _cache_set(self, key: str, value: Union[str, bytes], cache: Optional[CacheBatch] = None):
+        """写入缓存，批次内的写入暂存到批次结束时统一提交"""
+        if cache is not None:
+            cache.pending[key] = value
+        else:
+            await self._cache_set_many({key: value})
+    
+    async def _cache_set_many(self, mapping: Dict[str, Union[str, bytes]]):
+        """通过管道一次写入多个缓存（非事务，只减少网络往返），较大的值（如用户行为列表）经zstd压缩后写入"""
+        if not self.redis or not mapping:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                value_key, fresh_key = self._cache_redis_keys(key)
+                if isinstance(value, str):
+                    value = value.encode()
+                pipe.set(value_key, compress_value(value), ex=CACHE_STALE_TTL)
+                pipe.set(fresh_key, 1, ex=CACHE_TTL)
+            await pipe.execute()
+    
+    def _refresh_rollup(self):
+        """刷新搜索日志小时汇总表（同步，在工作线程中调用），其他worker正在刷新时跳过
+        
+        只汇总结束超过ROLLUP_GRACE的整点小时；从已汇总的截止时间和待重新汇总的最早小时中较早的一个起重算（覆盖写入）。
+        截止时间保存在状态表中，首次刷新汇总最近一年（最大统计范围）的数据。
+        先锁定状态行：正在写入已结束小时日志的事务提交后才开始汇总，之后提交的写入在汇总提交后重新标记
+        """
+        until = (datetime.now() - ROLLUP_GRACE).replace(minute=0, second=0, microsecond=0)
+        with self._connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (ROLLUP_LOCK_ID,))
+                    if not cur.fetchone()[0]:
+                        conn.rollback()
+                        return
+                    cur.execute(f"SELECT rolled_until, dirty_since FROM {ROLLUP_STATE_TABLE} FOR UPDATE")
+                    rolled_until, dirty_since = cur.fetchone()
                     
-                    cur.execute(query, params)
-                    feedback_result = cur.fetchone()
+                    if rolled_until is None:
+                        since = until - timedelta(days=366)
+                    else:
+                        since = rolled_until
+                        if dirty_since is not None:
+                            since = min(since, dirty_since.replace(minute=0, second=0, microsecond=0))
                     
-                    total_feedbacks = feedback_result['total_feedbacks'] if feedback_result else 0
-                    positive_feedbacks = feedback_result['positive_feedbacks'] if feedback_result else 0
-                    positive_feedback_rate = (positive_feedbacks / total_feedbacks) * 100 if total_feedbacks > 0 else 0
+                    cur.execute(f"""
+                    INSERT INTO search_logs_hourly (bucket, kb_id, strategy, count, sum_rt, cache_hits)
+                    SELECT date_trunc('hour', s.timestamp), k.kb_id, s.strategy,
+                           COUNT(*), SUM(s.response_time), COUNT(*) FILTER (WHERE s.cache_hit)
+                    FROM {SEARCH_LOG_SOURCE} s
+                    CROSS JOIN LATERAL (
+                        SELECT '*' AS kb_id
+                        UNION
+                        SELECT jsonb_array_elements_text(s.knowledge_base_ids)
+                    ) k
+                    WHERE s.timestamp >= %(since)s AND s.timestamp < %(until)s
+                    GROUP BY 1, 2, 3
+                    ON CONFLICT (bucket, kb_id, strategy) DO UPDATE
+                    SET count = EXCLUDED.count, sum_rt = EXCLUDED.sum_rt, cache_hits = EXCLUDED.cache_hits
+                    """, {"since": since, "until": until})
                     
-                    metrics = PerformanceMetrics(
-                        total_searches=total_searches,
-                        avg_response_time=avg_response_time * 1000,  # 转换为毫秒
-                        cache_hit_rate=cache_hit_rate,
-                        positive_feedback_rate=positive_feedback_rate,
-                        time_range=time_range,
-                        knowledge_base_id=knowledge_base_id
+                    # 不早于until的小时本就在下次汇总范围内，待重新汇总的标记可以全部清除
+                    cur.execute(
+                        f"UPDATE {ROLLUP_STATE_TABLE} SET rolled_until = GREATEST(rolled_until, %s), dirty_since = NULL",
+                        (until,)
                     )
-                    
-                    # 缓存结果
-                    if self.redis:
-                        await self.redis.set(
-                            cache_key, 
-                            json.dumps(metrics.dict()), 
-                            ex=300  # 缓存5分钟
-                        )
-                    
-                    return metrics
-            else:
-                # 如果没有数据库连接，使用内存存储
-                filtered_logs = self._filter_logs(self.search_logs, start_time, knowledge_base_id)
-                
-                # 如果没有日志，创建一些模拟数据
-                if not filtered_logs:
-                    return self._get_mock_performance_metrics(time_range, knowledge_base_id)
-                
-                # 计算指标
-                total_searches = len(filtered_logs)
-                avg_response_time = sum(log.get("response_time", 0) for log in filtered_logs) / total_searches if total_searches > 0 else 0
-                cache_hit_rate = sum(1 for log in filtered_logs if log.get("cache_hit", False)) / total_searches if total_searches > 0 else 0
-                
-                # 计算正面反馈率
-                feedback_logs = self._filter_logs(self.feedback_logs, start_time, knowledge_base_id)
-                positive_feedbacks = sum(1 for log in feedback_logs if log.get("feedback_type") in ["like", "relevant", "partially"])
-                total_feedbacks = len(feedback_logs)
-                positive_feedback_rate = positive_feedbacks / total_feedbacks if total_feedbacks > 0 else 0
-                
-                return PerformanceMetrics(
-                    total_searches=total_searches,
-                    avg_response_time=avg_response_time * 1000,  # 转换为毫秒
-                    cache_hit_rate=cache_hit_rate * 100,  # 转换为百分比
-                    positive_feedback_rate=positive_feedback_rate * 100,  # 转换为百分比
-                    time_range=time_range,
-                    knowledge_base_id=knowledge_base_id
-                )
-            
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    async def refresh_rollup(self):
+        """刷新搜索日志小时汇总表"""
+        await asyncio.to_thread(self._refresh_rollup)
+    
+    async def run_rollup(self):
+        """后台定时刷新小时汇总表，并提前创建搜索日志副本表的后续分区（由应用启动时创建的任务运行）"""
+        while True:
+            if self._log_partitioned:
+                try:
+                    await asyncio.to_thread(self._create_upcoming_partitions)
+                except Exception as e:
+                    logger.error("Create search log partitions error: %s", e, exc_info=settings.DEBUG)
+            try:
+                await self.refresh_rollup()
+            except Exception as e:
+                logger.error("Refresh search logs rollup error: %s", e, exc_info=settings.DEBUG)
+            await asyncio.sleep(settings.ANALYTICS_ROLLUP_INTERVAL)
+    
+    def _insert_search_logs(self, rows: List[tuple], dirty_since: Optional[datetime]):
+        """批量写入搜索日志（同步，在工作线程中调用），整批在一个事务中提交"""
+        with self._connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    execute_values(cur, INSERT_SEARCH_LOG_SQL, rows, page_size=len(rows))
+                    if dirty_since is not None:
+                        cur.execute(MARK_ROLLUP_DIRTY_PG_SQL, (dirty_since,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    async def init_write_pool(self):
+        """创建日志写入使用的asyncpg连接池（需在事件循环中调用），asyncpg不可用或连接失败时继续使用psycopg2"""
+        if asyncpg is None or not self.pool or self._write_pool:
+            return
+        try:
+            self._write_pool = await asyncpg.create_pool(
+                database=settings.POSTGRES_DB,
+                user=settings.POSTGRES_USER,
+                password=settings.POSTGRES_PASSWORD,
+                host=settings.POSTGRES_HOST,
+                port=settings.POSTGRES_PORT,
+                min_size=4,
+                max_size=20
+            )
+            logger.info("Created asyncpg pool for analytics log writes")
         except Exception as e:
-            logger.error(f"Get performance metrics error: {str(e)}", exc_info=True)
-            # 如果出错，返回模拟数据
-            return self._get_mock_performance_metrics(time_range, knowledge_base_id)
+            logger.warning("Failed to create asyncpg pool, log writes use psycopg2: %s", e)
+    
+    async def close(self):
+        """关闭日志写入使用的连接池和查询使用的连接池"""
+        if self._write_pool:
+            await self._write_pool.close()
+            self._write_pool = None
+        if self.pool:
+            self.pool.closeall()
+    
+    async def flush_search_logs(self):
+        """将缓冲区中的搜索日志写入数据库，写入失败的日志留在缓冲区中重试"""
+        async with self._flush_lock:
+            rows, self._search_log_buffer = self._search_log_buffer, []
+            if not rows:
+                return
+            # 属于已结束小时的日志（可能已被汇总）中最早的时间，没有时为None
+            oldest = min(row[_SEARCH_LOG_TIMESTAMP] for row in rows)
+            dirty_since = oldest if oldest < datetime.now().replace(minute=0, second=0, microsecond=0) else None
+            try:
+                if self._write_pool:
+                    # 使用二进制COPY整批写入，搜索日志表和副本表在同一个事务中写入
+                    async with self._write_pool.acquire() as conn:
+                        async with conn.transaction():
+                            await conn.copy_records_to_table("search_logs", records=rows, columns=SEARCH_LOG_COLUMNS)
+                            if USE_SEARCH_LOG_EVENTS:
+                                await conn.copy_records_to_table("search_log_events", records=rows, columns=SEARCH_LOG_COLUMNS)
+                            if dirty_since is not None:
+                                await conn.execute(MARK_ROLLUP_DIRTY_SQL, dirty_since)
+                else:
+                    await asyncio.to_thread(self._insert_search_logs, rows, dirty_since)
+                logger.debug("Logged %s searches", len(rows))
+            except Exception as e:
+                logger.error("Flush search logs error: %s", e, exc_info=settings.DEBUG)
+                # 整批事务已回滚，放回缓冲区头部（保持记录顺序），下次写入时重试
+                self._search_log_buffer[:0] = rows
+                dropped = len(self._search_log_buffer) - MAX_BUFFERED_SEARCH_LOGS
+                if dropped > 0:
+                    del self._search_log_buffer[:dropped]
+                    logger.error("Search log buffer full, dropped %s search logs", dropped)
+    
+    async def run_log_flush(self):
+        """后台定时写入缓冲的搜索日志（由应用启动时创建的任务运行）"""
+        while True:
+            await asyncio.sleep(LOG_FLUSH_INTERVAL)
+            await self.flush_search_logs()
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _kb_ids_param(knowledge_base_id: Optional[str]) -> Optional[str]:
+        """知识库过滤参数（与knowledge_base_ids做@>比较的JSON数组），不过滤时为None
+        
+        知识库数量有限，序列化结果按知识库ID缓存，仪表盘的各个查询共用同一个字符串
+        """
+        return json.dumps([knowledge_base_id]) if knowledge_base_id else None
     
+    def _search_stats_params(self, start_time: datetime, knowledge_base_id: Optional[str]) -> Dict[str, Any]:
+        """SEARCH_STATS_SQL的查询参数：计算汇总表可覆盖的第一个整点小时
+        
+        汇总表可用的截止时间由SQL从状态表读取（各worker共享）；截止时间不晚于起点时汇总部分为空，全部读取明细表
+        """
+        rollup_start = start_time.replace(minute=0, second=0, microsecond=0)
+        if rollup_start < start_time:
+            rollup_start += timedelta(hours=1)
+        
+        return {
+            "start_time": start_time,
+            "rollup_start": rollup_start,
+            "kb_key": knowledge_base_id or "*",
+            "kb_ids": self._kb_ids_param(knowledge_base_id)
+        }
+    
+    @cached_result("performance_metrics", PerformanceMetrics, mock="_get_mock_performance_metrics")
+    async def get_performance_metrics(self, time_range: str, knowledge_base_id: Optional[str] = None) -> PerformanceMetrics:
+        """获取检索性能指标"""
+        # 计算时间范围
+        start_time = self._get_start_time(time_range)
+        
+        if self.pool:
+            # 从数据库获取数据
+            # 一次查询同时统计搜索指标和反馈指标
+            params = self._search_stats_params(start_time, knowledge_base_id)
+            params["positive_types"] = POSITIVE_FEEDBACK_TYPES
+            
+            result = await self._fetchone(PERFORMANCE_METRICS_SQL, params)
+            
+            if not result or result[0] == 0:
+                # 没有数据，由cached_result返回模拟数据
+                return None
+            
+            total_searches, avg_response_time, cache_hits, total_feedbacks, positive_feedbacks = result
+            avg_response_time = avg_response_time or 0
+            cache_hit_rate = (cache_hits / total_searches) * 100 if total_searches > 0 else 0
+            
+            # 正面反馈率
+            positive_feedbacks = positive_feedbacks or 0
+            positive_feedback_rate = (positive_feedbacks / total_feedbacks) * 100 if total_feedbacks > 0 else 0
+            
+            metrics = PerformanceMetrics(
+                total_searches=total_searches,
+                avg_response_time=avg_response_time * 1000,  # 转换为毫秒
+                cache_hit_rate=cache_hit_rate,
+                positive_feedback_rate=positive_feedback_rate,
+                time_range=time_range,
+                knowledge_base_id=knowledge_base_id
+            )
+            
+            return metrics
+        else:
+            # 如果没有数据库连接，使用内存存储
+            filtered_logs = self._filter_logs(self._get_search_logs_df(), start_time, knowledge_base_id)
+            
+            # 没有日志，由cached_result返回模拟数据
+            if filtered_logs.empty:
+                return None
+            
+            # 计算指标
+            total_searches = len(filtered_logs)
+            avg_response_time = float(filtered_logs["response_time"].mean())
+            cache_hit_rate = float(filtered_logs["cache_hit"].astype(bool).mean())
+            
+            # 计算正面反馈率
+            feedback_logs = self._filter_logs(self._get_feedback_logs_df(), start_time, knowledge_base_id)
+            positive_feedbacks = int(feedback_logs["feedback_type"].isin(POSITIVE_FEEDBACK_TYPES).sum())
+            total_feedbacks = len(feedback_logs)
+            positive_feedback_rate = positive_feedbacks / total_feedbacks if total_feedbacks > 0 else 0
+            
+            return PerformanceMetrics(
+                total_searches=total_searches,
+                avg_response_time=avg_response_time * 1000,  # 转换为毫秒
+                cache_hit_rate=cache_hit_rate * 100,  # 转换为百分比
+                positive_feedback_rate=positive_feedback_rate * 100,  # 转换为百分比
+                time_range=time_range,
+                knowledge_base_id=knowledge_base_id
+            )
+    
+    @cached_result("search_trends", SearchTrend, mock="_get_mock_search_trends")
     async def get_search_trends(self, time_range: str, knowledge_base_id: Optional[str] = None) -> SearchTrend:
         """获取搜索趋势"""
-        try:
-            # 尝试从缓存获取
-            cache_key = f"search_trends:{time_range}:{knowledge_base_id or 'all'}"
-            if self.redis:
-                cached_data = await self.redis.get(cache_key)
-                if cached_data:
-                    try:
-                        cached_trends = json.loads(cached_data)
-                        return SearchTrend(**cached_trends)
-                    except Exception as e:
-                        logger.warning(f"Failed to parse cached trends: {str(e)}")
+        # 计算时间范围
+        start_time = self._get_start_time(time_range)
+        
+        if self.pool:
+            # 从数据库获取数据
+            # 获取时间间隔
+            intervals = self._get_time_intervals(time_range, start_time)
             
-            # 计算时间范围
-            start_time = self._get_start_time(time_range)
+            # 一次查询统计所有时间间隔
+            results = await self._fetchall(SEARCH_TRENDS_SQL, {
+                "interval_starts": [interval[0] for interval in intervals],
+                "interval_ends": [interval[1] for interval in intervals],
+                "kb_ids": self._kb_ids_param(knowledge_base_id)
+            })
             
-            if self.conn:
-                # 从数据库获取数据
-                with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    # 获取时间间隔
-                    intervals = self._get_time_intervals(time_range, start_time)
-                    search_volume = []
-                    response_time = []
-                    
-                    for interval_start, interval_end, label in intervals:
-                        # 查询该时间间隔内的搜索量
-                        query = """
-                        SELECT COUNT(*) as count
-                        FROM search_logs
-                        WHERE timestamp >= %s AND timestamp < %s
-                        """
-                        params = [interval_start, interval_end]
-                        
-                        if knowledge_base_id:
-                            query += " AND knowledge_base_ids @> %s"
-                            params.append(json.dumps([knowledge_base_id]))
-                        
-                        cur.execute(query, params)
-                        result = cur.fetchone()
-                        search_volume.append(TimeSeriesPoint(
-                            timestamp=label,
-                            value=result['count'] if result else 0
-                        ))
-                        
-                        # 查询该时间间隔内的平均响应时间
-                        query = """
-                        SELECT AVG(response_time) as avg_time
-                        FROM search_logs
-                        WHERE timestamp >= %s AND timestamp < %s
-                        """
-                        params = [interval_start, interval_end]
-                        
-                        if knowledge_base_id:
-                            query += " AND knowledge_base_ids @> %s"
-                            params.append(json.dumps([knowledge_base_id]))
-                        
-                        cur.execute(query, params)
-                        result = cur.fetchone()
-                        response_time.append(TimeSeriesPoint(
-                            timestamp=label,
-                            value=(result['avg_time'] or 0) * 1000  # 转换为毫秒
-                        ))
-                    
-                    # 检查是否有数据
-                    has_data = any(point.value > 0 for point in search_volume)
-                    if not has_data:
-                        return self._get_mock_search_trends(time_range, knowledge_base_id)
-                    
-                    trends = SearchTrend(
-                        search_volume=search_volume,
-                        response_time=response_time,
-                        time_range=time_range,
-                        knowledge_base_id=knowledge_base_id
-                    )
-                    
-                    # 缓存结果
-                    if self.redis:
-                        await self.redis.set(
-                            cache_key, 
-                            json.dumps(trends.dict()), 
-                            ex=300  # 缓存5分钟
-                        )
-                    
-                    return trends
-            else:
-                # 如果没有数据库连接，使用内存存储
-                filtered_logs = self._filter_logs(self.search_logs, start_time, knowledge_base_id)
-                
-                # 如果没有日志，创建一些模拟数据
-                if not filtered_logs:
-                    return self._get_mock_search_trends(time_range, knowledge_base_id)
-                
-                # 按时间间隔分组
-                intervals = self._get_time_intervals(time_range, start_time)
-                search_volume = []
-                response_time = []
-                
-                for interval_start, interval_end, label in intervals:
-                    # 计算该时间间隔内的搜索量
-                    interval_logs = [log for log in filtered_logs 
-                                   if interval_start <= log.get("timestamp") < interval_end]
-                    search_volume.append(TimeSeriesPoint(
-                        timestamp=label,
-                        value=len(interval_logs)
-                    ))
-                    
-                    # 计算该时间间隔内的平均响应时间
-                    avg_time = sum(log.get("response_time", 0) for log in interval_logs) / len(interval_logs) if interval_logs else 0
-                    response_time.append(TimeSeriesPoint(
-                        timestamp=label,
-                        value=avg_time * 1000  # 转换为毫秒
-                    ))
-                
-                return SearchTrend(
-                    search_volume=search_volume,
-                    response_time=response_time,
-                    time_range=time_range,
-                    knowledge_base_id=knowledge_base_id
-                )
+            search_volume = []
+            response_time = []
+            for (_, _, label), (_, count, avg_time) in zip(intervals, results):
+                search_volume.append(TimeSeriesPoint(
+                    timestamp=label,
+                    value=count
+                ))
+                response_time.append(TimeSeriesPoint(
+                    timestamp=label,
+                    value=round((avg_time or 0) * 1000, RESPONSE_TIME_DECIMALS)  # 转换为毫秒
+                ))
             
-        except Exception as e:
-            logger.error(f"Get search trends error: {str(e)}", exc_info=True)
-            # 如果出错，返回模拟数据
-            return self._get_mock_search_trends(time_range, knowledge_base_id)
+            # 检查是否有数据
+            has_data = any(point.value > 0 for point in search_volume)
+            if not has_data:
+                return None
+            
+            trends = SearchTrend(
+                search_volume=search_volume,
+                response_time=response_time,
+                time_range=time_range,
+                knowledge_base_id=knowledge_base_id
+            )
+            
+            return trends
+        else:
+            # 如果没有数据库连接，使用内存存储
+            filtered_logs = self._filter_logs(self._get_search_logs_df(), start_time, knowledge_base_id)
+            
+            # 没有日志，由cached_result返回模拟数据
+            if filtered_logs.empty:
+                return None
+            
+            # 按时间间隔分组：日志按时间排序后二分查找各间隔的起止位置，
+            # 间隔内的响应时间总和由前缀和相减得到
+            intervals = self._get_time_intervals(time_range, start_time)
+            filtered_logs = filtered_logs.sort_values("timestamp")
+            timestamps = filtered_logs["timestamp"].to_numpy(dtype="datetime64[ns]")
+            response_time_sums = np.concatenate(([0.0], filtered_logs["response_time"].to_numpy(dtype=np.float64).cumsum()))
+            lo = timestamps.searchsorted(np.array([interval[0] for interval in intervals], dtype="datetime64[ns]"))
+            hi = timestamps.searchsorted(np.array([interval[1] for interval in intervals], dtype="datetime64[ns]"))
+            counts = hi - lo
+            avg_times = np.divide(response_time_sums[hi] - response_time_sums[lo], counts, out=np.zeros(len(intervals)), where=counts > 0)
+            avg_times_ms = np.round(avg_times * 1000, RESPONSE_TIME_DECIMALS)  # 转换为毫秒
+            
+            search_volume = []
+            response_time = []
+            for (_, _, label), count, avg_time in zip(intervals, counts.tolist(), avg_times_ms.tolist()):
+                search_volume.append(TimeSeriesPoint(
+                    timestamp=label,
+                    value=count
+                ))
+                response_time.append(TimeSeriesPoint(
+                    timestamp=label,
+                    value=avg_time
+                ))
+            
+            return SearchTrend(
+                search_volume=search_volume,
+                response_time=response_time,
+                time_range=time_range,
+                knowledge_base_id=knowledge_base_id
+            )
     
+    @cached_result("strategy_distribution", SearchStrategyDistribution, mock="_get_mock_strategy_distribution")
     async def get_search_strategy_distribution(self, time_range: str, knowledge_base_id: Optional[str] = None) -> SearchStrategyDistribution:
         """获取检索策略分布"""
-        try:
-            # 尝试从缓存获取
-            cache_key = f"strategy_distribution:{time_range}:{knowledge_base_id or 'all'}"
-            if self.redis:
-                cached_data = await self.redis.get(cache_key)
-                if cached_data:
-                    try:
-                        cached_distribution = json.loads(cached_data)
-                        return SearchStrategyDistribution(**cached_distribution)
-                    except Exception as e:
-                        logger.warning(f"Failed to parse cached strategy distribution: {str(e)}")
+        # 计算时间范围
+        start_time = self._get_start_time(time_range)
+        
+        if self.pool:
+            # 从数据库获取数据
+            # 查询各策略使用次数（整点小时读取汇总表；JSON文本，由cached_result解析并原样缓存）
+            result = await self._fetchone(STRATEGY_DISTRIBUTION_SQL, {
+                **self._search_stats_params(start_time, knowledge_base_id),
+                "time_range": time_range,
+                "knowledge_base_id": knowledge_base_id
+            })
             
-            # 计算时间范围
-            start_time = self._get_start_time(time_range)
+            return result[0] if result else None
+        else:
+            # 如果没有数据库连接，使用内存存储
+            filtered_logs = self._filter_logs(self._get_search_logs_df(), start_time, knowledge_base_id)
             
-            if self.conn:
-                # 从数据库获取数据
-                with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    # 查询各策略使用次数
-                    query = """
-                    SELECT strategy, COUNT(*) as count
-                    FROM search_logs
-                    WHERE timestamp >= %s
-                    """
-                    params = [start_time]
-                    
-                    if knowledge_base_id:
-                        query += " AND knowledge_base_ids @> %s"
-                        params.append(json.dumps([knowledge_base_id]))
-                    
-                    query += " GROUP BY strategy ORDER BY count DESC"
-                    
-                    cur.execute(query, params)
-                    results = cur.fetchall()
-                    
-                    if not results:
-                        return self._get_mock_strategy_distribution(time_range, knowledge_base_id)
-                    
-                    # 计算总数和百分比
-                    total = sum(result['count'] for result in results)
-                    strategies = []
-                    for result in results:
-                        strategies.append({
-                            "strategy": result['strategy'],
-                            "count": result['count'],
-                            "percentage": (result['count'] / total) * 100 if total > 0 else 0
-                        })
-                    
-                    distribution = SearchStrategyDistribution(
-                        strategies=strategies,
-                        time_range=time_range,
-                        knowledge_base_id=knowledge_base_id
-                    )
-                    
-                    # 缓存结果
-                    if self.redis:
-                        await self.redis.set(
-                            cache_key, 
-                            json.dumps(distribution.dict()), 
-                            ex=300  # 缓存5分钟
-                        )
-                    
-                    return distribution
-            else:
-                # 如果没有数据库连接，使用内存存储
-                filtered_logs = self._filter_logs(self.search_logs, start_time, knowledge_base_id)
-                
-                # 如果没有日志，创建一些模拟数据
-                if not filtered_logs:
-                    return self._get_mock_strategy_distribution(time_range, knowledge_base_id)
-                
-                # 统计各策略使用次数
-                strategy_counts = {}
-                for log in filtered_logs:
-                    strategy = log.get("strategy", "auto")
-                    strategy_counts[strategy] = strategy_counts.get(strategy, 0) + 1
-                
-                # 计算百分比
-                total = len(filtered_logs)
-                strategies = []
-                for strategy, count in strategy_counts.items():
-                    strategies.append({
-                        "strategy": strategy,
-                        "count": count,
-                        "percentage": count / total * 100 if total > 0 else 0
-                    })
-                
-                # 按使用次数降序排序
-                strategies.sort(key=lambda x: x["count"], reverse=True)
-                
-                return SearchStrategyDistribution(
-                    strategies=strategies,
-                    time_range=time_range,
-                    knowledge_base_id=knowledge_base_id
-                )
+            # 没有日志，由cached_result返回模拟数据
+            if filtered_logs.empty:
+                return None
             
-        except Exception as e:
-            logger.error(f"Get search strategy distribution error: {str(e)}", exc_info=True)
-            # 如果出错，返回模拟数据
-            return self._get_mock_strategy_distribution(time_range, knowledge_base_id)
+            # 统计各策略使用次数（value_counts按次数降序）
+            strategy_counts = filtered_logs["strategy"].value_counts()
+            
+            # 计算百分比
+            total = len(filtered_logs)
+            strategies = []
+            for strategy, count in zip(strategy_counts.index.tolist(), strategy_counts.tolist()):
+                strategies.append({
+                    "strategy": strategy,
+                    "count": count,
+                    "percentage": count / total * 100 if total > 0 else 0
+                })
+            
+            return SearchStrategyDistribution(
+                strategies=strategies,
+                time_range=time_range,
+                knowledge_base_id=knowledge_base_id
+            )
     
+    @cached_result("feedback_distribution", FeedbackDistribution, mock="_get_mock_feedback_distribution")
     async def get_feedback_distribution(self, time_range: str, knowledge_base_id: Optional[str] = None) -> FeedbackDistribution:
         """获取用户反馈分布"""
-        try:
-            # 尝试从缓存获取
-            cache_key = f"feedback_distribution:{time_range}:{knowledge_base_id or 'all'}"
-            if self.redis:
-                cached_data = await self.redis.get(cache_key)
-                if cached_data:
-                    try:
-                        cached_distribution = json.loads(cached_data)
-                        return FeedbackDistribution(**cached_distribution)
-                    except Exception as e:
-                        logger.warning(f"Failed to parse cached feedback distribution: {str(e)}")
+        # 计算时间范围
+        start_time = self._get_start_time(time_range)
+        
+        if self.pool:
+            # 从数据库获取数据
+            # 查询各反馈类型次数及正面/负面反馈总数
+            results = await self._fetchall(FEEDBACK_DISTRIBUTION_SQL, {
+                "start_time": start_time,
+                "kb_ids": self._kb_ids_param(knowledge_base_id),
+                "positive_types": POSITIVE_FEEDBACK_TYPES,
+                "negative_types": NEGATIVE_FEEDBACK_TYPES
+            })
             
-            # 计算时间范围
-            start_time = self._get_start_time(time_range)
+            if not results:
+                return None
             
-            if self.conn:
-                # 从数据库获取数据
-                with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    # 查询各反馈类型次数
-                    query = """
-                    SELECT f.feedback_type, COUNT(*) as count
-                    FROM feedback_logs f
-                    JOIN search_logs s ON f.search_id = s.id
-                    WHERE f.timestamp >= %s
-                    """
-                    params = [start_time]
-                    
-                    if knowledge_base_id:
-                        query += " AND s.knowledge_base_ids @> %s"
-                        params.append(json.dumps([knowledge_base_id]))
-                    
-                    query += " GROUP BY f.feedback_type ORDER BY count DESC"
-                    
-                    cur.execute(query, params)
-                    results = cur.fetchall()
-                    
-                    if not results:
-                        return self._get_mock_feedback_distribution(time_range, knowledge_base_id)
-                    
-                    # 计算总数和百分比
-                    total = sum(result['count'] for result in results)
-                    feedback_types = []
-                    positive_count = 0
-                    negative_count = 0
-                    
-                    for result in results:
-                        feedback_type = result['feedback_type']
-                        count = result['count']
-                        
-                        feedback_types.append({
-                            "type": feedback_type,
-                            "count": count,
-                            "percentage": (count / total) * 100 if total > 0 else 0
-                        })
-                        
-                        # 统计正面/负面反馈
-                        if feedback_type in ["like", "relevant", "partially"]:
-                            positive_count += count
-                        elif feedback_type in ["dislike", "irrelevant", "outdated", "incomplete", "other"]:
-                            negative_count += count
-                    
-                    distribution = FeedbackDistribution(
-                        feedback_types=feedback_types,
-                        positive_count=positive_count,
-                        negative_count=negative_count,
-                        positive_rate=(positive_count / total) * 100 if total > 0 else 0,
-                        time_range=time_range,
-                        knowledge_base_id=knowledge_base_id
-                    )
-                    
-                    # 缓存结果
-                    if self.redis:
-                        await self.redis.set(
-                            cache_key, 
-                            json.dumps(distribution.dict()), 
-                            ex=300  # 缓存5分钟
-                        )
-                    
-                    return distribution
-            else:
-                # 如果没有数据库连接，使用内存存储
-                filtered_logs = self._filter_logs(self.feedback_logs, start_time, knowledge_base_id)
-                
-                # 如果没有日志，创建一些模拟数据
-                if not filtered_logs:
-                    return self._get_mock_feedback_distribution(time_range, knowledge_base_id)
-                
-                # 统计各反馈类型次数
-                feedback_counts = {}
-                positive_count = 0
-                negative_count = 0
-                
-                for log in filtered_logs:
-                    feedback_type = log.get("feedback_type", "")
-                    feedback_counts[feedback_type] = feedback_counts.get(feedback_type, 0) + 1
-                    
-                    # 统计正面/负面反馈
-                    if feedback_type in ["like", "relevant", "partially"]:
-                        positive_count += 1
-                    elif feedback_type in ["dislike", "irrelevant", "outdated", "incomplete", "other"]:
-                        negative_count += 1
-                
-                # 计算百分比
-                total = len(filtered_logs)
-                feedback_types = []
-                for feedback_type, count in feedback_counts.items():
-                    feedback_types.append({
-                        "type": feedback_type,
-                        "count": count,
-                        "percentage": count / total * 100 if total > 0 else 0
-                    })
-                
-                # 按次数降序排序
-                feedback_types.sort(key=lambda x: x["count"], reverse=True)
-                
-                return FeedbackDistribution(
-                    feedback_types=feedback_types,
-                    positive_count=positive_count,
-                    negative_count=negative_count,
-                    positive_rate=positive_count / total * 100 if total > 0 else 0,
-                    time_range=time_range,
-                    knowledge_base_id=knowledge_base_id
-                )
+            # 总数和正面/负面反馈数在每一行中相同，取第一行
+            total, positive_count, negative_count = results[0][3:]
             
-        except Exception as e:
-            logger.error(f"Get feedback distribution error: {str(e)}", exc_info=True)
-            # 如果出错，返回模拟数据
-            return self._get_mock_feedback_distribution(time_range, knowledge_base_id)
+            feedback_types = [
+                {"type": feedback_type, "count": count, "percentage": percentage}
+                for feedback_type, count, percentage, *_ in results
+            ]
+            
+            distribution = FeedbackDistribution(
+                feedback_types=feedback_types,
+                positive_count=positive_count,
+                negative_count=negative_count,
+                positive_rate=(positive_count / total) * 100 if total > 0 else 0,
+                time_range=time_range,
+                knowledge_base_id=knowledge_base_id
+            )
+            
+            return distribution
+        else:
+            # 如果没有数据库连接，使用内存存储
+            filtered_logs = self._filter_logs(self._get_feedback_logs_df(), start_time, knowledge_base_id)
+            
+            # 没有日志，由cached_result返回模拟数据
+            if filtered_logs.empty:
+                return None
+            
+            # 统计各反馈类型次数（value_counts按次数降序）
+            feedback_counts = filtered_logs["feedback_type"].value_counts()
+            
+            # 统计正面/负面反馈
+            positive_count = int(feedback_counts.reindex(POSITIVE_FEEDBACK_TYPES, fill_value=0).sum())
+            negative_count = int(feedback_counts.reindex(NEGATIVE_FEEDBACK_TYPES, fill_value=0).sum())
+            
+            # 计算百分比
+            total = len(filtered_logs)
+            feedback_types = []
+            for feedback_type, count in zip(feedback_counts.index.tolist(), feedback_counts.tolist()):
+                feedback_types.append({
+                    "type": feedback_type,
+                    "count": count,
+                    "percentage": count / total * 100 if total > 0 else 0
+                })
+            
+            return FeedbackDistribution(
+                feedback_types=feedback_types,
+                positive_count=positive_count,
+                negative_count=negative_count,
+                positive_rate=positive_count / total * 100 if total > 0 else 0,
+                time_range=time_range,
+                knowledge_base_id=knowledge_base_id
+            )
     
+    @cached_result("top_queries", TopQueries, mock="_get_mock_top_queries")
     async def get_top_queries(self, time_range: str, limit: int = 10, knowledge_base_id: Optional[str] = None) -> TopQueries:
         """获取热门查询"""
-        try:
-            # 尝试从缓存获取
-            cache_key = f"top_queries:{time_range}:{knowledge_base_id or 'all'}:{limit}"
-            if self.redis:
-                cached_data = await self.redis.get(cache_key)
-                if cached_data:
-                    try:
-                        cached_queries = json.loads(cached_data)
-                        return TopQueries(**cached_queries)
-                    except Exception as e:
-                        logger.warning(f"Failed to parse cached top queries: {str(e)}")
+        # 计算时间范围
+        start_time = self._get_start_time(time_range)
+        
+        if self.pool:
+            # 从数据库获取数据
+            # 查询热门查询（JSON文本，由cached_result解析并原样缓存）
+            result = await self._fetchone(TOP_QUERIES_SQL, {
+                "start_time": start_time,
+                "kb_ids": self._kb_ids_param(knowledge_base_id),
+                "limit": limit,
+                "time_range": time_range,
+                "knowledge_base_id": knowledge_base_id
+            })
             
-            # 计算时间范围
-            start_time = self._get_start_time(time_range)
+            return result[0] if result else None
+        else:
+            # 如果没有数据库连接，使用内存存储
+            filtered_logs = self._filter_logs(self._get_search_logs_df(), start_time, knowledge_base_id)
             
-            if self.conn:
-                # 从数据库获取数据
-                with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    # 查询热门查询
-                    query = """
-                    SELECT query, COUNT(*) as count
-                    FROM search_logs
-                    WHERE timestamp >= %s
-                    """
-                    params = [start_time]
-                    
-                    if knowledge_base_id:
-                        query += " AND knowledge_base_ids @> %s"
-                        params.append(json.dumps([knowledge_base_id]))
-                    
-                    query += " GROUP BY query ORDER BY count DESC LIMIT %s"
-                    params.append(limit)
-                    
-                    cur.execute(query, params)
-                    results = cur.fetchall()
-                    
-                    if not results:
-                        return self._get_mock_top_queries(time_range, limit, knowledge_base_id)
-                    
-                    # 转换为列表
-                    queries = []
-                    for result in results:
-                        queries.append({
-                            "query": result['query'],
-                            "count": result['count']
-                        })
-                    
-                    top_queries = TopQueries(
-                        queries=queries,
-                        time_range=time_range,
-                        knowledge_base_id=knowledge_base_id
-                    )
-                    
-                    # 缓存结果
-                    if self.redis:
-                        await self.redis.set(
-                            cache_key, 
-                            json.dumps(top_queries.dict()), 
-                            ex=300  # 缓存5分钟
-                        )
-                    
-                    return top_queries
-            else:
-                # 如果没有数据库连接，使用内存存储
-                filtered_logs = self._filter_logs(self.search_logs, start_time, knowledge_base_id)
-                
-                # 如果没有日志，创建一些模拟数据
-                if not filtered_logs:
-                    return self._get_mock_top_queries(time_range, limit, knowledge_base_id)
-                
-                # 统计查询次数
-                query_counts = {}
-                for log in filtered_logs:
-                    query = log.get("query", "")
-                    query_counts[query] = query_counts.get(query, 0) + 1
-                
-                # 转换为列表并排序
-                queries = []
-                for query, count in query_counts.items():
-                    queries.append({
-                        "query": query,
-                        "count": count
-                    })
-                
-                # 按次数降序排序并限制数量
-                queries.sort(key=lambda x: x["count"], reverse=True)
-                queries = queries[:limit]
-                
-                return TopQueries(
-                    queries=queries,
-                    time_range=time_range,
-                    knowledge_base_id=knowledge_base_id
-                )
+            # 没有日志，由cached_result返回模拟数据
+            if filtered_logs.empty:
+                return None
             
-        except Exception as e:
-            logger.error(f"Get top queries error: {str(e)}", exc_info=True)
-            # 如果出错，返回模拟数据
-            return self._get_mock_top_queries(time_range, limit, knowledge_base_id)
+            # 统计查询次数，只取次数最多的limit个
+            query_counts = filtered_logs["query"].value_counts().head(limit)
+            queries = [{"query": query, "count": count} for query, count in zip(query_counts.index.tolist(), query_counts.tolist())]
+            
+            return TopQueries(
+                queries=queries,
+                time_range=time_range,
+                knowledge_base_id=knowledge_base_id
+            )
     
+    @cached_result("user_behavior", UserBehaviorListAdapter, mock="_get_mock_user_behavior", load=_load_cached_user_behavior)
     async def get_user_behavior(self, time_range: str, limit: int = 100, knowledge_base_id: Optional[str] = None) -> List[UserBehaviorRecord]:
         """获取用户行为记录"""
-        try:
-            # 尝试从缓存获取
-            cache_key = f"user_behavior:{time_range}:{knowledge_base_id or 'all'}:{limit}"
-            if self.redis:
-                cached_data = await self.redis.get(cache_key)
-                if cached_data:
-                    try:
-                        cached_records = json.loads(cached_data)
-                        return [UserBehaviorRecord(**record) for record in cached_records]
-                    except Exception as e:
-                        logger.warning(f"Failed to parse cached user behavior: {str(e)}")
+        # 计算时间范围
+        start_time = self._get_start_time(time_range)
+        
+        if self.pool:
+            # 从数据库获取数据
+            # 查询用户行为记录（JSON文本，由cached_result解析并原样缓存）
+            result = await self._fetchone(USER_BEHAVIOR_SQL, {
+                "start_time": start_time,
+                "kb_ids": self._kb_ids_param(knowledge_base_id),
+                "limit": limit
+            })
             
-            # 计算时间范围
-            start_time = self._get_start_time(time_range)
+            return result[0] if result else None
+        else:
+            # 如果没有数据库连接，使用内存存储
+            filtered_logs = self._filter_logs(self._get_search_logs_df(), start_time, knowledge_base_id)
             
-            if self.conn:
-                # 从数据库获取数据
-                with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    # 查询用户行为记录
-                    query = """
-                    SELECT s.id, s.user_id, s.query, s.strategy, s.response_time, 
-                           s.knowledge_base_ids, s.result_count, s.timestamp,
-                           f.feedback_type
-                    FROM search_logs s
-                    LEFT JOIN feedback_logs f ON s.id = f.search_id
-                    WHERE s.timestamp >= %s
-                    """
-                    params = [start_time]
-                    
-                    if knowledge_base_id:
-                        query += " AND s.knowledge_base_ids @> %s"
-                        params.append(json.dumps([knowledge_base_id]))
-                    
-                    query += " ORDER BY s.timestamp DESC LIMIT %s"
-                    params.append(limit)
-                    
-                    cur.execute(query, params)
-                    results = cur.fetchall()
-                    
-                    if not results:
-                        return self._get_mock_user_behavior(time_range, limit, knowledge_base_id)
-                    
-                    # 转换为UserBehaviorRecord格式
-                    records = []
-                    for result in results:
-                        record = UserBehaviorRecord(
-                            id=result['id'],
-                            user_id=result['user_id'],
-                            query=result['query'],
-                            strategy=result['strategy'],
-                            response_time=result['response_time'] * 1000,  # 转换为毫秒
-                            knowledge_base_ids=result['knowledge_base_ids'],
-                            result_count=result['result_count'],
-                            feedback=result['feedback_type'],
-                            timestamp=result['timestamp']
-                        )
-                        records.append(record)
-                    
-                    # 缓存结果
-                    if self.redis:
-                        await self.redis.set(
-                            cache_key, 
-                            json.dumps([record.dict() for record in records]), 
-                            ex=300  # 缓存5分钟
-                        )
-                    
-                    return records
-            else:
-                # 如果没有数据库连接，使用内存存储
-                filtered_logs = self._filter_logs(self.search_logs, start_time, knowledge_base_id)
-                
-                # 如果没有日志，创建一些模拟数据
-                if not filtered_logs:
-                    return self._get_mock_user_behavior(time_range, limit, knowledge_base_id)
-                
-                # 转换为UserBehaviorRecord格式
-                records = []
-                for log in filtered_logs:
-                    # 查找对应的反馈
-                    feedback = None
-                    for fb_log in self.feedback_logs:
-                        if fb_log.get("search_id") == log.get("id"):
-                            feedback = fb_log.get("feedback_type")
-                            break
-                    
-                    record = UserBehaviorRecord(
-                        id=log.get("id", str(uuid.uuid4())),
-                        user_id=log.get("user_id"),
-                        query=log.get("query", ""),
-                        strategy=log.get("strategy", "auto"),
-                        response_time=log.get("response_time", 0) * 1000,  # 转换为毫秒
-                        knowledge_base_ids=log.get("knowledge_base_ids", []),
-                        result_count=log.get("result_count", 0),
-                        feedback=feedback,
-                        timestamp=log.get("timestamp", datetime.now())
-                    )
-                    records.append(record)
-                
-                # 按时间降序排序并限制数量
-                records.sort(key=lambda x: x.timestamp, reverse=True)
-                records = records[:limit]
-                
-                return records
+            # 没有日志，由cached_result返回模拟数据
+            if filtered_logs.empty:
+                return None
             
-        except Exception as e:
-            logger.error(f"Get user behavior error: {str(e)}", exc_info=True)
-            # 如果出错，返回模拟数据
-            return self._get_mock_user_behavior(time_range, limit, knowledge_base_id)
+            # 按时间降序取前limit条（部分选择，不对全部日志排序）
+            latest_logs = filtered_logs.nlargest(limit, "timestamp")
+            
+            # 关联每条搜索的第一条反馈
+            feedback_logs = self._get_feedback_logs_df().drop_duplicates("search_id")
+            feedback_by_search = dict(zip(feedback_logs["search_id"].tolist(), feedback_logs["feedback_type"].tolist()))
+            
+            # 转换为UserBehaviorRecord格式
+            records = []
+            for log in latest_logs.to_dict("records"):
+                record = UserBehaviorRecord(
+                    id=log["id"],
+                    user_id=log["user_id"],
+                    query=log["query"],
+                    strategy=log["strategy"],
+                    response_time=log["response_time"] * 1000,  # 转换为毫秒
+                    knowledge_base_ids=log["knowledge_base_ids"],
+                    result_count=log["result_count"],
+                    feedback=feedback_by_search.get(log["id"]),
+                    timestamp=log["timestamp"].to_pydatetime()
+                )
+                records.append(record)
+            
+            return records
+    
+    async def get_dashboard(self, time_range: str, knowledge_base_id: Optional[str] = None, top_queries_limit: int = 10, user_behavior_limit: int = 100) -> DashboardData:
+        """获取分析仪表盘数据
+        
+        并发获取仪表盘所需的全部指标，前端只需一次请求；
+        各指标的缓存通过一次MGET读取，未命中时重新计算的结果通过一次管道写回
+        """
+        cache = None
+        if self.redis:
+            keys = [
+                self._cache_key("performance_metrics", time_range, knowledge_base_id),
+                self._cache_key("search_trends", time_range, knowledge_base_id),
+                self._cache_key("strategy_distribution", time_range, knowledge_base_id),
+                self._cache_key("feedback_distribution", time_range, knowledge_base_id),
+                self._cache_key("top_queries", time_range, knowledge_base_id, top_queries_limit),
+                self._cache_key("user_behavior", time_range, knowledge_base_id, user_behavior_limit)
+            ]
+            redis_keys = [redis_key for key in keys for redis_key in self._cache_redis_keys(key)]
+            try:
+                cache = CacheBatch(values=dict(zip(redis_keys, await self.redis.mget(redis_keys))))
+            except Exception as e:
+                logger.warning("Failed to read cached dashboard data: %s", e)
+        
+        (
+            performance,
+            search_trends,
+            search_strategies,
+            feedback,
+            top_queries,
+            user_behavior
+        ) = await asyncio.gather(
+            self.get_performance_metrics(time_range, knowledge_base_id, cache=cache),
+            self.get_search_trends(time_range, knowledge_base_id, cache=cache),
+            self.get_search_strategy_distribution(time_range, knowledge_base_id, cache=cache),
+            self.get_feedback_distribution(time_range, knowledge_base_id, cache=cache),
+            self.get_top_queries(time_range, top_queries_limit, knowledge_base_id, cache=cache),
+            self.get_user_behavior(time_range, user_behavior_limit, knowledge_base_id, cache=cache)
+        )
+        
+        if cache is not None:
+            try:
+                await self._cache_set_many(cache.pending)
+            except Exception as e:
+                logger.warning("Failed to cache dashboard data: %s", e)
+        
+        return DashboardData(
+            performance=performance,
+            search_trends=search_trends,
+            search_strategies=search_strategies,
+            feedback=feedback,
+            top_queries=top_queries,
+            user_behavior=user_behavior,
+            time_range=time_range,
+            knowledge_base_id=knowledge_base_id
+        )
     
     def _get_start_time(self, time_range: str) -> datetime:
-        """根据时间范围计算开始时间"""
-        now = datetime.now()
+        """根据时间范围计算开始时间
+        
+        当前时间取整到分钟，同一分钟内的请求得到相同的开始时间，并共用按开始时间缓存的时间间隔
+        """
+        return self._start_time_for_minute(time_range, int(time.time()) // 60)
+    
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _start_time_for_minute(time_range: str, minute: int) -> datetime:
+        """计算指定分钟（Unix时间戳 // 60）对应的开始时间，分钟变化后旧结果自然不再命中"""
+        now = datetime.fromtimestamp(minute * 60)
         if time_range == "day":
             return now - timedelta(days=1)
         elif time_range == "week":
@@ -799,66 +1309,86 @@ class AnalyticsService:
         else:
             return now - timedelta(days=7)  # 默认为一周
     
-    def _filter_logs(self, logs: List[Dict[str, Any]], start_time: datetime, knowledge_base_id: Optional[str] = None) -> List[Dict[str, Any]]:
-        """过滤日志"""
-        filtered = [log for log in logs if log.get("timestamp", datetime.now()) >= start_time]
+    def _get_search_logs_df(self) -> pd.DataFrame:
+        """获取内存中的搜索日志（先合并新追加的日志）"""
+        if self.search_logs:
+            for position, log in enumerate(self.search_logs, len(self._search_logs_df)):
+                for kb_id in log["knowledge_base_ids"]:
+                    self._search_log_kb_positions.setdefault(kb_id, []).append(position)
+            new_logs = pd.DataFrame(self.search_logs, columns=SEARCH_LOG_COLUMNS)
+            self._search_logs_df = new_logs if self._search_logs_df.empty else pd.concat([self._search_logs_df, new_logs], ignore_index=True)
+            self.search_logs = []
+        return self._search_logs_df
+    
+    def _get_feedback_logs_df(self) -> pd.DataFrame:
+        """获取内存中的反馈日志（先合并新追加的日志）"""
+        if self.feedback_logs:
+            new_logs = pd.DataFrame(self.feedback_logs, columns=FEEDBACK_LOG_COLUMNS)
+            self._feedback_logs_df = new_logs if self._feedback_logs_df.empty else pd.concat([self._feedback_logs_df, new_logs], ignore_index=True)
+            self.feedback_logs = []
+        return self._feedback_logs_df
+    
+    def _filter_logs(self, logs: pd.DataFrame, start_time: datetime, knowledge_base_id: Optional[str] = None) -> pd.DataFrame:
+        """过滤日志
         
+        按知识库过滤时通过倒排索引直接取出引用该知识库的搜索日志，不逐行检查知识库ID列表；
+        时间戳列以int64纳秒存储（datetime64），时间过滤是一次向量化的整数比较
+        """
         if knowledge_base_id:
-            filtered = [log for log in filtered if knowledge_base_id in log.get("knowledge_base_ids", [])]
-            
-        return filtered
+            # 反馈日志不含知识库ID，按知识库过滤时没有匹配的反馈（与原先按字典过滤的行为一致）
+            if "knowledge_base_ids" not in logs.columns:
+                return logs.iloc[0:0]
+            logs = logs.take(self._search_log_kb_positions.get(knowledge_base_id, []))
+        
+        return logs[logs["timestamp"] >= start_time] if not logs.empty else logs
     
-    def _get_time_intervals(self, time_range: str, start_time: datetime) -> List[tuple]:
-        """获取时间间隔"""
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _get_time_intervals(time_range: str, start_time: datetime) -> Tuple[tuple, ...]:
+        """获取时间间隔
+        
+        按时间范围和开始时间缓存（开始时间按分钟取整，同一分钟内的请求共用同一结果），返回不可变的元组
+        """
+        return tuple(AnalyticsService._build_time_intervals(time_range, start_time))
+    
+    @staticmethod
+    def _build_time_intervals(time_range: str, start_time: datetime) -> List[tuple]:
+        """生成时间间隔
+        
+        用pandas按固定步长一次生成全部间隔起点并批量格式化标签，间隔终点不超过当前时间
+        """
         now = datetime.now()
-        intervals = []
         
         if time_range == "day":
             # 每小时一个间隔
-            for i in range(24):
-                interval_start = start_time + timedelta(hours=i)
-                interval_end = interval_start + timedelta(hours=1)
-                if interval_end > now:
-                    interval_end = now
-                label = interval_start.strftime("%H:%M")
-                intervals.append((interval_start, interval_end, label))
-                
-        elif time_range == "week":
+            step = pd.Timedelta(hours=1)
+            starts = pd.date_range(start_time, periods=24, freq=step)
+            label_format = "%H:%M"
+        elif time_range in ("week", "month"):
             # 每天一个间隔
-            for i in range(7):
-                interval_start = start_time + timedelta(days=i)
-                interval_end = interval_start + timedelta(days=1)
-                if interval_end > now:
-                    interval_end = now
-                label = interval_start.strftime("%m-%d")
-                intervals.append((interval_start, interval_end, label))
-                
-        elif time_range == "month":
-            # 每天一个间隔
-            days = (now - start_time).days
-            for i in range(days):
-                interval_start = start_time + timedelta(days=i)
-                interval_end = interval_start + timedelta(days=1)
-                if interval_end > now:
-                    interval_end = now
-                label = interval_start.strftime("%m-%d")
-                intervals.append((interval_start, interval_end, label))
-                
+            step = pd.Timedelta(days=1)
+            days = 7 if time_range == "week" else (now - start_time).days
+            starts = pd.date_range(start_time, periods=days, freq=step)
+            label_format = "%m-%d"
         elif time_range == "year":
-            # 每月一个间隔
-            current_month = start_time.replace(day=1)
-            while current_month < now:
-                next_month = current_month.replace(day=28) + timedelta(days=4)
-                next_month = next_month.replace(day=1)
-                interval_end = next_month if next_month < now else now
-                label = current_month.strftime("%Y-%m")
-                intervals.append((current_month, interval_end, label))
-                current_month = next_month
+            # 每月一个间隔（从开始时间所在月的1日起）
+            step = pd.DateOffset(months=1)
+            starts = pd.date_range(start_time.replace(day=1), end=now, freq=step)
+            starts = starts[starts < now]
+            label_format = "%Y-%m"
+        else:
+            return []
+        
+        ends = starts + step
+        ends = ends.where(ends < now, pd.Timestamp(now))
         
-        return intervals
+        return list(zip(starts.to_pydatetime(), ends.to_pydatetime(), starts.strftime(label_format)))
     
     # 以下是模拟数据生成方法
-    def _get_mock_performance_metrics(self, time_range: str, knowledge_base_id: Optional[str] = None) -> PerformanceMetrics:
+    # 数据库不可用时每个请求都会用到模拟数据，结果按参数缓存，返回的对象是共享的，调用方不应修改
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _get_mock_performance_metrics(time_range: str, knowledge_base_id: Optional[str] = None) -> PerformanceMetrics:
         """生成模拟性能指标"""
         return PerformanceMetrics(
             total_searches=150,
@@ -869,7 +1399,9 @@ class AnalyticsService:
             knowledge_base_id=knowledge_base_id
         )
     
-    def _get_mock_search_trends(self, time_range: str, knowledge_base_id: Optional[str] = None) -> SearchTrend:
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _get_mock_search_trends(time_range: str, knowledge_base_id: Optional[str] = None) -> SearchTrend:
         """生成模拟搜索趋势"""
         # 生成时间标签
         if time_range == "day":
@@ -900,7 +1432,9 @@ class AnalyticsService:
             knowledge_base_id=knowledge_base_id
         )
     
-    def _get_mock_strategy_distribution(self, time_range: str, knowledge_base_id: Optional[str] = None) -> SearchStrategyDistribution:
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _get_mock_strategy_distribution(time_range: str, knowledge_base_id: Optional[str] = None) -> SearchStrategyDistribution:
         """生成模拟策略分布"""
         return SearchStrategyDistribution(
             strategies=[
@@ -912,7 +1446,9 @@ class AnalyticsService:
             knowledge_base_id=knowledge_base_id
         )
     
-    def _get_mock_feedback_distribution(self, time_range: str, knowledge_base_id: Optional[str] = None) -> FeedbackDistribution:
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _get_mock_feedback_distribution(time_range: str, knowledge_base_id: Optional[str] = None) -> FeedbackDistribution:
         """生成模拟反馈分布"""
         return FeedbackDistribution(
             feedback_types=[
@@ -929,7 +1465,9 @@ class AnalyticsService:
             knowledge_base_id=knowledge_base_id
         )
     
-    def _get_mock_top_queries(self, time_range: str, limit: int, knowledge_base_id: Optional[str] = None) -> TopQueries:
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _get_mock_top_queries(time_range: str, limit: int, knowledge_base_id: Optional[str] = None) -> TopQueries:
         """生成模拟热门查询"""
         queries = [
             {"query": "如何配置知识库", "count": 45},
@@ -951,10 +1489,40 @@ class AnalyticsService:
         )
     
     def _get_mock_user_behavior(self, time_range: str, limit: int, knowledge_base_id: Optional[str] = None) -> List[UserBehaviorRecord]:
-        """生成模拟用户行为记录"""
+        """生成模拟用户行为记录
+        
+        记录内容按数量缓存，每次只复制记录并填入相对当前时间的时间戳（model_copy不做校验）
+        """
+        now = datetime.now()
+        return [
+            record.model_copy(update={"timestamp": now - timedelta(hours=i*2)})
+            for i, record in enumerate(self._mock_user_behavior_records(min(limit, 20)))
+        ]
+    
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _mock_user_behavior_records(count: int) -> Tuple[UserBehaviorRecord, ...]:
+        """生成模拟用户行为记录的内容（时间戳由调用方填入）"""
         records = []
         now = datetime.now()
         
+        for i in range(count):
+            timestamp = now - timedelta(hours=i*2)
+            record = UserBehaviorRecord(
+                id=f"search_{i}",
+                user_id=f"user{i%5 + 1:03d}",
+                query=f"模拟查询 {i+1}",
+                strategy=["semantic", "fulltext", "hybrid", "auto"][i % 4],
+                response_time=80 + (i % 5) * 10,  # 毫秒
+                knowledge_base_ids=["kb1", "kb2"] if i % 3 == 0 else ["kb1"],
+                result_count=5 + (i % 3),
+                feedback=["positive", "negative", None][i % 3],
+                timestamp=timestamp
+            )
+            records.append(record)
+        
+        return tuple(records)
+    
     async def log_search(self, 
                       user_id: Optional[str], 
                       query: str, 
@@ -968,26 +1536,21 @@ class AnalyticsService:
             search_id = str(uuid.uuid4())
             timestamp = datetime.now()
             
-            if self.conn:
-                # 写入数据库
-                with self.conn.cursor() as cur:
-                    cur.execute("""
-                    INSERT INTO search_logs 
-                    (id, user_id, query, strategy, response_time, knowledge_base_ids, result_count, cache_hit, timestamp) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        search_id, 
-                        user_id, 
-                        query, 
-                        strategy, 
-                        response_time, 
-                        json.dumps(knowledge_base_ids), 
-                        result_count, 
-                        cache_hit, 
-                        timestamp
-                    ))
-                    self.conn.commit()
-                    logger.info(f"Logged search: {query} with strategy {strategy}")
+            if self.pool:
+                # 加入缓冲区，由后台任务批量写入数据库，不阻塞检索请求
+                self._search_log_buffer.append((
+                    search_id, 
+                    user_id, 
+                    query, 
+                    strategy, 
+                    response_time, 
+                    json.dumps(knowledge_base_ids), 
+                    result_count, 
+                    cache_hit, 
+                    timestamp
+                ))
+                if len(self._search_log_buffer) >= LOG_FLUSH_BATCH_SIZE and (self._flush_task is None or self._flush_task.done()):
+                    self._flush_task = asyncio.create_task(self.flush_search_logs())
             else:
                 # 使用内存存储
                 self.search_logs.append({
@@ -1005,7 +1568,7 @@ class AnalyticsService:
             return search_id
                 
         except Exception as e:
-            logger.error(f"Log search error: {str(e)}", exc_info=True)
+            logger.error("Log search error: %s", e, exc_info=settings.DEBUG)
             # 如果出错，仍然返回一个ID，以便前端可以继续工作
             return str(uuid.uuid4())
     
@@ -1020,37 +1583,48 @@ class AnalyticsService:
             feedback_id = str(uuid.uuid4())
             timestamp = datetime.now()
             
-            if self.conn:
+            if self.pool:
+                # 先写入缓冲的搜索日志，保证外键引用的搜索记录已存在
+                await self.flush_search_logs()
+                
                 # 写入数据库
-                with self.conn.cursor() as cur:
-                    cur.execute("""
-                    INSERT INTO feedback_logs 
-                    (id, search_id, user_id, feedback_type, rating, comment, timestamp) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        feedback_id, 
-                        search_id, 
-                        user_id, 
-                        feedback_type, 
-                        rating, 
-                        comment, 
-                        timestamp
-                    ))
-                    self.conn.commit()
-                    logger.info(f"Logged feedback: {feedback_type} for search {search_id}")
-                    
-                    # 清除相关缓存
-                    if self.redis:
-                        # 获取搜索记录以确定知识库ID
-                        cur.execute("SELECT knowledge_base_ids FROM search_logs WHERE id = %s", (search_id,))
-                        result = cur.fetchone()
-                        if result and result[0]:
-                            kb_ids = json.loads(result[0]) if isinstance(result[0], str) else result[0]
-                            # 清除所有相关缓存
-                            for kb_id in kb_ids + ['all']:
-                                for time_range in ['day', 'week', 'month', 'year']:
-                                    await self.redis.delete(f"performance_metrics:{time_range}:{kb_id}")
-                                    await self.redis.delete(f"feedback_distribution:{time_range}:{kb_id}")
+                params = (
+                    feedback_id, 
+                    search_id, 
+                    user_id, 
+                    feedback_type, 
+                    rating, 
+                    comment, 
+                    timestamp
+                )
+                if self._write_pool:
+                    insert = self._write_pool.execute(INSERT_FEEDBACK_LOG_SQL, *params)
+                else:
+                    insert = asyncio.to_thread(self._run_prepared, "insert_feedback_log", INSERT_FEEDBACK_LOG_SQL, params)
+                
+                if self.redis:
+                    # 写入反馈的同时查询搜索记录的知识库ID（用于清除相关缓存），两者互不依赖，并发执行
+                    _, result = await asyncio.gather(
+                        insert,
+                        self._fetchone("SELECT knowledge_base_ids FROM search_logs WHERE id = %s", (search_id,))
+                    )
+                else:
+                    await insert
+                    result = None
+                logger.info("Logged feedback: %s for search %s", feedback_type, search_id)
+                
+                # 清除相关缓存
+                if result and result[0]:
+                    kb_ids = result[0]
+                    kb_ids = json.loads(kb_ids) if isinstance(kb_ids, str) else kb_ids
+                    # 清除相关缓存的新鲜标记：下次读取仍返回旧值，并在后台重新计算
+                    # DEL支持多个键，一次往返清除全部
+                    await self.redis.delete(*[
+                        self._cache_redis_keys(self._cache_key(name, time_range, kb_id))[1]
+                        for name in ("performance_metrics", "feedback_distribution")
+                        for kb_id in kb_ids + [None]
+                        for time_range in ('day', 'week', 'month', 'year')
+                    ])
             else:
                 # 使用内存存储
                 self.feedback_logs.append({
@@ -1066,23 +1640,6 @@ class AnalyticsService:
             return feedback_id
                 
         except Exception as e:
-            logger.error(f"Log feedback error: {str(e)}", exc_info=True)
+            logger.error("Log feedback error: %s", e, exc_info=settings.DEBUG)
             # 如果出错，仍然返回一个ID，以便前端可以继续工作
             return str(uuid.uuid4())
-        
-        for i in range(min(limit, 20)):
-            timestamp = now - timedelta(hours=i*2)
-            record = UserBehaviorRecord(
-                id=f"search_{i}",
-                user_id=f"user{i%5 + 1:03d}",
-                query=f"模拟查询 {i+1}",
-                strategy=["semantic", "fulltext", "hybrid", "auto"][i % 4],
-                response_time=80 + (i % 5) * 10,  # 毫秒
-                knowledge_base_ids=["kb1", "kb2"] if i % 3 == 0 else ["kb1"],
-                result_count=5 + (i % 3),
-                feedback=["positive", "negative", None][i % 3],
-                timestamp=timestamp
-            )
-            records.append(record)
-        
-        return records
\ No newline at end of file
@@ -1,17 +1,29 @@
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import json
 import asyncio
-import pickle
+import time
 from datetime import datetime, timedelta
 
+import orjson
 import redis
 from redis.asyncio import Redis
+from pydantic import BaseModel
 
 from config import settings
+from utils.compression import compress_value, decompress_value
 
 logger = logging.getLogger("retrieval")
 
+# 缓存统计结果的有效期（秒），吸收仪表盘轮询的突发请求
+STATS_TTL = 1.0
+
+def _orjson_default(obj: Any) -> Any:
+    """orjson无法原生序列化的类型（datetime、numpy数组等由orjson直接处理）"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
 class CacheService:
     def __init__(self):
         # 连接到Redis
@@ -21,15 +33,21 @@ class CacheService:
                 port=settings.REDIS_PORT,
                 db=settings.REDIS_DB,
                 password=settings.REDIS_PASSWORD,
-                decode_responses=False  # 不自动解码，因为我们存储的是序列化对象
+                decode_responses=False  # 不自动解码，orjson直接读写字节
             )
-            logger.info(f"Connected to Redis at {settings.REDIS_HOST}:{settings.REDIS_PORT}")
+            logger.info("Connected to Redis at %s:%s", settings.REDIS_HOST, settings.REDIS_PORT)
         except Exception as e:
-            logger.error(f"Failed to connect to Redis: {str(e)}", exc_info=True)
+            logger.error("Failed to connect to Redis: %s", e, exc_info=settings.DEBUG)
             self.redis = None
+        
+        # 最近一次的缓存统计结果：(monotonic时间, 统计信息)
+        self._stats: Optional[Tuple[float, Dict[str, Any]]] = None
     
     async def get(self, key: str) -> Optional[Any]:
-        """从缓存获取值"""
+        """从缓存获取值
+        
+        值以JSON（orjson）格式存储，较大的值经zstd压缩，返回的是基础类型（dict/list等），Pydantic模型需由调用方重新构建
+        """
         try:
             if not self.redis or not settings.REDIS_CACHE_EXPIRE:
                 return None
@@ -41,13 +59,13 @@ class CacheService:
                 
             # 反序列化
             try:
-                return pickle.loads(cached_data)
+                return orjson.loads(decompress_value(cached_data))
             except Exception as e:
-                logger.error(f"Cache deserialization error: {str(e)}", exc_info=True)
+                logger.error("Cache deserialization error: %s", e, exc_info=settings.DEBUG)
                 return None
                 
         except Exception as e:
-            logger.error(f"Cache get error: {str(e)}", exc_info=True)
+            logger.error("Cache get error: %s", e, exc_info=settings.DEBUG)
             return None
     
     async def set(self, key: str, value: Any, expire: int = None) -> bool:
@@ -58,9 +76,9 @@ class CacheService:
                 
             # 序列化值
             try:
-                serialized_data = pickle.dumps(value)
+                serialized_data = compress_value(orjson.dumps(value, default=_orjson_default, option=orjson.OPT_SERIALIZE_NUMPY))
             except Exception as e:
-                logger.error(f"Cache serialization error: {str(e)}", exc_info=True)
+                logger.error("Cache serialization error: %s", e, exc_info=settings.DEBUG)
                 return False
                 
             # 设置缓存
@@ -71,7 +89,40 @@ class CacheService:
             return True
                 
         except Exception as e:
-            logger.error(f"Cache set error: {str(e)}", exc_info=True)
+            logger.error("Cache set error: %s", e, exc_info=settings.DEBUG)
+            return False
+    
+    async def get_hash(self, key: str) -> Optional[Dict[bytes, bytes]]:
+        """从缓存获取原始字节字段（不做反序列化）"""
+        try:
+            if not self.redis or not settings.REDIS_CACHE_EXPIRE:
+                return None
+                
+            cached_data = await self.redis.hgetall(key)
+            return cached_data or None
+                
+        except Exception as e:
+            logger.error("Cache get error: %s", e, exc_info=settings.DEBUG)
+            return None
+    
+    async def set_hash(self, key: str, mapping: Dict[str, Any], expire: int = None) -> bool:
+        """以原始字节字段写入缓存（不做序列化）"""
+        try:
+            if not self.redis or not settings.REDIS_CACHE_EXPIRE:
+                return False
+                
+            if expire is None:
+                expire = settings.REDIS_CACHE_EXPIRE
+            
+            # 写入和设置过期时间在同一个事务中完成
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, expire)
+                await pipe.execute()
+            return True
+                
+        except Exception as e:
+            logger.error("Cache set error: %s", e, exc_info=settings.DEBUG)
             return False
     
     async def delete(self, key: str) -> bool:
@@ -84,7 +135,7 @@ class CacheService:
             return True
                 
         except Exception as e:
-            logger.error(f"Cache delete error: {str(e)}", exc_info=True)
+            logger.error("Cache delete error: %s", e, exc_info=settings.DEBUG)
             return False
     
     async def clear_all(self) -> bool:
@@ -97,33 +148,42 @@ class CacheService:
             return True
                 
         except Exception as e:
-            logger.error(f"Cache clear error: {str(e)}", exc_info=True)
+            logger.error("Cache clear error: %s", e, exc_info=settings.DEBUG)
             return False
     
     async def get_stats(self) -> Dict[str, Any]:
-        """获取缓存统计信息"""
+        """获取缓存统计信息
+        
+        键数量取自INFO的Keyspace部分，一次往返获取全部信息；结果在STATS_TTL内复用
+        """
         try:
             if not self.redis:
                 return {"connected": False}
+            
+            now = time.monotonic()
+            if self._stats and now - self._stats[0] < STATS_TTL:
+                return self._stats[1]
                 
-            # 获取Redis信息
+            # 获取Redis信息（默认部分已包含Keyspace）
             info = await self.redis.info()
             
             # 计算缓存命中率
             hits = info.get("keyspace_hits", 0)
-            misses = info.get("keyspace_misses", 0)
-            hit_rate = hits / (hits + misses) if (hits + misses) > 0 else 0
+            lookups = hits + info.get("keyspace_misses", 0)
+            hit_rate = hits / lookups if lookups else 0
             
-            return {
+            stats = {
                 "connected": True,
-                "total_keys": await self.redis.dbsize(),
+                "total_keys": info.get(f"db{settings.REDIS_DB}", {}).get("keys", 0),
                 "hit_rate": hit_rate,
                 "memory_used": info.get("used_memory_human", "unknown"),
                 "uptime": info.get("uptime_in_seconds", 0)
             }
+            self._stats = (now, stats)
+            return stats
                 
         except Exception as e:
-            logger.error(f"Cache stats error: {str(e)}", exc_info=True)
+            logger.error("Cache stats error: %s", e, exc_info=settings.DEBUG)
             return {"connected": False, "error": str(e)}
     
     async def close(self):
@@ -3,67 +3,183 @@ from typing import List, Dict, Any, Optional
 import uuid
 from datetime import datetime
 import json
+import asyncio
 
-import psycopg2
-from psycopg2.extras import RealDictCursor
+# 反馈读写使用asyncpg连接池，未安装时使用内存存储作为备用
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
 
-from models.feedback import Feedback
+from models.feedback import Feedback, POSITIVE_FEEDBACK_TYPES, NEGATIVE_FEEDBACK_TYPES
 from services.analytics_service import AnalyticsService
+from services.cache_service import CacheService
 from config import settings
 
 logger = logging.getLogger("retrieval")
 
+# 按结果统计反馈：FILTER只统计符合条件的行，读取的列都在idx_feedbacks_result_id索引中，可以只扫描索引
+FEEDBACK_STATS_SQL = """
+SELECT 
+    COUNT(*) as total,
+    COUNT(*) FILTER (WHERE feedback_type = ANY($2::text[])) as positive,
+    COUNT(*) FILTER (WHERE feedback_type = ANY($3::text[])) as negative,
+    AVG(rating) as avg_rating
+FROM feedbacks
+WHERE result_id = $1
+"""
+
+# 反馈统计的缓存时间（秒），结果的反馈有变化时立即清除；统计口径变化时递增缓存键的版本前缀
+STATS_CACHE_TTL = 60
+
+# 确保反馈表索引时持有的会话级咨询锁ID
+ENSURE_INDEXES_LOCK_ID = 7263002
+
+# 反馈表的列（缓冲区中每行的字段顺序）
+FEEDBACK_COLUMNS = ("id", "result_id", "feedback_type", "rating", "comment", "user_id", "created_at")
+
+# 反馈先写入缓冲区，满FLUSH_BATCH_SIZE条或每隔FLUSH_INTERVAL秒批量写入一次（读取反馈前也会先写入）
+FLUSH_BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+# 写入失败的反馈放回缓冲区，下次写入时重试；缓冲区最多保留MAX_BUFFERED_FEEDBACKS条，超出时丢弃最早的反馈
+MAX_BUFFERED_FEEDBACKS = 50000
+
 class FeedbackService:
-    def __init__(self):
-        # 连接到PostgreSQL数据库
+    def __init__(self, analytics_service: Optional[AnalyticsService] = None, cache_service: Optional[CacheService] = None):
+        # 反馈读写使用的asyncpg连接池，由应用启动时调用init_pool创建；未创建或连接失败时使用内存存储作为备用
+        self.pool = None
+        self.feedbacks = []
+        
+        # 待批量写入的反馈，写入时加锁，保证flush_feedbacks返回时此前的反馈都已提交
+        self._feedback_buffer: List[tuple] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        
+        # 初始化分析服务（与检索服务共用时，记录反馈前可写入尚在缓冲区中的搜索日志）
+        self.analytics_service = analytics_service or AnalyticsService()
+        
+        # 反馈统计的缓存（与检索服务共用同一个Redis连接）
+        self.cache_service = cache_service or CacheService()
+    
+    async def init_pool(self):
+        """创建asyncpg连接池并确保反馈表存在（需在事件循环中调用）
+        
+        各请求从连接池借用连接并发执行，查询不阻塞事件循环；每条语句自动提交
+        """
+        if self.pool or asyncpg is None:
+            return
         try:
-            self.conn = psycopg2.connect(
-                dbname=settings.POSTGRES_DB,
+            self.pool = await asyncpg.create_pool(
+                database=settings.POSTGRES_DB,
                 user=settings.POSTGRES_USER,
                 password=settings.POSTGRES_PASSWORD,
                 host=settings.POSTGRES_HOST,
-                port=settings.POSTGRES_PORT
+                port=settings.POSTGRES_PORT,
+                min_size=4,
+                max_size=20
             )
-            logger.info(f"Connected to PostgreSQL at {settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}")
-            
-            # 确保必要的表存在
-            self._ensure_tables()
-            
-            # 初始化分析服务
-            self.analytics_service = AnalyticsService()
-            
+            logger.info("Connected to PostgreSQL at %s:%s", settings.POSTGRES_HOST, settings.POSTGRES_PORT)
         except Exception as e:
-            logger.error(f"Database connection error: {str(e)}", exc_info=True)
-            # 如果连接失败，使用内存存储作为备用
-            self.conn = None
-            self.feedbacks = []
+            logger.error("Database connection error: %s", e, exc_info=settings.DEBUG)
+            return
+        
+        # 确保必要的表存在
+        await self._ensure_tables()
+    
+    async def flush_feedbacks(self):
+        """将缓冲区中的反馈写入数据库（二进制COPY，整批在一个异步提交的事务中写入），写入失败的反馈留在缓冲区中重试"""
+        async with self._flush_lock:
+            rows, self._feedback_buffer = self._feedback_buffer, []
+            if not rows:
+                return
+            try:
+                async with self.pool.acquire() as conn:
+                    async with conn.transaction():
+                        # 反馈属于日志类数据，崩溃时丢失最近几毫秒的提交可以接受：本事务异步提交，不等待WAL刷盘
+                        await conn.execute("SET LOCAL synchronous_commit TO OFF")
+                        await conn.copy_records_to_table("feedbacks", records=rows, columns=FEEDBACK_COLUMNS)
+                logger.debug("Flushed %s feedbacks", len(rows))
+            except Exception as e:
+                logger.error("Flush feedbacks error: %s", e, exc_info=settings.DEBUG)
+                # 整批事务已回滚，放回缓冲区头部（保持提交顺序），下次写入时重试
+                self._feedback_buffer[:0] = rows
+                dropped = len(self._feedback_buffer) - MAX_BUFFERED_FEEDBACKS
+                if dropped > 0:
+                    del self._feedback_buffer[:dropped]
+                    logger.error("Feedback buffer full, dropped %s feedbacks", dropped)
+    
+    async def run_flush(self):
+        """后台定时写入缓冲的反馈（由应用启动时创建的任务运行）"""
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush_feedbacks()
+    
+    @staticmethod
+    def _stats_cache_key(result_id: str) -> str:
+        """反馈统计的缓存键"""
+        return f"v2:feedback:stats:{result_id}"
+    
+    async def _buffer_feedback(self, row: tuple):
+        """加入缓冲区，攒满一批时立即在后台写入；然后清除该结果的反馈统计缓存
+        
+        之后的统计请求会先写入缓冲区再查询，重新计算的结果包含这条反馈
+        """
+        self._feedback_buffer.append(row)
+        if len(self._feedback_buffer) >= FLUSH_BATCH_SIZE and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush_feedbacks())
+        await self.cache_service.delete(self._stats_cache_key(row[1]))
+    
+    async def close(self):
+        """关闭连接池"""
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
             
-    def _ensure_tables(self):
+    async def _ensure_tables(self):
         """确保必要的数据库表存在"""
         try:
-            with self.conn.cursor() as cur:
-                # 创建反馈表
-                cur.execute("""
-                CREATE TABLE IF NOT EXISTS feedbacks (
-                    id VARCHAR(36) PRIMARY KEY,
-                    result_id VARCHAR(36) NOT NULL,
-                    feedback_type VARCHAR(20) NOT NULL,
-                    rating FLOAT,
-                    comment TEXT,
-                    user_id VARCHAR(36),
-                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-                )
-                """)
-                
-                self.conn.commit()
-                logger.info("Feedback table ensured")
+            # 创建反馈表
+            await self.pool.execute("""
+            CREATE TABLE IF NOT EXISTS feedbacks (
+                id VARCHAR(36) PRIMARY KEY,
+                result_id VARCHAR(36) NOT NULL,
+                feedback_type VARCHAR(20) NOT NULL,
+                rating FLOAT,
+                comment TEXT,
+                user_id VARCHAR(36),
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """)
+            logger.info("Feedback table ensured")
+            
+            # 按结果查询反馈（按时间倒序）和统计反馈都只按result_id过滤；INCLUDE统计用到的列，统计时不再访问表。
+            # 使用CONCURRENTLY创建，已有大量反馈时建索引不阻塞写入；创建失败或中断时会留下同名的失效索引，
+            # IF NOT EXISTS会跳过它，因此先删除失效索引再重建
+            async with self.pool.acquire() as conn:
+                # 多个worker同时启动时只由取得锁的worker创建，其他worker正在创建的索引同样是失效状态，不能被当作失效索引删除。
+                # 不等待锁：等待中的语句持有快照，CONCURRENTLY建索引要等所有旧快照结束，会与等待者互相等待形成死锁
+                if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", ENSURE_INDEXES_LOCK_ID):
+                    logger.info("Feedback index is being ensured by another worker, skipped")
+                    return
+                try:
+                    invalid = await conn.fetchval(
+                        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass('idx_feedbacks_result_id')"
+                    )
+                    if invalid:
+                        logger.warning("Dropping invalid index idx_feedbacks_result_id")
+                        await conn.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_feedbacks_result_id")
+                    await conn.execute("""
+                    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_feedbacks_result_id
+                    ON feedbacks (result_id, created_at DESC) INCLUDE (feedback_type, rating)
+                    """)
+                finally:
+                    await conn.execute("SELECT pg_advisory_unlock($1)", ENSURE_INDEXES_LOCK_ID)
                 
         except Exception as e:
-            logger.error(f"Ensure tables error: {str(e)}", exc_info=True)
-            self.conn.rollback()
+            logger.error("Ensure tables error: %s", e, exc_info=settings.DEBUG)
     
-    async def save_feedback(self, result_id: str, feedback_type: str, user_id: Optional[str] = None) -> Feedback:
-        """保存简单反馈（点赞/踩）"""
+    async def save_feedback(self, result_id: str, feedback_type: str, user_id: Optional[str] = None, search_id: Optional[str] = None) -> Feedback:
+        """保存简单反馈（点赞/踩），提供搜索ID时同时记录到反馈分析日志"""
         try:
             # 创建反馈对象
             feedback_id = str(uuid.uuid4())
@@ -78,36 +194,30 @@ class FeedbackService:
             )
             
             # 保存反馈到PostgreSQL数据库
-            if self.conn:
-                with self.conn.cursor() as cur:
-                    cur.execute("""
-                    INSERT INTO feedbacks (id, result_id, feedback_type, user_id, created_at)
-                    VALUES (%s, %s, %s, %s, %s)
-                    """, (feedback_id, result_id, feedback_type, user_id, created_at))
-                    self.conn.commit()
+            if self.pool:
+                # 加入缓冲区，由后台任务批量写入数据库
+                await self._buffer_feedback((feedback_id, result_id, feedback_type, None, None, user_id, created_at))
             else:
                 # 如果数据库连接失败，使用内存存储作为备用
                 self.feedbacks.append(feedback)
             
-            # 记录分析数据
-            await self.analytics_service.log_feedback(
-                feedback_id=feedback_id,
-                result_id=result_id,
-                feedback_type=feedback_type,
-                user_id=user_id
-            )
+            # 记录分析数据：反馈分析日志按外键关联搜索日志，结果ID不是搜索日志ID，没有搜索ID时不记录
+            if search_id:
+                await self.analytics_service.log_feedback(
+                    search_id=search_id,
+                    user_id=user_id,
+                    feedback_type=feedback_type
+                )
             
-            logger.info(f"Saved feedback: {feedback_type} for result {result_id}")
+            logger.info("Saved feedback: %s for result %s", feedback_type, result_id)
             return feedback
             
         except Exception as e:
-            logger.error(f"Save feedback error: {str(e)}", exc_info=True)
-            if self.conn:
-                self.conn.rollback()
+            logger.error("Save feedback error: %s", e, exc_info=settings.DEBUG)
             raise
     
-    async def save_detailed_feedback(self, result_id: str, rating: float, feedback_type: str, comment: Optional[str] = None, user_id: Optional[str] = None) -> Feedback:
-        """保存详细反馈（评分、类型和评论）"""
+    async def save_detailed_feedback(self, result_id: str, rating: float, feedback_type: str, comment: Optional[str] = None, user_id: Optional[str] = None, search_id: Optional[str] = None) -> Feedback:
+        """保存详细反馈（评分、类型和评论），提供搜索ID时同时记录到反馈分析日志"""
         try:
             # 创建反馈对象
             feedback_id = str(uuid.uuid4())
@@ -124,97 +234,99 @@ class FeedbackService:
             )
             
             # 保存反馈到PostgreSQL数据库
-            if self.conn:
-                with self.conn.cursor() as cur:
-                    cur.execute("""
-                    INSERT INTO feedbacks (id, result_id, feedback_type, rating, comment, user_id, created_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """, (feedback_id, result_id, feedback_type, rating, comment, user_id, created_at))
-                    self.conn.commit()
+            if self.pool:
+                # 加入缓冲区，由后台任务批量写入数据库
+                await self._buffer_feedback((feedback_id, result_id, feedback_type, rating, comment, user_id, created_at))
             else:
                 # 如果数据库连接失败，使用内存存储作为备用
                 self.feedbacks.append(feedback)
             
-            # 记录分析数据
-            await self.analytics_service.log_feedback(
-                feedback_id=feedback_id,
-                result_id=result_id,
-                feedback_type=feedback_type,
-                rating=rating,
-                comment=comment,
-                user_id=user_id
-            )
+            # 记录分析数据：反馈分析日志按外键关联搜索日志，结果ID不是搜索日志ID，没有搜索ID时不记录
+            if search_id:
+                await self.analytics_service.log_feedback(
+                    search_id=search_id,
+                    user_id=user_id,
+                    feedback_type=feedback_type,
+                    rating=rating,
+                    comment=comment
+                )
             
-            logger.info(f"Saved detailed feedback: {feedback_type} with rating {rating} for result {result_id}")
+            logger.info("Saved detailed feedback: %s with rating %s for result %s", feedback_type, rating, result_id)
             return feedback
             
         except Exception as e:
-            logger.error(f"Save detailed feedback error: {str(e)}", exc_info=True)
-            if self.conn:
-                self.conn.rollback()
+            logger.error("Save detailed feedback error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def get_feedback(self, result_id: str) -> List[Feedback]:
         """获取特定结果的所有反馈"""
         try:
             # 从PostgreSQL数据库查询
-            if self.conn:
-                with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute("""
-                    SELECT * FROM feedbacks
-                    WHERE result_id = %s
-                    ORDER BY created_at DESC
-                    """, (result_id,))
-                    
-                    rows = cur.fetchall()
-                    return [Feedback(**row) for row in rows]
+            if self.pool:
+                # 先写入缓冲的反馈，保证能读到刚提交的反馈
+                await self.flush_feedbacks()
+                rows = await self.pool.fetch("""
+                SELECT id, feedback_type, rating, comment, user_id, created_at FROM feedbacks
+                WHERE result_id = $1
+                ORDER BY created_at DESC
+                """, result_id)
+                
+                # 按列位置解包行，不按列名逐个读取
+                return [
+                    Feedback(
+                        id=feedback_id,
+                        result_id=result_id,
+                        feedback_type=feedback_type,
+                        rating=rating,
+                        comment=comment,
+                        user_id=user_id,
+                        created_at=created_at
+                    )
+                    for feedback_id, feedback_type, rating, comment, user_id, created_at in rows
+                ]
             else:
                 # 如果数据库连接失败，使用内存存储作为备用
                 return [f for f in self.feedbacks if f.result_id == result_id]
             
         except Exception as e:
-            logger.error(f"Get feedback error: {str(e)}", exc_info=True)
-            if self.conn:
-                self.conn.rollback()
+            logger.error("Get feedback error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def get_feedback_stats(self, result_id: str) -> Dict[str, Any]:
-        """获取特定结果的反馈统计信息"""
+        """获取特定结果的反馈统计信息（缓存STATS_CACHE_TTL秒，写入或删除该结果的反馈时清除）"""
         try:
-            if self.conn:
-                with self.conn.cursor() as cur:
-                    # 获取总数和正面/负面反馈数
-                    cur.execute("""
-                    SELECT 
-                        COUNT(*) as total,
-                        SUM(CASE WHEN feedback_type IN ('like', 'relevant', 'partially') THEN 1 ELSE 0 END) as positive,
-                        SUM(CASE WHEN feedback_type IN ('dislike', 'irrelevant', 'outdated', 'incomplete') THEN 1 ELSE 0 END) as negative,
-                        AVG(rating) as avg_rating
-                    FROM feedbacks
-                    WHERE result_id = %s
-                    """, (result_id,))
-                    
-                    result = cur.fetchone()
-                    total = result[0] or 0
-                    positive = result[1] or 0
-                    negative = result[2] or 0
-                    avg_rating = result[3]
-                    
-                    return {
-                        "total": total,
-                        "positive": positive,
-                        "negative": negative,
-                        "positive_rate": positive / total if total > 0 else 0,
-                        "avg_rating": avg_rating
-                    }
+            if self.pool:
+                cache_key = self._stats_cache_key(result_id)
+                cached_stats = await self.cache_service.get(cache_key)
+                if cached_stats is not None:
+                    return cached_stats
+                
+                await self.flush_feedbacks()
+                # 获取总数和正面/负面反馈数
+                result = await self.pool.fetchrow(FEEDBACK_STATS_SQL, result_id, POSITIVE_FEEDBACK_TYPES, NEGATIVE_FEEDBACK_TYPES)
+                
+                total = result[0] or 0
+                positive = result[1] or 0
+                negative = result[2] or 0
+                avg_rating = result[3]
+                
+                stats = {
+                    "total": total,
+                    "positive": positive,
+                    "negative": negative,
+                    "positive_rate": positive / total if total > 0 else 0,
+                    "avg_rating": avg_rating
+                }
+                await self.cache_service.set(cache_key, stats, STATS_CACHE_TTL)
+                return stats
             else:
                 # 如果数据库连接失败，使用内存存储作为备用
                 feedbacks = await self.get_feedback(result_id)
                 
                 # 计算统计信息
                 total = len(feedbacks)
-                positive = sum(1 for f in feedbacks if f.feedback_type in ["like", "relevant", "partially"])
-                negative = sum(1 for f in feedbacks if f.feedback_type in ["dislike", "irrelevant", "outdated", "incomplete"])
+                positive = sum(1 for f in feedbacks if f.feedback_type in POSITIVE_FEEDBACK_TYPES)
+                negative = sum(1 for f in feedbacks if f.feedback_type in NEGATIVE_FEEDBACK_TYPES)
                 avg_rating = sum(f.rating for f in feedbacks if f.rating is not None) / sum(1 for f in feedbacks if f.rating is not None) if any(f.rating is not None for f in feedbacks) else None
                 
                 return {
@@ -226,26 +338,24 @@ class FeedbackService:
                 }
             
         except Exception as e:
-            logger.error(f"Get feedback stats error: {str(e)}", exc_info=True)
-            if self.conn:
-                self.conn.rollback()
+            logger.error("Get feedback stats error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def delete_feedback(self, feedback_id: str) -> bool:
         """删除反馈"""
         try:
             # 从PostgreSQL数据库删除
-            if self.conn:
-                with self.conn.cursor() as cur:
-                    cur.execute("""
-                    DELETE FROM feedbacks
-                    WHERE id = %s
-                    RETURNING id
-                    """, (feedback_id,))
-                    
-                    deleted = cur.fetchone()
-                    self.conn.commit()
-                    return deleted is not None
+            if self.pool:
+                await self.flush_feedbacks()
+                result_id = await self.pool.fetchval("""
+                DELETE FROM feedbacks
+                WHERE id = $1
+                RETURNING result_id
+                """, feedback_id)
+                if result_id is None:
+                    return False
+                await self.cache_service.delete(self._stats_cache_key(result_id))
+                return True
             else:
                 # 如果数据库连接失败，使用内存存储作为备用
                 initial_count = len(self.feedbacks)
@@ -253,7 +363,5 @@ class FeedbackService:
                 return len(self.feedbacks) < initial_count
             
         except Exception as e:
-            logger.error(f"Delete feedback error: {str(e)}", exc_info=True)
-            if self.conn:
-                self.conn.rollback()
+            logger.error("Delete feedback error: %s", e, exc_info=settings.DEBUG)
             raise
\ No newline at end of file
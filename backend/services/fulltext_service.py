@@ -5,12 +5,16 @@ import uuid
 from datetime import datetime
 from pymilvus import Collection, connections, utility
 
+from services.vector_service import build_kb_filter_expr
 from config import settings
 
 logger = logging.getLogger("retrieval")
 
 class FulltextService:
     def __init__(self):
+        # 已加载的集合，首次检索时创建
+        self._collection: Optional[Collection] = None
+        
         # 连接到Milvus
         try:
             # 使用与VectorService相同的连接
@@ -20,17 +24,27 @@ class FulltextService:
                     host=settings.MILVUS_HOST,
                     port=settings.MILVUS_PORT
                 )
-                logger.info(f"Connected to Milvus at {settings.MILVUS_HOST}:{settings.MILVUS_PORT}")
+                logger.info("Connected to Milvus at %s:%s", settings.MILVUS_HOST, settings.MILVUS_PORT)
             
         except Exception as e:
-            logger.error(f"Failed to connect to Milvus: {str(e)}", exc_info=True)
+            logger.error("Failed to connect to Milvus: %s", e, exc_info=settings.DEBUG)
             raise
     
+    async def _get_collection(self) -> Collection:
+        """获取已加载到内存的集合
+        
+        首次检索时加载一次并在进程内复用，之后的检索不再重复load；集合由各检索和各工作进程共享，不主动释放
+        """
+        if self._collection is None:
+            collection = Collection(settings.MILVUS_COLLECTION)
+            await asyncio.to_thread(collection.load)
+            self._collection = collection
+        return self._collection
+    
     async def search(self, query: str, knowledge_base_ids: List[str], limit: int = 10, min_score: float = 0.7) -> List[Dict[str, Any]]:
         """使用Milvus的全文检索功能进行检索"""
         try:
-            collection = Collection(settings.MILVUS_COLLECTION)
-            collection.load()
+            collection = await self._get_collection()
             
             # 构建查询条件 - 使用BM25算法进行全文检索
             search_params = {
@@ -43,14 +57,12 @@ class FulltextService:
             }
             
             # 如果指定了知识库ID，添加过滤条件
-            expr = None
-            if knowledge_base_ids:
-                kb_conditions = [f'knowledge_base_id == "{kb_id}"' for kb_id in knowledge_base_ids]
-                expr = " || ".join(kb_conditions)
+            expr = build_kb_filter_expr(tuple(sorted(knowledge_base_ids))) if knowledge_base_ids else None
             
-            # 执行全文检索
+            # 执行全文检索（同步调用放到线程中执行，不阻塞事件循环）
             # Milvus 2.5支持全文检索，使用BM25算法
-            results = collection.search(
+            results = await asyncio.to_thread(
+                collection.search,
                 data=[query],  # 直接使用查询文本
                 anns_field="content",  # 在content字段上进行全文检索
                 param=search_params,
@@ -88,13 +100,10 @@ class FulltextService:
                     
                     search_results.append(result)
             
-            # 释放集合
-            collection.release()
-            
             return search_results
             
         except Exception as e:
-            logger.error(f"Fulltext search error: {str(e)}", exc_info=True)
+            logger.error("Fulltext search error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def index_document(self, document: Dict[str, Any]) -> bool:
@@ -105,7 +114,7 @@ class FulltextService:
             return True
             
         except Exception as e:
-            logger.error(f"Index document error: {str(e)}", exc_info=True)
+            logger.error("Index document error: %s", e, exc_info=settings.DEBUG)
             return False
     
     async def delete_document(self, document_id: str) -> bool:
@@ -116,5 +125,5 @@ class FulltextService:
             return True
             
         except Exception as e:
-            logger.error(f"Delete document error: {str(e)}", exc_info=True)
+            logger.error("Delete document error: %s", e, exc_info=settings.DEBUG)
             return False
\ No newline at end of file
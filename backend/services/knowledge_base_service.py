@@ -1,18 +1,28 @@
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Iterator
+import codecs
 import uuid
 from datetime import datetime
 import asyncio
 import os
 import re
 
-from models.knowledge_base import KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate, Document, Chunk
+from models.knowledge_base import KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate, Document, Chunk, ParentChunk, ChildChunk
 from services.vector_service import VectorService
 from services.fulltext_service import FulltextService
 from config import settings
 
 logger = logging.getLogger("retrieval")
 
+# 匹配任意非空白字符：直接在原文的偏移范围内查找，判断块是否为空时不需要切片和strip复制文本
+_NON_WHITESPACE = re.compile(r"\S")
+
+def _uuid4_strings(count: int) -> Iterator[str]:
+    """一次读取count个UUID所需的随机字节，按需逐个生成UUID4字符串"""
+    raw = os.urandom(16 * count)
+    for offset in range(0, 16 * count, 16):
+        yield str(uuid.UUID(bytes=raw[offset:offset + 16], version=4))
+
 class KnowledgeBaseService:
     def __init__(self):
         # 在实际应用中，应该连接到PostgreSQL数据库
@@ -34,7 +44,7 @@ class KnowledgeBaseService:
             return self.knowledge_bases
             
         except Exception as e:
-            logger.error(f"Get all knowledge bases error: {str(e)}", exc_info=True)
+            logger.error("Get all knowledge bases error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def get_knowledge_base(self, kb_id: str) -> Optional[KnowledgeBase]:
@@ -52,14 +62,14 @@ class KnowledgeBaseService:
             return None
             
         except Exception as e:
-            logger.error(f"Get knowledge base error: {str(e)}", exc_info=True)
+            logger.error("Get knowledge base error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def create_knowledge_base(self, kb_create: KnowledgeBaseCreate) -> KnowledgeBase:
         """创建新知识库"""
         try:
-            # 创建知识库对象
-            kb = KnowledgeBase(
+            # 创建知识库对象（kb_create已在请求中校验）
+            kb = KnowledgeBase.unsafe_new(
                 id=str(uuid.uuid4()),
                 name=kb_create.name,
                 description=kb_create.description,
@@ -73,11 +83,11 @@ class KnowledgeBaseService:
             # 在实际应用中，应该保存到PostgreSQL数据库
             self.knowledge_bases.append(kb)
             
-            logger.info(f"Created knowledge base: {kb.name} (ID: {kb.id})")
+            logger.info("Created knowledge base: %s (ID: %s)", kb.name, kb.id)
             return kb
             
         except Exception as e:
-            logger.error(f"Create knowledge base error: {str(e)}", exc_info=True)
+            logger.error("Create knowledge base error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def update_knowledge_base(self, kb_id: str, kb_update: KnowledgeBaseUpdate) -> Optional[KnowledgeBase]:
@@ -100,11 +110,11 @@ class KnowledgeBaseService:
                 
             kb.last_updated = datetime.now()
             
-            logger.info(f"Updated knowledge base: {kb.name} (ID: {kb.id})")
+            logger.info("Updated knowledge base: %s (ID: %s)", kb.name, kb.id)
             return kb
             
         except Exception as e:
-            logger.error(f"Update knowledge base error: {str(e)}", exc_info=True)
+            logger.error("Update knowledge base error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def delete_knowledge_base(self, kb_id: str) -> bool:
@@ -127,28 +137,51 @@ class KnowledgeBaseService:
             # 删除向量数据库中的向量
             await self.vector_service.delete_by_knowledge_base(kb_id)
             
-            logger.info(f"Deleted knowledge base: {kb.name} (ID: {kb.id})")
+            logger.info("Deleted knowledge base: %s (ID: %s)", kb.name, kb.id)
             return True
             
         except Exception as e:
-            logger.error(f"Delete knowledge base error: {str(e)}", exc_info=True)
+            logger.error("Delete knowledge base error: %s", e, exc_info=settings.DEBUG)
             raise
     
-    async def add_document(self, kb_id: str, name: str, content: bytes, content_type: str) -> Document:
-        """添加文档到知识库"""
+    async def add_document(self, kb_id: str, name: str, content: AsyncIterator[bytes], content_type: str) -> Document:
+        """添加文档到知识库
+        
+        content为按块产出的文件内容，边读取边解码，避免同时持有完整的原始字节和解码后的文本
+        """
         try:
             # 查找知识库
             kb = await self.get_knowledge_base(kb_id)
             if not kb:
                 raise ValueError(f"Knowledge base {kb_id} not found")
+            
+            # 分块读取并增量解码内容（假设是文本）
+            size = 0
+            decode_error = None
+            text_parts = []
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            async for block in content:
+                size += len(block)
+                if decode_error is None:
+                    try:
+                        text_parts.append(decoder.decode(block))
+                    except UnicodeDecodeError as e:
+                        # 继续读取以统计文件大小，解码错误在处理阶段报告
+                        decode_error = e
+                        text_parts = []
+            if decode_error is None:
+                try:
+                    text_parts.append(decoder.decode(b"", final=True))
+                except UnicodeDecodeError as e:
+                    decode_error = e
                 
             # 创建文档对象
-            doc = Document(
+            doc = Document.unsafe_new(
                 id=str(uuid.uuid4()),
                 knowledge_base_id=kb_id,
                 name=name,
                 content_type=content_type,
-                size=len(content),
+                size=size,
                 chunk_count=0,
                 status="processing",
                 created_at=datetime.now()
@@ -160,8 +193,10 @@ class KnowledgeBaseService:
             
             # 处理文档内容
             try:
-                # 解码内容（假设是文本）
-                text_content = content.decode('utf-8')
+                if decode_error is not None:
+                    raise decode_error
+                text_content = "".join(text_parts)
+                text_parts = None
                 
                 # 分块处理文档
                 chunks = await self._chunk_document(doc.id, kb_id, text_content)
@@ -173,17 +208,17 @@ class KnowledgeBaseService:
                 kb.document_count += 1
                 kb.last_updated = datetime.now()
                 
-                logger.info(f"Added document: {doc.name} to knowledge base {kb.name} with {doc.chunk_count} chunks")
+                logger.info("Added document: %s to knowledge base %s with %s chunks", doc.name, kb.name, doc.chunk_count)
                 
             except Exception as e:
                 doc.status = "failed"
                 doc.error = str(e)
-                logger.error(f"Document processing error: {str(e)}", exc_info=True)
+                logger.error("Document processing error: %s", e, exc_info=settings.DEBUG)
             
             return doc
             
         except Exception as e:
-            logger.error(f"Add document error: {str(e)}", exc_info=True)
+            logger.error("Add document error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def get_documents(self, kb_id: str) -> List[Document]:
@@ -193,7 +228,7 @@ class KnowledgeBaseService:
             return [doc for doc in self.documents if doc.knowledge_base_id == kb_id]
             
         except Exception as e:
-            logger.error(f"Get documents error: {str(e)}", exc_info=True)
+            logger.error("Get documents error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def delete_document(self, kb_id: str, document_id: str) -> bool:
@@ -222,11 +257,11 @@ class KnowledgeBaseService:
                 kb.document_count = max(0, kb.document_count - 1)
                 kb.last_updated = datetime.now()
             
-            logger.info(f"Deleted document: {doc.name} from knowledge base {kb_id}")
+            logger.info("Deleted document: %s from knowledge base %s", doc.name, kb_id)
             return True
             
         except Exception as e:
-            logger.error(f"Delete document error: {str(e)}", exc_info=True)
+            logger.error("Delete document error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def sync_knowledge_base(self, kb_id: str) -> Dict[str, Any]:
@@ -273,12 +308,12 @@ class KnowledgeBaseService:
                 except Exception as e:
                     doc.status = "failed"
                     doc.error = str(e)
-                    logger.error(f"Document reprocessing error: {str(e)}", exc_info=True)
+                    logger.error("Document reprocessing error: %s", e, exc_info=settings.DEBUG)
             
             # 更新知识库最后更新时间
             kb.last_updated = datetime.now()
             
-            logger.info(f"Synced knowledge base: {kb.name} - processed {processed_documents} documents with {indexed_chunks} chunks")
+            logger.info("Synced knowledge base: %s - processed %s documents with %s chunks", kb.name, processed_documents, indexed_chunks)
             
             return {
                 "processed_documents": processed_documents,
@@ -286,54 +321,61 @@ class KnowledgeBaseService:
             }
             
         except Exception as e:
-            logger.error(f"Sync knowledge base error: {str(e)}", exc_info=True)
+            logger.error("Sync knowledge base error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def _chunk_document(self, document_id: str, kb_id: str, content: str) -> List[Chunk]:
-        """将文档内容分块"""
+        """将文档内容分块
+        
+        父块和子块都以原文中的偏移范围表示，只对确定保留的块切片一次，子块直接从原文切片
+        """
         # 使用父子块策略进行分块
         parent_size = settings.PARENT_BLOCK_SIZE
         child_size = settings.CHILD_BLOCK_SIZE
         overlap = settings.BLOCK_OVERLAP
         
-        # 分割为父块
+        # 分割为父块（起止偏移）
         parent_blocks = []
-        for i in range(0, len(content), parent_size - overlap):
-            parent_text = content[i:i + parent_size]
-            if len(parent_text.strip()) > 0:
-                parent_blocks.append(parent_text)
+        for start in range(0, len(content), parent_size - overlap):
+            end = min(start + parent_size, len(content))
+            if _NON_WHITESPACE.search(content, start, end):
+                parent_blocks.append((start, end))
+        
+        # 同一文档的分块共用一个创建时间；块ID按块数上限一次生成随机字节
+        created_at = datetime.now()
+        children_per_parent = -(-parent_size // (child_size - overlap))
+        chunk_ids = _uuid4_strings(len(parent_blocks) * (1 + children_per_parent))
         
         # 为每个父块创建子块
         all_chunks = []
-        for parent_idx, parent_text in enumerate(parent_blocks):
+        for parent_idx, (parent_start, parent_end) in enumerate(parent_blocks):
             # 创建父块
-            parent_id = str(uuid.uuid4())
-            parent_chunk = Chunk(
+            parent_id = next(chunk_ids)
+            parent_chunk = ParentChunk.unsafe_new(
                 id=parent_id,
                 document_id=document_id,
                 knowledge_base_id=kb_id,
-                content=parent_text,
-                chunk_type="parent",
+                content=content[parent_start:parent_end],
                 metadata={"index": parent_idx},
-                created_at=datetime.now()
+                created_at=created_at
             )
             
             # 将父块添加到列表
             all_chunks.append(parent_chunk)
             
             # 为父块创建子块
-            for j in range(0, len(parent_text), child_size - overlap):
-                child_text = parent_text[j:j + child_size]
-                if len(child_text.strip()) > 0:
-                    child_chunk = Chunk(
-                        id=str(uuid.uuid4()),
+            for j in range(0, parent_end - parent_start, child_size - overlap):
+                child_start = parent_start + j
+                child_end = min(child_start + child_size, parent_end)
+                if _NON_WHITESPACE.search(content, child_start, child_end):
+                    child_chunk = ChildChunk.unsafe_new(
+                        id=next(chunk_ids),
                         document_id=document_id,
                         knowledge_base_id=kb_id,
-                        content=child_text,
-                        chunk_type="child",
+                        content=content[child_start:child_end],
                         parent_id=parent_id,
                         metadata={"parent_index": parent_idx, "index": j // (child_size - overlap)},
-                        created_at=datetime.now()
+                        created_at=created_at
                     )
                     
                     # 将子块添加到列表
@@ -349,32 +391,37 @@ class KnowledgeBaseService:
         return all_chunks
     
     async def _index_chunks(self, chunks: List[Chunk]) -> None:
-        """为分块生成向量并索引"""
-        # 为每个块生成向量
-        for chunk in chunks:
-            # 生成向量
-            vector = await self.vector_service.encode_text(chunk.content)
-            chunk.vector = vector
-            
-            # 准备向量数据
-            vector_data = {
+        """为分块生成向量并索引
+        
+        全部分块整批编码为向量，向量数据一次批量插入向量数据库（一次插入和一次flush），不再逐块往返
+        """
+        # 为全部分块批量生成向量（向量只写入向量库，分块对象仅保留引用）
+        vectors = await self.vector_service.encode_batch([chunk.content for chunk in chunks])
+        
+        # 准备向量数据
+        vector_rows = []
+        for chunk, vector in zip(chunks, vectors.tolist()):
+            vector_rows.append({
                 "id": chunk.id,
                 "knowledge_base_id": chunk.knowledge_base_id,
                 "document_id": chunk.document_id,
                 "chunk_id": chunk.id,
                 "chunk_type": chunk.chunk_type,
-                "parent_id": chunk.parent_id,
+                "parent_id": chunk.parent_id if isinstance(chunk, ChildChunk) else None,
                 "title": "",  # 在实际应用中，应该提取标题
                 "content": chunk.content,
                 "vector": vector,
                 "metadata": chunk.metadata,
                 "created_at": chunk.created_at.isoformat()
-            }
-            
-            # 插入向量数据库
-            await self.vector_service.insert([vector_data])
-            
-            # 如果是父块，也添加到全文索引
+            })
+        
+        # 批量插入向量数据库
+        vector_ids = await self.vector_service.insert(vector_rows)
+        for chunk, vector_id in zip(chunks, vector_ids):
+            chunk.vector_ref = vector_id
+        
+        # 父块也添加到全文索引
+        for chunk in chunks:
             if chunk.chunk_type == "parent":
                 await self.fulltext_service.index_document({
                     "id": chunk.id,
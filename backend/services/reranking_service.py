@@ -16,9 +16,9 @@ class RerankingService:
             self.model = SentenceTransformer('BAAI/bge-reranker-v2-m3')
             self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
             self.model.to(self.device)
-            logger.info(f"BGE reranking model loaded successfully on {self.device}")
+            logger.info("BGE reranking model loaded successfully on %s", self.device)
         except Exception as e:
-            logger.error(f"Failed to load BGE model: {str(e)}", exc_info=True)
+            logger.error("Failed to load BGE model: %s", e, exc_info=settings.DEBUG)
             self.model = None
     
     async def rerank(self, query: str, texts: List[str]) -> List[float]:
@@ -37,18 +37,13 @@ class RerankingService:
             # 定义一个在线程池中执行的函数
             def compute_similarity():
                 with torch.no_grad():
-                    # 编码查询和文本
-                    query_embedding = self.model.encode(query, convert_to_tensor=True)
-                    text_embeddings = self.model.encode(texts, convert_to_tensor=True, batch_size=16)
+                    # 编码查询和文本（编码时即做L2归一化，余弦相似度退化为点积）
+                    query_embedding = self.model.encode(query, convert_to_numpy=True, normalize_embeddings=True)
+                    text_embeddings = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True, batch_size=16)
                     
-                    # 计算余弦相似度
-                    similarities = torch.nn.functional.cosine_similarity(query_embedding.unsqueeze(0), text_embeddings)
-                    
-                    # 转换为Python列表并确保分数在0-1之间
-                    scores = similarities.cpu().numpy().tolist()
-                    scores = [max(0.0, min(1.0, score)) for score in scores]
-                    
-                    return scores
+                    # 一次矩阵-向量乘法（BLAS gemv）计算全部余弦相似度，并确保分数在0-1之间
+                    similarities = text_embeddings.astype(np.float32, copy=False) @ query_embedding.astype(np.float32, copy=False)
+                    return np.clip(similarities, 0.0, 1.0).tolist()
             
             # 在线程池中执行计算
             scores = await loop.run_in_executor(None, compute_similarity)
@@ -56,12 +51,12 @@ class RerankingService:
             return scores
             
         except Exception as e:
-            logger.error(f"Reranking error: {str(e)}", exc_info=True)
+            logger.error("Reranking error: %s", e, exc_info=settings.DEBUG)
             # 如果重排序失败，返回原始分数（全为1.0）
             return [1.0] * len(texts)
             
         except Exception as e:
-            logger.error(f"Reranking error: {str(e)}", exc_info=True)
+            logger.error("Reranking error: %s", e, exc_info=settings.DEBUG)
             # 如果重排序失败，返回原始分数（全为1.0）
             return [1.0] * len(texts)
     
@@ -73,6 +68,6 @@ class RerankingService:
             results = await asyncio.gather(*tasks)
             return results
         except Exception as e:
-            logger.error(f"Batch reranking error: {str(e)}", exc_info=True)
+            logger.error("Batch reranking error: %s", e, exc_info=settings.DEBUG)
             # 如果重排序失败，返回原始分数
             return [[1.0] * len(texts) for texts in texts_list]
\ No newline at end of file
@@ -1,13 +1,17 @@
 import logging
+import sys
 from typing import List, Dict, Any, Optional, Tuple
+import asyncio
+import heapq
+import itertools
 import time
 import numpy as np
 from datetime import datetime
 import uuid
 from sklearn.cluster import DBSCAN
-from sklearn.metrics.pairwise import cosine_similarity
 
-from models.search import SearchResult, ClusterInfo
+from models.search import ClusterInfo
+from models.fast_search import FastSearchResult
 from services.vector_service import VectorService
 from services.fulltext_service import FulltextService
 from services.reranking_service import RerankingService
@@ -16,28 +20,43 @@ from config import settings
 
 logger = logging.getLogger("retrieval")
 
+def _rank_by_scores(results: List[FastSearchResult], scores: np.ndarray, min_score: Optional[float] = None, limit: Optional[int] = None) -> List[FastSearchResult]:
+    """按分数列对结果做阈值过滤、截断和降序排序
+    
+    分数单独保存在连续的数组中，过滤和排序都在numpy中完成，不逐个访问结果对象
+    """
+    indices = np.arange(len(results)) if min_score is None else np.flatnonzero(scores >= min_score)
+    if limit is not None and limit < len(indices):
+        # 只需前limit个时先用argpartition选出，再对这部分排序
+        indices = indices[np.argpartition(-scores[indices], limit - 1)[:limit]]
+    indices = indices[np.argsort(-scores[indices], kind="stable")]
+    return [results[i] for i in indices]
+
 class SearchService:
-    def __init__(self):
+    def __init__(self, analytics_service: Optional[AnalyticsService] = None):
         self.vector_service = VectorService()
         self.fulltext_service = FulltextService()
         self.reranking_service = RerankingService()
-        self.analytics_service = AnalyticsService()
-        self.strategy_used = "auto"
-        self.clusters = []
+        # 与分析接口共用同一个分析服务，搜索日志写入同一个缓冲区
+        self.analytics_service = analytics_service or AnalyticsService()
     
     async def search(self, 
                      query: str, 
                      knowledge_base_ids: List[str],
                      strategy: str = "auto",
-                     semantic_weight: float = 0.7,
-                     fulltext_weight: float = 0.3,
+                     semantic_weight: float = 0.9,
+                     fulltext_weight: float = 0.1,
                      max_results: int = 10,
                      min_score: float = 0.7,
                      use_reranking: bool = True,
-                     use_clustering: bool = True) -> List[SearchResult]:
+                     use_clustering: bool = True,
+                     max_latency_ms: Optional[int] = None) -> Tuple[List[FastSearchResult], str, List[ClusterInfo]]:
         """执行知识库检索
         
         支持多种检索策略：自动选择、语义检索、全文检索和混合检索
+        
+        服务实例在请求间共享，因此实际使用的策略和聚类信息随结果一起返回，
+        而不是保存在实例属性上
         """
         start_time = time.time()
         
@@ -45,28 +64,27 @@ class SearchService:
         if strategy == "auto":
             # 自动选择策略：根据查询特征选择最合适的策略
             strategy = await self._determine_best_strategy(query)
-            logger.info(f"Auto selected strategy: {strategy} for query: {query}")
+            logger.info("Auto selected strategy: %s for query: %s", strategy, query)
         
-        self.strategy_used = strategy
-        
-        # 根据策略执行检索
-        if strategy == "semantic":
-            results = await self._semantic_search(query, knowledge_base_ids, max_results * 2, min_score)
-        elif strategy == "fulltext":
-            results = await self._fulltext_search(query, knowledge_base_ids, max_results * 2, min_score)
-        elif strategy == "hybrid":
-            results = await self._hybrid_search(query, knowledge_base_ids, semantic_weight, fulltext_weight, max_results * 2, min_score)
-        else:
+        if strategy not in ("semantic", "fulltext", "hybrid"):
             raise ValueError(f"不支持的检索策略: {strategy}")
         
+        clusters = []
+        
+        # 按知识库并行执行检索
+        timeout = (max_latency_ms or settings.SEARCH_TIMEOUT_MS) / 1000
+        results = await self._search_knowledge_bases(
+            query, knowledge_base_ids, strategy, semantic_weight, fulltext_weight, max_results * 2, min_score, timeout
+        )
+        
         # 结果重排序
         if use_reranking and len(results) > 1:
-            results = await self._rerank_results(query, results)
+            # 聚类需要全部结果，不聚类时重排序后只保留前max_results条
+            results = await self._rerank_results(query, results, limit=None if use_clustering else max_results)
         
         # 结果聚类
         if use_clustering and len(results) > 1:
             results, clusters = await self._cluster_results(results)
-            self.clusters = clusters
         
         # 限制结果数量
         results = results[:max_results]
@@ -85,8 +103,8 @@ class SearchService:
             cache_hit=False  # 实际应用中应根据缓存情况设置
         )
         
-        logger.info(f"Search completed in {response_time:.3f}s, strategy: {strategy}, results: {len(results)}")
-        return results
+        logger.info("Search completed in %.3fs, strategy: %s, results: %s", response_time, strategy, len(results))
+        return results, strategy, clusters
     
     async def _determine_best_strategy(self, query: str) -> str:
         """根据查询特征自动选择最佳检索策略
@@ -109,7 +127,7 @@ class SearchService:
         # 3. 计算最终得分并选择策略
         strategy = self._select_strategy_by_scores(feature_score, history_score)
         
-        logger.debug(f"Strategy selection for query '{query}': {strategy} (feature_score={feature_score}, history_score={history_score})")
+        logger.debug("Strategy selection for query '%s': %s (feature_score=%s, history_score=%s)", query, strategy, feature_score, history_score)
         return strategy
     
     def _analyze_query_features(self, query: str) -> dict:
@@ -213,7 +231,7 @@ class SearchService:
                 scores[strategy] = performance
             
         except Exception as e:
-            logger.warning(f"Error analyzing historical performance: {str(e)}")
+            logger.warning("Error analyzing historical performance: %s", e)
             # 出错时返回空得分
         
         return scores
@@ -250,7 +268,7 @@ class SearchService:
             return similar_queries[:limit]
             
         except Exception as e:
-            logger.warning(f"Error finding similar queries: {str(e)}")
+            logger.warning("Error finding similar queries: %s", e)
             return []
     
     def _select_strategy_by_scores(self, feature_score: dict, history_score: dict) -> str:
@@ -274,11 +292,73 @@ class SearchService:
         
         return best_strategy
     
-    async def _semantic_search(self, query: str, knowledge_base_ids: List[str], max_results: int, min_score: float) -> List[SearchResult]:
+    async def _search_knowledge_bases(self, query: str, knowledge_base_ids: List[str], strategy: str, semantic_weight: float, fulltext_weight: float, max_results: int, min_score: float, timeout: float) -> List[FastSearchResult]:
+        """按知识库并行检索并合并结果
+        
+        每个知识库独立检索，总耗时由最慢的知识库决定而不是各知识库耗时之和；
+        超过截止时间仍未完成的知识库会被取消，只返回已完成部分的结果
+        """
+        # 语义检索和混合检索共用同一个查询向量，只编码一次
+        query_vector = None
+        if strategy in ("semantic", "hybrid"):
+            query_vector = await self.vector_service.encode_text(query)
+        
+        # 未指定或只有一个知识库时无需拆分
+        kb_ids = list(dict.fromkeys(knowledge_base_ids))
+        if len(kb_ids) <= 1:
+            return await asyncio.wait_for(
+                self._search_with_strategy(query, kb_ids, strategy, semantic_weight, fulltext_weight, max_results, min_score, query_vector),
+                timeout
+            )
+        
+        tasks = {
+            asyncio.create_task(
+                self._search_with_strategy(query, [kb_id], strategy, semantic_weight, fulltext_weight, max_results, min_score, query_vector)
+            ): kb_id
+            for kb_id in kb_ids
+        }
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+        finally:
+            # 超时或请求本身被取消时，清理仍在运行的检索任务
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        
+        for task in pending:
+            logger.warning("Search in knowledge base %s exceeded %.3fs deadline, cancelled", tasks[task], timeout)
+        
+        results_per_kb = []
+        for task in done:
+            error = task.exception()
+            if error is not None:
+                logger.error("Search in knowledge base %s failed: %s", tasks[task], error)
+                continue
+            results_per_kb.append(task.result())
+        
+        if not results_per_kb:
+            raise TimeoutError(f"所有知识库检索均失败或超时（{len(kb_ids)}个）")
+        
+        # 每个知识库最多返回max_results条，只需用堆取出全局得分最高的max_results条，无需整体排序
+        return heapq.nlargest(max_results, itertools.chain.from_iterable(results_per_kb), key=lambda x: x.score)
+    
+    async def _search_with_strategy(self, query: str, knowledge_base_ids: List[str], strategy: str, semantic_weight: float, fulltext_weight: float, max_results: int, min_score: float, query_vector: Optional[List[float]] = None) -> List[FastSearchResult]:
+        """在指定知识库中按策略执行检索"""
+        if strategy == "semantic":
+            return await self._semantic_search(query, knowledge_base_ids, max_results, min_score, query_vector)
+        elif strategy == "fulltext":
+            return await self._fulltext_search(query, knowledge_base_ids, max_results, min_score)
+        elif strategy == "hybrid":
+            return await self._hybrid_search(query, knowledge_base_ids, semantic_weight, fulltext_weight, max_results, min_score, query_vector)
+        else:
+            raise ValueError(f"不支持的检索策略: {strategy}")
+    
+    async def _semantic_search(self, query: str, knowledge_base_ids: List[str], max_results: int, min_score: float, query_vector: Optional[List[float]] = None) -> List[FastSearchResult]:
         """执行语义检索"""
         try:
             # 获取查询的向量表示
-            query_vector = await self.vector_service.encode_text(query)
+            if query_vector is None:
+                query_vector = await self.vector_service.encode_text(query)
             
             # 在向量数据库中搜索相似向量
             vector_results = await self.vector_service.search(
@@ -288,17 +368,19 @@ class SearchService:
                 min_score=min_score
             )
             
-            # 转换为SearchResult格式
+            # 转换为内部结果格式（来源和文档ID在结果集中大量重复，驻留后共享同一字符串对象）；
+            # 缺少创建时间时的默认值只取一次，不在每条结果上调用datetime.now()
+            now = datetime.now()
             results = []
             for item in vector_results:
-                result = SearchResult(
+                result = FastSearchResult(
                     id=str(uuid.uuid4()),
                     title=item.get("title", ""),
                     content=item.get("content", ""),
-                    source=item.get("knowledge_base_name", ""),
-                    document_id=item.get("document_id", ""),
+                    source=sys.intern(item.get("knowledge_base_name", "")),
+                    document_id=sys.intern(item.get("document_id", "")),
                     score=item.get("score", 0.0),
-                    timestamp=item.get("created_at", datetime.now()),
+                    timestamp=item.get("created_at", now),
                     metadata=item.get("metadata", {})
                 )
                 results.append(result)
@@ -306,10 +388,10 @@ class SearchService:
             return results
             
         except Exception as e:
-            logger.error(f"Semantic search error: {str(e)}", exc_info=True)
+            logger.error("Semantic search error: %s", e, exc_info=settings.DEBUG)
             raise
     
-    async def _fulltext_search(self, query: str, knowledge_base_ids: List[str], max_results: int, min_score: float) -> List[SearchResult]:
+    async def _fulltext_search(self, query: str, knowledge_base_ids: List[str], max_results: int, min_score: float) -> List[FastSearchResult]:
         """执行全文检索"""
         try:
             # 使用BM25算法进行全文检索
@@ -320,17 +402,19 @@ class SearchService:
                 min_score=min_score
             )
             
-            # 转换为SearchResult格式
+            # 转换为内部结果格式（来源和文档ID在结果集中大量重复，驻留后共享同一字符串对象）；
+            # 缺少创建时间时的默认值只取一次，不在每条结果上调用datetime.now()
+            now = datetime.now()
             results = []
             for item in fulltext_results:
-                result = SearchResult(
+                result = FastSearchResult(
                     id=str(uuid.uuid4()),
                     title=item.get("title", ""),
                     content=item.get("content", ""),
-                    source=item.get("knowledge_base_name", ""),
-                    document_id=item.get("document_id", ""),
+                    source=sys.intern(item.get("knowledge_base_name", "")),
+                    document_id=sys.intern(item.get("document_id", "")),
                     score=item.get("score", 0.0),
-                    timestamp=item.get("created_at", datetime.now()),
+                    timestamp=item.get("created_at", now),
                     metadata=item.get("metadata", {})
                 )
                 results.append(result)
@@ -338,21 +422,21 @@ class SearchService:
             return results
             
         except Exception as e:
-            logger.error(f"Fulltext search error: {str(e)}", exc_info=True)
+            logger.error("Fulltext search error: %s", e, exc_info=settings.DEBUG)
             raise
     
-    async def _hybrid_search(self, query: str, knowledge_base_ids: List[str], semantic_weight: float, fulltext_weight: float, max_results: int, min_score: float) -> List[SearchResult]:
+    async def _hybrid_search(self, query: str, knowledge_base_ids: List[str], semantic_weight: float, fulltext_weight: float, max_results: int, min_score: float, query_vector: Optional[List[float]] = None) -> List[FastSearchResult]:
         """执行混合检索（结合语义检索和全文检索）"""
         try:
             # 使用Milvus 2.5原生混合检索功能
             if self._can_use_native_hybrid_search():
-                return await self._native_hybrid_search(query, knowledge_base_ids, semantic_weight, fulltext_weight, max_results, min_score)
+                return await self._native_hybrid_search(query, knowledge_base_ids, semantic_weight, fulltext_weight, max_results, min_score, query_vector)
             else:
                 # 回退到传统方法：分别执行语义检索和全文检索，然后合并结果
-                return await self._legacy_hybrid_search(query, knowledge_base_ids, semantic_weight, fulltext_weight, max_results, min_score)
+                return await self._legacy_hybrid_search(query, knowledge_base_ids, semantic_weight, fulltext_weight, max_results, min_score, query_vector)
             
         except Exception as e:
-            logger.error(f"Hybrid search error: {str(e)}", exc_info=True)
+            logger.error("Hybrid search error: %s", e, exc_info=settings.DEBUG)
             raise
     
     def _can_use_native_hybrid_search(self) -> bool:
@@ -363,14 +447,15 @@ class SearchService:
             # 这里简化处理，假设已经支持
             return True
         except Exception as e:
-            logger.warning(f"Failed to check Milvus version: {str(e)}", exc_info=True)
+            logger.warning("Failed to check Milvus version: %s", e, exc_info=settings.DEBUG)
             return False
     
-    async def _native_hybrid_search(self, query: str, knowledge_base_ids: List[str], semantic_weight: float, fulltext_weight: float, max_results: int, min_score: float) -> List[SearchResult]:
+    async def _native_hybrid_search(self, query: str, knowledge_base_ids: List[str], semantic_weight: float, fulltext_weight: float, max_results: int, min_score: float, query_vector: Optional[List[float]] = None) -> List[FastSearchResult]:
         """使用Milvus 2.5原生混合检索功能"""
         try:
             # 获取查询的向量表示
-            query_vector = await self.vector_service.encode_text(query)
+            if query_vector is None:
+                query_vector = await self.vector_service.encode_text(query)
             
             collection = Collection(settings.MILVUS_COLLECTION)
             collection.load()
@@ -380,6 +465,7 @@ class SearchService:
                 "metric_type": "COSINE",
                 "params": {
                     "ef": 100,
+                    "refine_k": 4,  # 量化索引的float32重排倍数
                     "bm25_k1": 1.2,  # BM25算法参数
                     "bm25_b": 0.75,
                     "bm25_boost": 1.0,
@@ -394,8 +480,9 @@ class SearchService:
                 kb_conditions = [f'knowledge_base_id == "{kb_id}"' for kb_id in knowledge_base_ids]
                 expr = " || ".join(kb_conditions)
             
-            # 执行混合搜索
-            results = collection.search(
+            # 执行混合搜索（同步调用放到线程中执行，不阻塞其他知识库的并行检索）
+            results = await asyncio.to_thread(
+                collection.search,
                 data=[query_vector],  # 向量查询部分
                 anns_field="vector",   # 向量字段
                 param=search_params,
@@ -415,13 +502,13 @@ class SearchService:
                     if hit.score < min_score:
                         continue
                         
-                    # 构建结果对象
-                    result = SearchResult(
+                    # 构建结果对象（来源和文档ID驻留为共享字符串）
+                    result = FastSearchResult(
                         id=str(uuid.uuid4()),
                         title=hit.entity.get("title", ""),
                         content=hit.entity.get("content", ""),
-                        source="知识库" + hit.entity.get("knowledge_base_id", "")[-4:],
-                        document_id=hit.entity.get("document_id", ""),
+                        source=sys.intern("知识库" + hit.entity.get("knowledge_base_id", "")[-4:]),
+                        document_id=sys.intern(hit.entity.get("document_id", "")),
                         score=hit.score,
                         timestamp=datetime.fromisoformat(hit.entity.get("created_at")),
                         metadata=hit.entity.get("metadata", {})
@@ -429,22 +516,22 @@ class SearchService:
                     
                     search_results.append(result)
             
-            # 释放集合
-            collection.release()
-            
+            # 集合在多个并行检索间共享，不在单次检索结束时释放
             return search_results
             
         except Exception as e:
-            logger.error(f"Native hybrid search error: {str(e)}", exc_info=True)
+            logger.error("Native hybrid search error: %s", e, exc_info=settings.DEBUG)
             # 如果原生混合搜索失败，回退到传统方法
-            return await self._legacy_hybrid_search(query, knowledge_base_ids, semantic_weight, fulltext_weight, max_results, min_score)
+            return await self._legacy_hybrid_search(query, knowledge_base_ids, semantic_weight, fulltext_weight, max_results, min_score, query_vector)
     
-    async def _legacy_hybrid_search(self, query: str, knowledge_base_ids: List[str], semantic_weight: float, fulltext_weight: float, max_results: int, min_score: float) -> List[SearchResult]:
+    async def _legacy_hybrid_search(self, query: str, knowledge_base_ids: List[str], semantic_weight: float, fulltext_weight: float, max_results: int, min_score: float, query_vector: Optional[List[float]] = None) -> List[FastSearchResult]:
         """传统混合检索方法（分别执行语义检索和全文检索，然后合并结果）"""
         try:
             # 并行执行语义检索和全文检索
-            semantic_results = await self._semantic_search(query, knowledge_base_ids, max_results, min_score * 0.8)
-            fulltext_results = await self._fulltext_search(query, knowledge_base_ids, max_results, min_score * 0.8)
+            semantic_results, fulltext_results = await asyncio.gather(
+                self._semantic_search(query, knowledge_base_ids, max_results, min_score * 0.8, query_vector),
+                self._fulltext_search(query, knowledge_base_ids, max_results, min_score * 0.8)
+            )
             
             # 合并结果并重新计算分数
             result_map = {}
@@ -472,32 +559,26 @@ class SearchService:
                         "fulltext_score": result.score
                     }
             
-            # 计算混合分数并排序
-            combined_results = []
-            for key, data in result_map.items():
-                result = data["result"]
-                # 计算加权混合分数
-                combined_score = (data["semantic_score"] * semantic_weight + 
-                                 data["fulltext_score"] * fulltext_weight)
-                
-                # 更新结果分数
-                result.score = combined_score
-                
-                # 只保留分数高于阈值的结果
-                if combined_score >= min_score:
-                    combined_results.append(result)
+            # 计算加权混合分数（请求已保证两个权重之和为1，无需归一化）
+            entries = list(result_map.values())
+            semantic_scores = np.fromiter((data["semantic_score"] for data in entries), dtype=np.float64, count=len(entries))
+            fulltext_scores = np.fromiter((data["fulltext_score"] for data in entries), dtype=np.float64, count=len(entries))
+            combined_scores = semantic_scores * semantic_weight + fulltext_scores * fulltext_weight
             
-            # 按分数降序排序
-            combined_results.sort(key=lambda x: x.score, reverse=True)
+            # 更新结果分数
+            combined_results = [data["result"] for data in entries]
+            for result, score in zip(combined_results, combined_scores.tolist()):
+                result.score = score
             
-            return combined_results
+            # 只保留分数高于阈值的前max_results条结果，并按分数降序排序（多个知识库的结果合并后也只取前max_results条）
+            return _rank_by_scores(combined_results, combined_scores, min_score=min_score, limit=max_results)
             
         except Exception as e:
-            logger.error(f"Legacy hybrid search error: {str(e)}", exc_info=True)
+            logger.error("Legacy hybrid search error: %s", e, exc_info=settings.DEBUG)
             raise
     
-    async def _rerank_results(self, query: str, results: List[SearchResult]) -> List[SearchResult]:
-        """使用重排序模型对结果进行重排序"""
+    async def _rerank_results(self, query: str, results: List[FastSearchResult], limit: Optional[int] = None) -> List[FastSearchResult]:
+        """使用重排序模型对结果进行重排序，指定limit时只返回得分最高的limit条"""
         try:
             # 提取结果内容
             texts = [result.content for result in results]
@@ -506,20 +587,18 @@ class SearchService:
             reranked_scores = await self.reranking_service.rerank(query, texts)
             
             # 更新结果分数
-            for i, result in enumerate(results):
-                result.score = reranked_scores[i]
+            for result, score in zip(results, reranked_scores):
+                result.score = score
             
             # 按新分数排序
-            results.sort(key=lambda x: x.score, reverse=True)
-            
-            return results
+            return _rank_by_scores(results, np.asarray(reranked_scores, dtype=np.float64), limit=limit)
             
         except Exception as e:
-            logger.error(f"Reranking error: {str(e)}", exc_info=True)
+            logger.error("Reranking error: %s", e, exc_info=settings.DEBUG)
             # 如果重排序失败，返回原始结果
             return results
     
-    async def _cluster_results(self, results: List[SearchResult]) -> Tuple[List[SearchResult], List[ClusterInfo]]:
+    async def _cluster_results(self, results: List[FastSearchResult]) -> Tuple[List[FastSearchResult], List[ClusterInfo]]:
         """对搜索结果进行聚类"""
         try:
             if len(results) <= 1:
@@ -528,10 +607,14 @@ class SearchService:
             
             # 获取结果的向量表示
             texts = [result.content for result in results]
-            vectors = await self.vector_service.encode_batch(texts)
+            vectors = np.asarray(await self.vector_service.encode_batch(texts), dtype=np.float32)
+            
+            # 向量编码时已L2归一化，余弦距离矩阵由一次矩阵乘法（BLAS gemm）得到
+            distances = 1.0 - vectors @ vectors.T
+            np.clip(distances, 0.0, 2.0, out=distances)
             
             # 使用DBSCAN进行聚类
-            clustering = DBSCAN(eps=0.3, min_samples=1, metric='cosine').fit(vectors)
+            clustering = DBSCAN(eps=0.3, min_samples=1, metric='precomputed').fit(distances)
             labels = clustering.labels_
             
             # 为每个结果分配聚类标签
@@ -569,6 +652,6 @@ class SearchService:
             return clustered_results, clusters
             
         except Exception as e:
-            logger.error(f"Clustering error: {str(e)}", exc_info=True)
+            logger.error("Clustering error: %s", e, exc_info=settings.DEBUG)
             # 如果聚类失败，返回原始结果
             return results, []
\ No newline at end of file
@@ -4,10 +4,21 @@ import logging
 import json
 import os
 
-from models.settings import RetrievalSettings, CacheSettings, CrossKbSettings
+from models.settings import (
+    RetrievalSettings, CacheSettings, CrossKbSettings,
+    RetrievalSettingsIn, CacheSettingsIn, CrossKbSettingsIn
+)
+from config import settings as app_settings
 
 logger = logging.getLogger("settings")
 
+# 各设置分组对应的加载模型
+SETTINGS_LOADERS = {
+    "retrieval": RetrievalSettingsIn,
+    "cache": CacheSettingsIn,
+    "cross_kb": CrossKbSettingsIn
+}
+
 class SettingsService:
     """
     设置服务
@@ -18,6 +29,9 @@ class SettingsService:
     def __init__(self):
         self.settings_file = os.path.join(os.path.dirname(__file__), "../data/settings.json")
         self._ensure_settings_file()
+        # 已解析的只读设置，设置文件修改时间变化后（包括其他进程写入）重新加载
+        self._parsed_settings: Dict[str, Any] = {}
+        self._parsed_mtime: Optional[int] = None
     
     def _ensure_settings_file(self):
         """
@@ -28,9 +42,9 @@ class SettingsService:
         if not os.path.exists(self.settings_file):
             # 创建默认设置
             default_settings = {
-                "retrieval": RetrievalSettings().dict(),
-                "cache": CacheSettings().dict(),
-                "cross_kb": CrossKbSettings().dict()
+                "retrieval": RetrievalSettingsIn().model_dump(mode="json"),
+                "cache": CacheSettingsIn().model_dump(mode="json"),
+                "cross_kb": CrossKbSettingsIn().model_dump(mode="json")
             }
             
             with open(self.settings_file, "w", encoding="utf-8") as f:
@@ -44,12 +58,12 @@ class SettingsService:
             with open(self.settings_file, "r", encoding="utf-8") as f:
                 return json.load(f)
         except Exception as e:
-            logger.error(f"Failed to load settings: {str(e)}", exc_info=True)
+            logger.error("Failed to load settings: %s", e, exc_info=app_settings.DEBUG)
             # 返回默认设置
             return {
-                "retrieval": RetrievalSettings().dict(),
-                "cache": CacheSettings().dict(),
-                "cross_kb": CrossKbSettings().dict()
+                "retrieval": RetrievalSettingsIn().model_dump(mode="json"),
+                "cache": CacheSettingsIn().model_dump(mode="json"),
+                "cross_kb": CrossKbSettingsIn().model_dump(mode="json")
             }
     
     async def _save_settings(self, settings: Dict[str, Any]):
@@ -60,86 +74,102 @@ class SettingsService:
             with open(self.settings_file, "w", encoding="utf-8") as f:
                 json.dump(settings, f, ensure_ascii=False, indent=2)
         except Exception as e:
-            logger.error(f"Failed to save settings: {str(e)}", exc_info=True)
+            logger.error("Failed to save settings: %s", e, exc_info=app_settings.DEBUG)
             raise Exception(f"保存设置失败: {str(e)}")
     
+    async def _get_settings(self, section: str) -> Any:
+        """
+        获取已解析的设置分组，仅在设置文件变化时重新读取和校验
+        """
+        try:
+            mtime = os.stat(self.settings_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        
+        if mtime is None or mtime != self._parsed_mtime:
+            settings = await self._load_settings()
+            self._parsed_settings = {
+                name: loader(**settings.get(name, {})).to_settings()
+                for name, loader in SETTINGS_LOADERS.items()
+            }
+            self._parsed_mtime = mtime
+        
+        return self._parsed_settings[section]
+    
     async def get_retrieval_settings(self) -> RetrievalSettings:
         """
         获取检索设置
         """
-        settings = await self._load_settings()
-        return RetrievalSettings(**settings.get("retrieval", {}))
+        return await self._get_settings("retrieval")
     
-    async def update_retrieval_settings(self, new_settings: RetrievalSettings) -> RetrievalSettings:
+    async def update_retrieval_settings(self, new_settings: RetrievalSettingsIn) -> RetrievalSettings:
         """
         更新检索设置
         """
         settings = await self._load_settings()
         
         # 更新设置
-        new_settings_dict = new_settings.dict()
+        new_settings_dict = new_settings.model_dump(mode="json")
         new_settings_dict["updated_at"] = datetime.now().isoformat()
         settings["retrieval"] = new_settings_dict
         
         # 保存设置
         await self._save_settings(settings)
         
-        return RetrievalSettings(**new_settings_dict)
+        return RetrievalSettingsIn(**new_settings_dict).to_settings()
     
     async def get_cache_settings(self) -> CacheSettings:
         """
         获取缓存设置
         """
-        settings = await self._load_settings()
-        return CacheSettings(**settings.get("cache", {}))
+        return await self._get_settings("cache")
     
-    async def update_cache_settings(self, new_settings: CacheSettings) -> CacheSettings:
+    async def update_cache_settings(self, new_settings: CacheSettingsIn) -> CacheSettings:
         """
         更新缓存设置
         """
         settings = await self._load_settings()
         
         # 更新设置
-        new_settings_dict = new_settings.dict()
+        new_settings_dict = new_settings.model_dump(mode="json")
         new_settings_dict["updated_at"] = datetime.now().isoformat()
         settings["cache"] = new_settings_dict
         
         # 保存设置
         await self._save_settings(settings)
         
-        return CacheSettings(**new_settings_dict)
+        return CacheSettingsIn(**new_settings_dict).to_settings()
     
     async def get_cross_kb_settings(self) -> CrossKbSettings:
         """
         获取跨库检索设置
         """
-        settings = await self._load_settings()
-        return CrossKbSettings(**settings.get("cross_kb", {}))
+        return await self._get_settings("cross_kb")
     
-    async def update_cross_kb_settings(self, new_settings: CrossKbSettings) -> CrossKbSettings:
+    async def update_cross_kb_settings(self, new_settings: CrossKbSettingsIn) -> CrossKbSettings:
         """
         更新跨库检索设置
         """
         settings = await self._load_settings()
         
         # 更新设置
-        new_settings_dict = new_settings.dict()
+        new_settings_dict = new_settings.model_dump(mode="json")
         new_settings_dict["updated_at"] = datetime.now().isoformat()
         settings["cross_kb"] = new_settings_dict
         
         # 保存设置
         await self._save_settings(settings)
         
-        return CrossKbSettings(**new_settings_dict)
+        return CrossKbSettingsIn(**new_settings_dict).to_settings()
     
     async def reset_settings(self):
         """
         重置所有设置为默认值
         """
         default_settings = {
-            "retrieval": RetrievalSettings().dict(),
-            "cache": CacheSettings().dict(),
-            "cross_kb": CrossKbSettings().dict()
+            "retrieval": RetrievalSettingsIn().model_dump(mode="json"),
+            "cache": CacheSettingsIn().model_dump(mode="json"),
+            "cross_kb": CrossKbSettingsIn().model_dump(mode="json")
         }
         
         # 添加更新时间
@@ -1,17 +1,30 @@
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 from datetime import datetime
 import uuid
 import asyncio
+import json
+from functools import lru_cache
 from pymilvus import Collection, connections, utility
 
 from config import settings
 
 logger = logging.getLogger("retrieval")
 
+@lru_cache(maxsize=256)
+def build_kb_filter_expr(knowledge_base_ids: Tuple[str, ...]) -> str:
+    """按知识库过滤的Milvus表达式
+    
+    使用IN而不是多个==的||组合；调用方传入排序后的元组，相同的知识库组合复用同一个表达式字符串
+    """
+    return f"knowledge_base_id in {json.dumps(list(knowledge_base_ids), ensure_ascii=False)}"
+
 class VectorService:
     def __init__(self):
+        # 已加载的集合，首次检索时创建
+        self._collection: Optional[Collection] = None
+        
         # 连接到Milvus
         try:
             connections.connect(
@@ -19,13 +32,13 @@ class VectorService:
                 host=settings.MILVUS_HOST,
                 port=settings.MILVUS_PORT
             )
-            logger.info(f"Connected to Milvus at {settings.MILVUS_HOST}:{settings.MILVUS_PORT}")
+            logger.info("Connected to Milvus at %s:%s", settings.MILVUS_HOST, settings.MILVUS_PORT)
             
             # 检查集合是否存在，不存在则创建
             self._ensure_collection()
             
         except Exception as e:
-            logger.error(f"Failed to connect to Milvus: {str(e)}", exc_info=True)
+            logger.error("Failed to connect to Milvus: %s", e, exc_info=settings.DEBUG)
             raise
     
     def _ensure_collection(self):
@@ -56,11 +69,12 @@ class VectorService:
             # 创建集合
             collection = Collection(name=collection_name, schema=schema)
             
-            # 创建向量索引
+            # 创建向量索引：图中的向量按int8标量量化（SQ8）存储，遍历时的内存带宽约为float32的1/4；
+            # 同时保留float32原始向量，对候选结果按原始精度重新打分，弥补量化误差
             vector_index_params = {
-                "index_type": "HNSW",
+                "index_type": "HNSW_SQ",
                 "metric_type": "COSINE",
-                "params": {"M": 16, "efConstruction": 200}
+                "params": {"M": 16, "efConstruction": 200, "sq_type": "SQ8", "refine": True, "refine_type": "FP32"}
             }
             collection.create_index(field_name="vector", index_params=vector_index_params)
             
@@ -76,9 +90,9 @@ class VectorService:
             }
             collection.create_index(field_name="content", index_params=fulltext_index_params)
             
-            logger.info(f"Created Milvus collection: {collection_name}")
+            logger.info("Created Milvus collection: %s", collection_name)
         else:
-            logger.info(f"Milvus collection {collection_name} already exists")
+            logger.info("Milvus collection %s already exists", collection_name)
     
     async def encode_text(self, text: str) -> List[float]:
         """将文本编码为向量"""
@@ -96,40 +110,58 @@ class VectorService:
             
             return vector.tolist()
         except Exception as e:
-            logger.error(f"Text encoding error: {str(e)}", exc_info=True)
+            logger.error("Text encoding error: %s", e, exc_info=settings.DEBUG)
             raise
     
-    async def encode_batch(self, texts: List[str]) -> np.ndarray:
-        """批量将文本编码为向量"""
+    async def encode_batch(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """批量将文本编码为向量
+        
+        按batch_size分批调用模型（每批一次前向计算），返回形状为(len(texts), VECTOR_DIM)的连续float32矩阵
+        """
         try:
-            # 为每个文本生成向量
-            vectors = []
-            for text in texts:
-                vector = await self.encode_text(text)
-                vectors.append(vector)
+            vectors = np.empty((len(texts), settings.VECTOR_DIM), dtype=np.float32)
+            for start in range(0, len(texts), batch_size):
+                end = min(start + batch_size, len(texts))
+                
+                # 这里应该使用实际的文本嵌入模型对texts[start:end]整批编码
+                # 为了演示，我们使用随机向量；模拟每批一次的异步操作
+                await asyncio.sleep(0.01)
+                
+                # 生成随机向量并按行归一化
+                batch = np.random.random((end - start, settings.VECTOR_DIM)).astype(np.float32)
+                vectors[start:end] = batch / np.linalg.norm(batch, axis=1, keepdims=True)
             
-            return np.array(vectors)
+            return vectors
         except Exception as e:
-            logger.error(f"Batch encoding error: {str(e)}", exc_info=True)
+            logger.error("Batch encoding error: %s", e, exc_info=settings.DEBUG)
             raise
     
+    async def _get_collection(self) -> Collection:
+        """获取已加载到内存的集合
+        
+        首次检索时加载一次并在进程内复用，之后的检索不再重复load；集合由各检索和各工作进程共享，不主动释放
+        """
+        if self._collection is None:
+            collection = Collection(settings.MILVUS_COLLECTION)
+            await asyncio.to_thread(collection.load)
+            self._collection = collection
+        return self._collection
+    
     async def search(self, query_vector: List[float], knowledge_base_ids: List[str], limit: int = 10, min_score: float = 0.7) -> List[Dict[str, Any]]:
         """在向量数据库中搜索相似向量"""
         try:
-            collection = Collection(settings.MILVUS_COLLECTION)
-            collection.load()
+            collection = await self._get_collection()
             
             # 构建查询条件
-            search_params = {"metric_type": "COSINE", "params": {"ef": 100}}
+            # refine_k：量化索引先召回limit的4倍候选，再用float32向量重排取前limit个
+            search_params = {"metric_type": "COSINE", "params": {"ef": 100, "refine_k": 4}}
             
             # 如果指定了知识库ID，添加过滤条件
-            expr = None
-            if knowledge_base_ids:
-                kb_conditions = [f'knowledge_base_id == "{kb_id}"' for kb_id in knowledge_base_ids]
-                expr = " || ".join(kb_conditions)
+            expr = build_kb_filter_expr(tuple(sorted(knowledge_base_ids))) if knowledge_base_ids else None
             
-            # 执行向量搜索
-            results = collection.search(
+            # 执行向量搜索（同步调用放到线程中执行，不阻塞事件循环）
+            results = await asyncio.to_thread(
+                collection.search,
                 data=[query_vector],
                 anns_field="vector",
                 param=search_params,
@@ -166,12 +198,11 @@ class VectorService:
                     
                     search_results.append(result)
             
-            # 释放集合
-            collection.release()
+            # 集合在多个并行检索间共享，不在单次检索结束时释放
             
             return search_results
         except Exception as e:
-            logger.error(f"Vector search error: {str(e)}", exc_info=True)
+            logger.error("Vector search error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def insert(self, vectors: List[Dict[str, Any]]) -> List[str]:
@@ -206,7 +237,7 @@ class VectorService:
             
             return ids
         except Exception as e:
-            logger.error(f"Vector insert error: {str(e)}", exc_info=True)
+            logger.error("Vector insert error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def delete_by_document(self, document_id: str) -> int:
@@ -223,7 +254,7 @@ class VectorService:
             
             return 1  # 成功删除
         except Exception as e:
-            logger.error(f"Vector delete error: {str(e)}", exc_info=True)
+            logger.error("Vector delete error: %s", e, exc_info=settings.DEBUG)
             raise
     
     async def delete_by_knowledge_base(self, knowledge_base_id: str) -> int:
@@ -240,5 +271,5 @@ class VectorService:
             
             return 1  # 成功删除
         except Exception as e:
-            logger.error(f"Vector delete error: {str(e)}", exc_info=True)
+            logger.error("Vector delete error: %s", e, exc_info=settings.DEBUG)
             raise
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""反馈服务测试（在backend目录下运行：python -m pytest tests）"""
+import unittest
+from unittest import mock
+
+from services.analytics_service import AnalyticsService
+from services.cache_service import CacheService
+from services.feedback_service import FeedbackService
+
+class FeedbackServiceTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # 数据库连接失败，分析服务和反馈服务都使用内存存储
+        with mock.patch("services.analytics_service.ThreadedConnectionPool", side_effect=Exception("no database")):
+            self.analytics_service = AnalyticsService()
+        self.feedback_service = FeedbackService(analytics_service=self.analytics_service, cache_service=CacheService())
+
+    async def test_save_feedback(self):
+        feedback = await self.feedback_service.save_feedback(result_id="result-1", feedback_type="like", user_id="user-1")
+
+        self.assertEqual(feedback.result_id, "result-1")
+        self.assertEqual(await self.feedback_service.get_feedback("result-1"), [feedback])
+
+        # 没有搜索ID时不记录反馈分析日志
+        self.assertEqual(self.analytics_service.feedback_logs, [])
+
+    async def test_save_feedback_with_search_id(self):
+        await self.feedback_service.save_feedback(result_id="result-1", feedback_type="like", user_id="user-1", search_id="search-1")
+
+        # 反馈同时记录到分析日志，关联到搜索日志
+        self.assertEqual(len(self.analytics_service.feedback_logs), 1)
+        log = self.analytics_service.feedback_logs[0]
+        self.assertEqual(log["search_id"], "search-1")
+        self.assertEqual(log["user_id"], "user-1")
+        self.assertEqual(log["feedback_type"], "like")
+
+    async def test_save_detailed_feedback(self):
+        feedback = await self.feedback_service.save_detailed_feedback(
+            result_id="result-1", rating=4.0, feedback_type="relevant", comment="有帮助", user_id="user-1", search_id="search-1"
+        )
+
+        self.assertEqual(await self.feedback_service.get_feedback("result-1"), [feedback])
+
+        log = self.analytics_service.feedback_logs[0]
+        self.assertEqual(log["search_id"], "search-1")
+        self.assertEqual(log["rating"], 4.0)
+        self.assertEqual(log["comment"], "有帮助")
+
+        stats = await self.feedback_service.get_feedback_stats("result-1")
+        self.assertEqual(stats["total"], 1)
+        self.assertEqual(stats["positive"], 1)
+        self.assertEqual(stats["avg_rating"], 4.0)
+
+if __name__ == "__main__":
+    unittest.main()
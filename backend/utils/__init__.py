@@ -1,4 +1,4 @@
 # Utils package
 # 包含各种工具函数和辅助模块
 
-from .logger import setup_logger
\ No newline at end of file
+from .logger import setup_logger, stop_logger
\ No newline at end of file
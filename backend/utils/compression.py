@@ -0,0 +1,26 @@
+import zstandard as zstd
+
+# 写入Redis的缓存值以1字节标记开头：b"Z"为zstd压缩数据，b"R"为未压缩的原始数据；
+# 较小的值压缩收益不明显，直接原样保存
+COMPRESS_MIN_SIZE = 1024
+_ZSTD = b"Z"
+_RAW = b"R"
+
+# 压缩器和解压器只在事件循环线程中使用，全局复用，每次调用只需一次C调用
+_compressor = zstd.ZstdCompressor(level=3)
+_decompressor = zstd.ZstdDecompressor()
+
+def compress_value(data: bytes) -> bytes:
+    """压缩待写入缓存的字节（超过COMPRESS_MIN_SIZE时使用zstd压缩）"""
+    if len(data) > COMPRESS_MIN_SIZE:
+        return _ZSTD + _compressor.compress(data)
+    return _RAW + data
+
+def decompress_value(data: bytes) -> bytes:
+    """还原compress_value写入的字节；没有标记的值（启用压缩前写入的JSON）原样返回"""
+    marker = data[:1]
+    if marker == _ZSTD:
+        return _decompressor.decompress(data[1:])
+    if marker == _RAW:
+        return data[1:]
+    return data
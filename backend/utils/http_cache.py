@@ -0,0 +1,62 @@
+import hashlib
+from typing import Any, Optional
+
+import msgspec
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+# 常用的Cache-Control取值
+CACHE_CONSTANT = "public, max-age=86400"   # 常量数据（反馈类型、检索策略）
+CACHE_ANALYTICS = "private, max-age=300"   # 分析数据（含用户ID和查询内容，不允许共享缓存存储），与服务端Redis缓存时间一致
+CACHE_REVALIDATE = "no-cache"              # 可修改的数据，每次都需用ETag重新验证
+
+# datetime、UUID、dataclass由orjson原生处理，numpy标量/数组（如重排序得分）也直接序列化；
+# 时间只精确到秒，缩短响应体
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_OMIT_MICROSECONDS
+
+def _default(obj: Any) -> Any:
+    """orjson无法原生序列化的类型"""
+    if isinstance(obj, BaseModel):
+        # 模型的__dict__只包含字段值，嵌套模型由orjson继续回调本函数，
+        # 避免model_dump递归复制整个对象树；值为None的可选字段不输出
+        return {key: value for key, value in obj.__dict__.items() if value is not None}
+    if isinstance(obj, msgspec.Struct):
+        return {key: value for key, value in msgspec.structs.asdict(obj).items() if value is not None}
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dump_json(content: Any) -> bytes:
+    """将内容（包括Pydantic模型及其列表）序列化为JSON字节"""
+    return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+
+class ORJSONModelResponse(Response):
+    """直接用orjson序列化内容的JSON响应
+
+    路由直接返回该响应时FastAPI不再执行jsonable_encoder和response_model校验，
+    response_model仅用于生成OpenAPI文档
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+def make_etag(body: bytes) -> str:
+    """根据响应体内容生成强ETag"""
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+def cached_json_response(request: Request, body: bytes, cache_control: str, etag: Optional[str] = None) -> Response:
+    """构建带Cache-Control和ETag的JSON响应
+
+    客户端携带的If-None-Match与ETag一致时返回空body的304响应
+    """
+    if etag is None:
+        etag = make_etag(body)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in candidates or etag in candidates or f"W/{etag}" in candidates:
+            return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
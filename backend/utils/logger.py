@@ -1,8 +1,12 @@
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
-def setup_logger(name=None, level=logging.INFO, log_file=None, max_size=10*1024*1024, backup_count=5):
+# 各日志记录器对应的后台写日志监听器
+_listeners = {}
+
+def setup_logger(name=None, level=logging.INFO, log_file=None, max_size=10*1024*1024, backup_count=5, use_queue=True):
     """
     配置并返回一个日志记录器
     
@@ -12,6 +16,8 @@ def setup_logger(name=None, level=logging.INFO, log_file=None, max_size=10*1024*
         log_file (str): 日志文件路径，默认为None（仅控制台输出）
         max_size (int): 日志文件最大大小（字节），默认为10MB
         backup_count (int): 保留的日志文件数量，默认为5
+        use_queue (bool): 是否通过队列由后台线程写日志，默认为True。
+            开启后记录日志的线程只负责入队，控制台和文件写入不会阻塞事件循环
         
     返回:
         logging.Logger: 配置好的日志记录器
@@ -23,6 +29,8 @@ def setup_logger(name=None, level=logging.INFO, log_file=None, max_size=10*1024*
     # 清除已有的处理器
     if logger.handlers:
         logger.handlers.clear()
+    stop_logger(name)
+    handlers = []
     
     # 创建格式化器
     formatter = logging.Formatter(
@@ -33,7 +41,7 @@ def setup_logger(name=None, level=logging.INFO, log_file=None, max_size=10*1024*
     # 创建控制台处理器
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
     
     # 如果指定了日志文件，创建文件处理器
     if log_file:
@@ -50,6 +58,23 @@ def setup_logger(name=None, level=logging.INFO, log_file=None, max_size=10*1024*
             encoding='utf-8'
         )
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+    
+    if use_queue:
+        # 处理器挂到后台监听线程上，日志记录器只保留一个入队的QueueHandler
+        log_queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners[name] = listener
+        logger.addHandler(QueueHandler(log_queue))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
     
-    return logger
\ No newline at end of file
+    return logger
+
+def stop_logger(name=None):
+    """停止日志记录器的后台监听线程，并写出队列中剩余的日志"""
+    listener = _listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
\ No newline at end of file
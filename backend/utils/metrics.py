@@ -2,6 +2,8 @@ import logging
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 
+from config import settings
+
 logger = logging.getLogger("metrics")
 
 def record_search_metrics(
@@ -28,6 +30,9 @@ def record_search_metrics(
     try:
         # 这里可以实现将指标记录到数据库、日志或监控系统
         # 例如记录到日志
+        # 日志级别高于INFO时指标不会输出，不再构建日志数据
+        if not logger.isEnabledFor(logging.INFO):
+            return
         log_data = {
             "timestamp": datetime.now().isoformat(),
             "event_type": "search",
@@ -40,12 +45,12 @@ def record_search_metrics(
             "user_id": user_id
         }
         
-        logger.info(f"Search metrics: {log_data}")
+        logger.info("Search metrics: %s", log_data)
         
         # TODO: 实现将指标发送到监控系统或存储到数据库
         
     except Exception as e:
-        logger.error(f"Failed to record search metrics: {str(e)}", exc_info=True)
+        logger.error("Failed to record search metrics: %s", e, exc_info=settings.DEBUG)
 
 def record_feedback_metrics(
     result_id: str,
@@ -64,6 +69,9 @@ def record_feedback_metrics(
     """
     try:
         # 这里可以实现将反馈指标记录到数据库、日志或监控系统
+        # 日志级别高于INFO时指标不会输出，不再构建日志数据
+        if not logger.isEnabledFor(logging.INFO):
+            return
         log_data = {
             "timestamp": datetime.now().isoformat(),
             "event_type": "feedback",
@@ -73,9 +81,9 @@ def record_feedback_metrics(
             "details": details
         }
         
-        logger.info(f"Feedback metrics: {log_data}")
+        logger.info("Feedback metrics: %s", log_data)
         
         # TODO: 实现将指标发送到监控系统或存储到数据库
         
     except Exception as e:
-        logger.error(f"Failed to record feedback metrics: {str(e)}", exc_info=True)
\ No newline at end of file
+        logger.error("Failed to record feedback metrics: %s", e, exc_info=settings.DEBUG)
\ No newline at end of file
@@ -73,32 +73,16 @@ const AnalyticsPage = () => {
   const loadAnalyticsData = () => {
     setIsLoading(true);
     
-    // 获取性能指标
-    analyticsAPI.getPerformanceMetrics(timeRange, knowledgeBase !== 'all' ? knowledgeBase : null)
+    // 一次请求获取性能指标、搜索趋势和用户行为数据
+    analyticsAPI.getDashboard(timeRange, knowledgeBase !== 'all' ? knowledgeBase : null)
       .then(response => {
-        setPerformanceData(response.data);
-      })
-      .catch(error => {
-        console.error('获取性能指标失败:', error);
-      });
-      
-    // 获取搜索趋势
-    analyticsAPI.getSearchTrends(timeRange, knowledgeBase !== 'all' ? knowledgeBase : null)
-      .then(response => {
-        setSearchTrends(response.data);
-      })
-      .catch(error => {
-        console.error('获取搜索趋势失败:', error);
-      });
-      
-    // 获取用户行为数据
-    analyticsAPI.getUserBehavior(timeRange, knowledgeBase !== 'all' ? knowledgeBase : null)
-      .then(response => {
-        setUserBehaviorData(response.data);
+        setPerformanceData(response.data.performance);
+        setSearchTrends(response.data.search_trends);
+        setUserBehaviorData(response.data.user_behavior);
         setIsLoading(false);
       })
       .catch(error => {
-        console.error('获取用户行为数据失败:', error);
+        console.error('获取分析数据失败:', error);
         setIsLoading(false);
       });
   };
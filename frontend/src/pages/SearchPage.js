@@ -90,8 +90,8 @@ const SearchPage = () => {
   const [showFeedbackPanel, setShowFeedbackPanel] = useState(false);
   const [currentFeedback, setCurrentFeedback] = useState(null);
   const [searchParams, setSearchParams] = useState({
-    semanticWeight: 0.7,
-    fulltextWeight: 0.3,
+    semanticWeight: 0.9,
+    fulltextWeight: 0.1,
     useReranking: true,
     useClustering: true,
   });
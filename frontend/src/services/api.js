@@ -49,6 +49,12 @@ export const knowledgeBaseAPI = {
 
 // 分析API
 export const analyticsAPI = {
+  // 获取仪表盘聚合数据（一次请求获取全部指标）
+  getDashboard: (timeRange, knowledgeBaseId) => {
+    const params = { time_range: timeRange };
+    if (knowledgeBaseId) params.knowledge_base_id = knowledgeBaseId;
+    return api.get('/analytics/dashboard', { params });
+  },
   // 获取性能指标
   getPerformanceMetrics: (timeRange, knowledgeBaseId) => {
     const params = { time_range: timeRange };